@@ -0,0 +1,193 @@
+'''
+    headless recognition over recorded images and videos. every input file
+    is handled by one process of a pool, and every plate found is written
+    to a JSONL file as soon as it is read:
+
+        python batch_recognize.py footage/ "snapshots/*.jpg" -o plates.jsonl
+'''
+from multiprocessing import Pool, Queue
+import glob
+import json
+import os
+import sys
+import time
+import argparse
+import cv2
+
+import detect_characters as DetectCharacters
+import detect_plates as DetectPlates
+import detector as Detector
+import plate_system as PlateSystem
+
+# define constant
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".m4v")
+
+# define global varialbles, set up once in every worker
+detector = None
+record_queue = None
+init_error = None
+
+
+def find_input_files(list_of_inputs):
+    # expand directories and glob patterns into image and video files, in a stable order
+    list_of_files = []
+
+    for path in list_of_inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                list_of_files.extend(os.path.join(root, name) for name in sorted(files))
+        else:
+            list_of_files.extend(sorted(glob.glob(path)) or [path])
+
+    return [path for path in list_of_files
+            if path.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)]
+# end function
+
+
+def init_worker(backend, options, classifier, queue):
+    # a failure is kept and reported for every file, an exception here would make the pool restart workers forever
+    global detector
+    global record_queue
+    global init_error
+
+    record_queue = queue
+
+    try:
+        detector = Detector.create_detector(backend, options)
+
+        if DetectCharacters.load_data_and_train(classifier) == False:
+            init_error = "training of the %s classifier was not successful" % classifier
+    except Exception as e:
+        init_error = "loading the %s detector failed: %r" % (backend, e)
+# end function
+
+
+def read_file_frames(path, frame_step):
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield 0, frame
+        return
+
+    capture = cv2.VideoCapture(path)
+    frame_index = 0
+
+    while capture.isOpened():
+        if frame_index % frame_step != 0:
+            if not capture.grab():                                      # skip without decoding
+                break
+        else:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield frame_index, frame
+        frame_index += 1
+
+    capture.release()
+# end function
+
+
+def recognize_file(path, frame_step):
+    # runs in a worker: send one record per detected plate, then a final None for the file
+    number_of_records = 0
+
+    try:
+        if init_error is not None:
+            raise RuntimeError("worker initialization failed: " + init_error)
+
+        for frame_index, frame in read_file_frames(path, frame_step):
+            start = time.perf_counter()
+            results = detector.predict(frame)
+            detect_time = time.perf_counter() - start
+
+            for result in results:
+                if result['confidence'] <= PlateSystem.CONFIDENCE_RATE:
+                    continue
+
+                resized_crop = PlateSystem.crop_plate(frame, result)
+                if resized_crop is None:
+                    continue
+
+                start = time.perf_counter()
+                list_of_possible_plates = DetectPlates.detect_plates_in_image(resized_crop)
+                plates_time = time.perf_counter() - start
+
+                list_of_possible_plates = DetectCharacters.detect_chars_in_plates(list_of_possible_plates)
+                chars_time = time.perf_counter() - start - plates_time
+
+                plate = PlateSystem.read_plate_number(list_of_possible_plates, resized_crop)
+
+                record_queue.put({
+                    "file": path,
+                    "frame": frame_index,
+                    "box": {"topleft": result['topleft'], "bottomright": result['bottomright']},
+                    "confidence": float(result['confidence']),
+                    "plate": plate[0] if plate != False else None,
+                    "timings": {
+                        "detect_ms": 1000 * detect_time,
+                        "plates_ms": 1000 * plates_time,
+                        "chars_ms": 1000 * chars_time
+                    }
+                })
+                number_of_records += 1
+    except Exception as e:
+        record_queue.put({"file": path, "error": repr(e)})
+    finally:
+        record_queue.put(None)
+
+    return number_of_records
+# end function
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description = "recognize plates in image and video files without a display")
+    ap.add_argument("inputs", nargs = "+", help = "files, directories or glob patterns")
+    ap.add_argument("-o", "--output", default = "-", help = "JSONL file to write, - for stdout")
+    ap.add_argument("--append", action = "store_true", help = "append to the output file instead of replacing it")
+    ap.add_argument("-w", "--workers", type = int, default = os.cpu_count())
+    ap.add_argument("--classifier", choices = DetectCharacters.CLASSIFIERS, default = "knn")
+    ap.add_argument("--detector", choices = Detector.BACKENDS, default = "darkflow")
+    ap.add_argument("--weights", default = Detector.DEFAULT_WEIGHTS, help = "darknet weights for --detector opencv")
+    ap.add_argument("--frame-step", type = int, default = 1, help = "only read every n-th video frame")
+    args = vars(ap.parse_args())
+
+    list_of_files = find_input_files(args["inputs"])
+    if len(list_of_files) == 0:
+        sys.exit("error: no image or video files found")
+
+    queue = Queue()
+    detector_options = dict(PlateSystem.options, weights = args["weights"])
+    pool = Pool(args["workers"], initializer = init_worker,
+                initargs = (args["detector"], detector_options, args["classifier"], queue))
+
+    for path in list_of_files:
+        pool.apply_async(recognize_file, (path, max(args["frame_step"], 1)))
+    pool.close()
+
+    output = sys.stdout if args["output"] == "-" else open(args["output"], "a" if args["append"] else "w")
+
+    # stream records out as the workers produce them, until every file is done
+    files_remaining = len(list_of_files)
+    list_of_errors = []
+    while files_remaining > 0:
+        record = queue.get()                                            # every file ends in None, failed ones too
+        if record is None:
+            files_remaining -= 1
+            continue
+
+        if "error" in record:
+            list_of_errors.append("%s: %s" % (record["file"], record["error"]))
+
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    pool.join()
+    if output is not sys.stdout:
+        output.close()
+
+    if len(list_of_errors) > 0:
+        for error in list_of_errors:
+            print("error: " + error, file = sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,231 @@
+'''
+    per-stage microbenchmarks of the OCR path on synthetic plates, no YOLO
+    weights needed:
+
+        python benchmark.py --samples 50 --skew 5 --noise 6 --distractors 20 -o bench.json
+        python benchmark.py ... --compare bench.json
+'''
+import json
+import platform
+import subprocess
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+import preprocess as Preprocess
+import detect_characters as DetectCharacters
+import detect_plates as DetectPlates
+import synthetic_plates as SyntheticPlates
+
+# define constant
+PERCENTILES = (50, 90, 99)
+RESULT_FORMAT_VERSION = 1
+
+
+def prepare_stage_inputs(list_of_images):
+    '''
+        run the OCR path once over every image and keep what each stage was
+        called with, so each stage can then be timed on its own
+    '''
+    stage_inputs = {
+        "resize_to_height": [],
+        "preprocess": [],
+        "find_possible_characters_in_image": [],
+        "find_list_of_groups_of_matching_chars": [],
+        "extract_plate": [],
+        "remove_inner_overlapping_chars": [],
+        "recognize_chars_in_plate": [],
+        "ocr_total": []
+    }
+
+    for image in list_of_images:
+        stage_inputs["resize_to_height"].append((image, DetectPlates.PLATE_HEIGHT))
+        stage_inputs["ocr_total"].append((image,))
+
+        # same normalization as detect_plates_in_image
+        image, scale = Preprocess.resize_to_height(image, DetectPlates.PLATE_HEIGHT)
+        stage_inputs["preprocess"].append((image,))
+
+        img_grayscale, img_threshold = Preprocess.preprocess(image)
+        stage_inputs["find_possible_characters_in_image"].append((img_threshold,))
+
+        list_of_possible_characters = DetectPlates.find_possible_characters_in_image(img_threshold)
+        stage_inputs["find_list_of_groups_of_matching_chars"].append((list_of_possible_characters,))
+
+        for group_of_matching_chars in DetectCharacters.find_list_of_groups_of_matching_chars(list_of_possible_characters):
+            stage_inputs["extract_plate"].append((image, list(group_of_matching_chars)))
+
+            possible_plate = DetectPlates.extract_plate(image, group_of_matching_chars)
+            if possible_plate.img_plate is None:
+                continue
+
+            # same plate preparation as detect_chars_in_plates
+            DetectCharacters.detect_chars_in_plates([possible_plate])
+            list_of_possible_chars_in_plate = DetectCharacters.find_possible_chars_in_plate(
+                possible_plate.img_grayscale, possible_plate.img_thresh)
+
+            for list_of_matching_chars in DetectCharacters.find_list_of_groups_of_matching_chars(list_of_possible_chars_in_plate):
+                list_of_matching_chars.sort(key = lambda matching_char: matching_char.centerX)
+                stage_inputs["remove_inner_overlapping_chars"].append((list_of_matching_chars,))
+
+                list_of_matching_chars = DetectCharacters.remove_inner_overlapping_chars(list_of_matching_chars)
+                stage_inputs["recognize_chars_in_plate"].append((possible_plate.img_thresh, list_of_matching_chars))
+
+    return stage_inputs
+# end function
+
+
+def run_ocr(image):
+    return DetectCharacters.detect_chars_in_plates(DetectPlates.detect_plates_in_image(image))
+
+
+STAGES = {
+    "resize_to_height": Preprocess.resize_to_height,
+    "preprocess": Preprocess.preprocess,
+    "find_possible_characters_in_image": DetectPlates.find_possible_characters_in_image,
+    "find_list_of_groups_of_matching_chars": DetectCharacters.find_list_of_groups_of_matching_chars,
+    "extract_plate": DetectPlates.extract_plate,
+    "remove_inner_overlapping_chars": DetectCharacters.remove_inner_overlapping_chars,
+    "recognize_chars_in_plate": DetectCharacters.recognize_chars_in_plate,
+    "ocr_total": run_ocr
+}
+
+
+def time_stage(func, list_of_args, repeat):
+    # latency of every call, in seconds
+    npaLatencies = np.empty(len(list_of_args) * repeat, dtype = np.float64)
+
+    i = 0
+    for r in range(repeat):
+        for args in list_of_args:
+            start = time.perf_counter()
+            func(*args)
+            npaLatencies[i] = time.perf_counter() - start
+            i += 1
+
+    return npaLatencies
+# end function
+
+
+def summarize(npaLatencies):
+    if len(npaLatencies) == 0:
+        return {"calls": 0}
+
+    mean = float(np.mean(npaLatencies))
+    summary = {
+        "calls": int(len(npaLatencies)),
+        "ops_per_sec": 1.0 / mean if mean > 0 else 0.0,
+        "mean_ms": 1000 * mean,
+        "min_ms": 1000 * float(np.min(npaLatencies))
+    }
+    for percentile in PERCENTILES:
+        summary["p%d_ms" % percentile] = 1000 * float(np.percentile(npaLatencies, percentile))
+
+    return summary
+# end function
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+# end function
+
+
+def run_benchmark(params):
+    list_of_images = [image for plate_number, image in SyntheticPlates.generate_plates(
+        params["samples"], params["height"], params["skew"], params["noise"], params["distractors"], params["seed"])]
+
+    stage_inputs = prepare_stage_inputs(list_of_images)
+
+    stages = {}
+    for name, func in STAGES.items():
+        if params["stages"] and name not in params["stages"]:
+            continue
+
+        time_stage(func, stage_inputs[name][:params["warmup"]], 1)
+        stages[name] = summarize(time_stage(func, stage_inputs[name], params["repeat"]))
+
+    return {
+        "version": RESULT_FORMAT_VERSION,
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "params": params,
+        "stages": stages
+    }
+# end function
+
+
+def print_report(report, baseline = None, max_regression = None):
+    # print one row per stage; return the names of stages slower than the baseline allows
+    regressions = []
+
+    print("%-40s %8s %10s %9s %9s %9s" % ("stage", "calls", "ops/sec", "p50 ms", "p90 ms", "p99 ms"))
+    for name, summary in report["stages"].items():
+        if summary["calls"] == 0:
+            print("%-40s %8d" % (name, 0))
+            continue
+
+        line = "%-40s %8d %10.1f %9.3f %9.3f %9.3f" % (
+            name, summary["calls"], summary["ops_per_sec"], summary["p50_ms"], summary["p90_ms"], summary["p99_ms"])
+
+        base_summary = baseline["stages"].get(name) if baseline is not None else None
+        if base_summary and base_summary.get("calls", 0) > 0:
+            ratio = summary["p50_ms"] / base_summary["p50_ms"] if base_summary["p50_ms"] > 0 else float("inf")
+            line += "   p50 x%.2f vs baseline" % ratio
+            if max_regression is not None and ratio > max_regression:
+                line += "  REGRESSION"
+                regressions.append(name)
+
+        print(line)
+
+    return regressions
+# end function
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description = "time each OCR stage on synthetic plates")
+    ap.add_argument("--samples", type = int, default = 30, help = "number of synthetic plates")
+    ap.add_argument("--height", type = int, default = 260, help = "plate height in pixels")
+    ap.add_argument("--skew", type = float, default = 0.0, help = "maximum rotation in degrees")
+    ap.add_argument("--noise", type = float, default = 0.0, help = "gaussian noise standard deviation")
+    ap.add_argument("--distractors", type = int, default = 0, help = "non-character shapes per plate")
+    ap.add_argument("--seed", type = int, default = 0)
+    ap.add_argument("--repeat", type = int, default = 10, help = "times every stage input is timed")
+    ap.add_argument("--warmup", type = int, default = 5, help = "untimed calls per stage")
+    ap.add_argument("--classifier", choices = DetectCharacters.CLASSIFIERS, default = "knn")
+    ap.add_argument("--stage", action = "append", dest = "stages", help = "only time this stage, can be repeated")
+    ap.add_argument("-o", "--output", help = "write the results to this JSON file")
+    ap.add_argument("--compare", help = "JSON results of an earlier run to compare against")
+    ap.add_argument("--max-regression", type = float, default = None,
+                    help = "exit with an error if a stage's p50 grows by more than this factor")
+    args = vars(ap.parse_args())
+
+    if DetectCharacters.load_data_and_train(args["classifier"]) == False:
+        sys.exit("error: Traning was not successful")
+
+    params = {key: args[key] for key in ("samples", "height", "skew", "noise", "distractors", "seed", "repeat", "warmup", "stages", "classifier")}
+    report = run_benchmark(params)
+
+    baseline = None
+    if args["compare"]:
+        with open(args["compare"]) as f:
+            baseline = json.load(f)
+        base_params = baseline.get("params", {})
+        if any(base_params.get(key) != params[key] for key in ("samples", "height", "skew", "noise", "distractors", "seed")):
+            print("warning: baseline was run on different synthetic plates\n")
+
+    regressions = print_report(report, baseline, args["max_regression"])
+
+    if args["output"]:
+        with open(args["output"], "w") as f:
+            json.dump(report, f, indent = 2)
+
+    if regressions:
+        sys.exit("error: %d stage(s) regressed: %s" % (len(regressions), ", ".join(regressions)))
@@ -1,4 +1,7 @@
 import os
+import json
+import hashlib
+import argparse
 import cv2
 import numpy as np
 import math
@@ -6,17 +9,24 @@ import random
 
 import preprocess as Preprocess
 import possible_character as PossibleCharacter
+import metrics as Metrics
+import hamming_classifier as HammingClassifier
 
 # define constant
 kNearest = cv2.ml.KNearest_create()
 
-MIN_PIXEL_WIDTH = 5
-MIN_PIXEL_HEIGHT = 40
+CLASSIFIERS = ("knn", "hamming")        # float L2 KNN, or bit-packed glyphs matched by hamming distance
+
+PLATE_ROW_HEIGHT = 80                   # every possible plate (one row of chars) is warped to this height
+
+# char size limits in a row of PLATE_ROW_HEIGHT, scaled for images of another size
+MIN_PIXEL_WIDTH = 4
+MIN_PIXEL_HEIGHT = 30
 
 MIN_ASPECT_RATIO = 0.25
 MAX_ASPECT_RATIO = 1.0
 
-MIN_PIXEL_AREA = 120
+MIN_PIXEL_AREA = 69
 
 # constants for comparing two chars
 MIN_DIAG_SIZE_MULTIPLE_AWAY = 0.3
@@ -37,56 +47,178 @@ RESIZED_CHAR_IMAGE_HEIGHT = 30
 
 MIN_CONTOUR_AREA = 100
 
+# training data files and their compiled, memory-mappable form
+CLASSIFICATIONS_FILE = "classifications.txt"
+FLATTENED_IMAGES_FILE = "flattened_images.txt"
+
+COMPILED_MODEL_DIR = "knn_model"
+COMPILED_MODEL_VERSION = 1
+COMPILED_MODEL_MANIFEST = "manifest.json"
+COMPILED_CLASSIFICATIONS_FILE = "classifications.npy"
+COMPILED_FLATTENED_IMAGES_FILE = "flattened_images.npy"
+
+
+def load_data_and_train(classifier = "knn"):
+    global kNearest
+
+    if classifier not in CLASSIFIERS:
+        print("error, unknown classifier %s, expected one of %s\n" % (classifier, ", ".join(CLASSIFIERS)))
+        return False
+
+    training_data = load_compiled_training_data()                                       # prefer the compiled model
+
+    if training_data is None:
+        training_data = compile_training_data()                                         # missing or stale, rebuild it
+
+    if training_data is None:
+        return False
+
+    npaClassifications, npaFlattenedImages = training_data
 
-def load_data_and_train():
+    if classifier == "hamming":
+        kNearest = HammingClassifier.HammingNearest()
+    else:
+        kNearest = cv2.ml.KNearest_create()
+
+    kNearest.setDefaultK(1)
+
+    kNearest.train(npaFlattenedImages, cv2.ml.ROW_SAMPLE, npaClassifications)           # train KNN object
+
+    return True
+# end function
+
+
+def load_training_text_files():
     try:
-        npaClassifications = np.loadtxt("classifications.txt", np.float32)                  # read in training classifications
+        npaClassifications = np.loadtxt(CLASSIFICATIONS_FILE, np.float32)                  # read in training classifications
     except:
         print("error, unable to open classifications.txt, exiting program\n")
         os.system("pause")
-        return False
+        return None
     # end try
 
     try:
-        npaFlattenedImages = np.loadtxt("flattened_images.txt", np.float32)                 # read in training images
+        npaFlattenedImages = np.loadtxt(FLATTENED_IMAGES_FILE, np.float32)                 # read in training images
     except:
         print("error, unable to open flattened_images.txt, exiting program\n")
         os.system("pause")
-        return False
+        return None
     # end try
 
     npaClassifications = npaClassifications.reshape((npaClassifications.size, 1))
 
-    kNearest.setDefaultK(1)                                                            
+    return npaClassifications, npaFlattenedImages
+# end function
 
-    kNearest.train(npaFlattenedImages, cv2.ml.ROW_SAMPLE, npaClassifications)           # train KNN object
 
-    return True
+def checksum_training_text_files():
+    checksums = {}
+
+    for file_name in (CLASSIFICATIONS_FILE, FLATTENED_IMAGES_FILE):
+        sha1 = hashlib.sha1()
+        with open(file_name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+        checksums[file_name] = sha1.hexdigest()
+
+    return checksums
+# end function
+
+
+def load_compiled_training_data():
+    '''
+        return the memory-mapped training arrays from COMPILED_MODEL_DIR,
+        or None if the compiled model is missing, from another format
+        version, or was built from different text files
+    '''
+    try:
+        with open(os.path.join(COMPILED_MODEL_DIR, COMPILED_MODEL_MANIFEST)) as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") != COMPILED_MODEL_VERSION:
+            return None
+
+        if manifest.get("checksums") != checksum_training_text_files():
+            return None
+
+        npaClassifications = np.load(os.path.join(COMPILED_MODEL_DIR, COMPILED_CLASSIFICATIONS_FILE), mmap_mode="r")
+        npaFlattenedImages = np.load(os.path.join(COMPILED_MODEL_DIR, COMPILED_FLATTENED_IMAGES_FILE), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    # end try
+
+    if npaClassifications.shape[0] != npaFlattenedImages.shape[0]:
+        return None
+
+    return npaClassifications, npaFlattenedImages
+# end function
+
+
+def compile_training_data():
+    '''
+        parse the text training files once and save them as .npy arrays
+        next to a manifest holding the format version and the checksums
+        of the text files they were built from
+    '''
+    training_data = load_training_text_files()
+
+    if training_data is None:
+        return None
+
+    npaClassifications, npaFlattenedImages = training_data
+
+    try:
+        os.makedirs(COMPILED_MODEL_DIR, exist_ok = True)
+
+        manifest_path = os.path.join(COMPILED_MODEL_DIR, COMPILED_MODEL_MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)                                                    # invalidate before rewriting arrays
+
+        for file_name, npa in ((COMPILED_CLASSIFICATIONS_FILE, npaClassifications),
+                               (COMPILED_FLATTENED_IMAGES_FILE, npaFlattenedImages)):
+            tmp_path = os.path.join(COMPILED_MODEL_DIR, file_name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(npa, dtype = np.float32))
+            os.replace(tmp_path, os.path.join(COMPILED_MODEL_DIR, file_name))
+
+        manifest = {
+            "version": COMPILED_MODEL_VERSION,
+            "samples": int(npaFlattenedImages.shape[0]),
+            "checksums": checksum_training_text_files()
+        }
+
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent = 2)
+        os.replace(tmp_path, manifest_path)                                             # manifest last, so it only ever points at complete arrays
+    except OSError as e:
+        print("warning, unable to write compiled model to %s: %s\n" % (COMPILED_MODEL_DIR, e))
+    # end try
+
+    return npaClassifications, npaFlattenedImages
 # end function
 
 
 def detect_chars_in_plates(list_of_possible_plates):
     if len(list_of_possible_plates) == 0:         
         return list_of_possible_plates             
-    
-    for possible_plate in list_of_possible_plates:
-        # preprocess to get grayscale and threshold images
-        possible_plate.img_grayscale, possible_plate.img_thresh = Preprocess.preprocess(possible_plate.img_plate)
 
-        # increase size of plate image for easier viewing and char detection
-        possible_plate.img_thresh = cv2.resize(
-            possible_plate.img_thresh, (0, 0), fx = 1.6, fy = 1.6, interpolation = cv2.INTER_CUBIC)
+    list_of_plates_and_chars = []
 
-        # threshold again to eliminate any gray areas
-        threshold_value, possible_plate.img_thresh = cv2.threshold(possible_plate.img_thresh,
-            0.0, 255.0, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    for possible_plate in list_of_possible_plates:
+        # preprocess to get grayscale and threshold images, extract_plate already warped the plate to PLATE_ROW_HEIGHT
+        with Metrics.timed("plate_preprocess"):
+            possible_plate.img_grayscale, possible_plate.img_thresh = Preprocess.preprocess(possible_plate.img_plate)
 
-        list_of_possible_chars_in_plate = find_possible_chars_in_plate(possible_plate.img_grayscale, possible_plate.img_thresh)
+        with Metrics.timed("plate_find_chars"):
+            list_of_possible_chars_in_plate = find_possible_chars_in_plate(possible_plate.img_grayscale, possible_plate.img_thresh)
 
-        list_of_list_of_matching_chars = find_list_of_groups_of_matching_chars(list_of_possible_chars_in_plate)
+        with Metrics.timed("plate_group_chars"):
+            list_of_list_of_matching_chars = find_list_of_groups_of_matching_chars(list_of_possible_chars_in_plate)
 
         if (len(list_of_list_of_matching_chars) == 0):          
             possible_plate.strChars = ""
+            possible_plate.charDistances = []
             continue
 
         for i in range(0, len(list_of_list_of_matching_chars)):                
@@ -105,30 +237,29 @@ def detect_chars_in_plates(list_of_possible_plates):
 
         longest_list_of_matching_chars_in_plate = list_of_list_of_matching_chars[index_of_longest_list_of_chars]
 
-        possible_plate.strChars = recognize_chars_in_plate(possible_plate.img_thresh, longest_list_of_matching_chars_in_plate)
+        list_of_plates_and_chars.append((possible_plate, longest_list_of_matching_chars_in_plate))
+
+    # classify the chars of every plate in one batch
+    with Metrics.timed("knn"):
+        recognize_chars_in_plates(list_of_plates_and_chars)
 
     return list_of_possible_plates
 
 
 def find_possible_chars_in_plate(img_grayscale, img_thresh):
-    list_of_possible_chars = []                        # return value
     img_thresh_copy = img_thresh.copy()
 
     contours, npaHierarchy = cv2.findContours(img_thresh_copy, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
 
-    for contour in contours:
-        possible_char = PossibleCharacter.PossibleCharacter(contour)
-
-        if check_if_possible_character(possible_char):
-            list_of_possible_chars.append(possible_char)
+    possible_chars = PossibleCharacter.PossibleCharacterSet.from_contours(contours)
 
-    return list_of_possible_chars
+    return possible_chars.filter(check_if_possible_characters(possible_chars)).to_list()
 
 
-def check_if_possible_character(possible_char):
-    if (possible_char.boundingRectArea > MIN_PIXEL_AREA
-        and possible_char.boundingRectWidth > MIN_PIXEL_WIDTH
-        and possible_char.boundingRectHeight > MIN_PIXEL_HEIGHT
+def check_if_possible_character(possible_char, scale = 1.0):
+    if (possible_char.boundingRectArea > MIN_PIXEL_AREA * scale * scale
+        and possible_char.boundingRectWidth > MIN_PIXEL_WIDTH * scale
+        and possible_char.boundingRectHeight > MIN_PIXEL_HEIGHT * scale
         and MIN_ASPECT_RATIO < possible_char.aspectRatio
         and possible_char.aspectRatio < MAX_ASPECT_RATIO):
 
@@ -137,31 +268,88 @@ def check_if_possible_character(possible_char):
         return False
 
 
-def find_list_of_groups_of_matching_chars(list_of_possible_chars):
-    list_of_groups_of_matching_chars = []                  
+def check_if_possible_characters(possible_chars, scale = 1.0):
+    # same test as check_if_possible_character, for a whole PossibleCharacterSet
+    return ((possible_chars.boundingRectArea > MIN_PIXEL_AREA * scale * scale)
+            & (possible_chars.boundingRectWidth > MIN_PIXEL_WIDTH * scale)
+            & (possible_chars.boundingRectHeight > MIN_PIXEL_HEIGHT * scale)
+            & (MIN_ASPECT_RATIO < possible_chars.aspectRatio)
+            & (possible_chars.aspectRatio < MAX_ASPECT_RATIO))
 
-    for possible_char in list_of_possible_chars:
-        list_of_matching_chars = find_list_of_matching_chars(possible_char, list_of_possible_chars)
 
-        list_of_matching_chars.append(possible_char)
+def find_list_of_groups_of_matching_chars(list_of_possible_chars):
+    '''
+        group the chars that line up with each other. the first char, in
+        list order, that matches at least MIN_NUMBER_OF_MATCHING_CHARS - 1
+        of the chars not grouped yet forms a group with them, the group is
+        removed and the search goes on with the remaining chars. the whole
+        pairwise comparison is done up front by matching_chars_matrix
+    '''
+    list_of_groups_of_matching_chars = []
+
+    number_of_chars = len(list_of_possible_chars)
+
+    if number_of_chars < MIN_NUMBER_OF_MATCHING_CHARS:
+        return list_of_groups_of_matching_chars
+
+    npaMatches = matching_chars_matrix(list_of_possible_chars)
+    npaAvailable = np.ones(number_of_chars, dtype = bool)
+
+    # a char that fails here can never start a group later on, because
+    # removing grouped chars only takes matches away from it
+    for i in range(number_of_chars):
+        if not npaAvailable[i]:
+            continue
 
-        if len(list_of_matching_chars) < MIN_NUMBER_OF_MATCHING_CHARS:
+        npaMatchingIndices = np.flatnonzero(npaMatches[i] & npaAvailable)
+
+        if len(npaMatchingIndices) + 1 < MIN_NUMBER_OF_MATCHING_CHARS:
             continue
 
+        list_of_matching_chars = [list_of_possible_chars[j] for j in npaMatchingIndices.tolist()]
+        list_of_matching_chars.append(list_of_possible_chars[i])
+
         list_of_groups_of_matching_chars.append(list_of_matching_chars)
 
-        list_of_possible_chars_with_current_matches_removed = []
+        npaAvailable[npaMatchingIndices] = False
+        npaAvailable[i] = False
 
-        list_of_possible_chars_with_current_matches_removed = list(set(list_of_possible_chars) - set(list_of_matching_chars))
+    return list_of_groups_of_matching_chars
 
-        recursivelist_of_groups_of_matching_chars = find_list_of_groups_of_matching_chars(list_of_possible_chars_with_current_matches_removed)
 
-        for recursivelist_of_matching_chars in recursivelist_of_groups_of_matching_chars:
-            list_of_groups_of_matching_chars.append(recursivelist_of_matching_chars)
+def matching_chars_matrix(list_of_possible_chars):
+    '''
+        return a boolean matrix where [i, j] is True if char j matches
+        char i, by exactly the rules of find_list_of_matching_chars
+        (the ratios are relative to char i, so it is not symmetric)
+    '''
+    npaCenterX = np.array([possible_char.centerX for possible_char in list_of_possible_chars], dtype = np.float64)
+    npaCenterY = np.array([possible_char.centerY for possible_char in list_of_possible_chars], dtype = np.float64)
+    npaArea = np.array([possible_char.boundingRectArea for possible_char in list_of_possible_chars], dtype = np.float64)
+    npaWidth = np.array([possible_char.boundingRectWidth for possible_char in list_of_possible_chars], dtype = np.float64)
+    npaHeight = np.array([possible_char.boundingRectHeight for possible_char in list_of_possible_chars], dtype = np.float64)
+    npaDiagonal = np.array([possible_char.diagonalSize for possible_char in list_of_possible_chars], dtype = np.float64)
 
-        break      
+    # row i holds the comparisons of every char against char i
+    npaDeltaX = npaCenterX[:, np.newaxis] - npaCenterX[np.newaxis, :]
+    npaDeltaY = npaCenterY[:, np.newaxis] - npaCenterY[np.newaxis, :]
 
-    return list_of_groups_of_matching_chars
+    npaDistance = np.hypot(npaDeltaX, npaDeltaY)
+    npaAngle = np.degrees(np.arctan2(np.abs(npaDeltaY), np.abs(npaDeltaX)))
+
+    npaChangeInArea = np.abs(npaArea[np.newaxis, :] - npaArea[:, np.newaxis]) / npaArea[:, np.newaxis]
+    npaChangeInWidth = np.abs(npaWidth[np.newaxis, :] - npaWidth[:, np.newaxis]) / npaWidth[:, np.newaxis]
+    npaChangeInHeight = np.abs(npaHeight[np.newaxis, :] - npaHeight[:, np.newaxis]) / npaHeight[:, np.newaxis]
+
+    npaMatches = ((npaDistance < (npaDiagonal[:, np.newaxis] * MAX_DIAG_SIZE_MULTIPLE_AWAY))
+                  & (npaAngle < MAX_ANGLE_BETWEEN_CHARS)
+                  & (npaChangeInArea < MAX_CHANGE_IN_AREA)
+                  & (npaChangeInWidth < MAX_CHANGE_IN_WIDTH)
+                  & (npaChangeInHeight < MAX_CHANGE_IN_HEIGHT))
+
+    np.fill_diagonal(npaMatches, False)                     # a char never matches itself
+
+    return npaMatches
 
 
 def find_list_of_matching_chars(possible_char, list_of_chars):
@@ -229,30 +417,93 @@ def remove_inner_overlapping_chars(list_of_matching_chars):
 
 
 def recognize_chars_in_plate(img_thresh, list_of_matching_chars):
-    strChars = ""                                                                   
-
     list_of_matching_chars.sort(key = lambda matching_char: matching_char.centerX)     # sort chars from left to right
 
-    for current_char in list_of_matching_chars:
-        pt1 = (current_char.boundingRectX, current_char.boundingRectY)
-        pt2 = ((current_char.boundingRectX + current_char.boundingRectWidth),
-               (current_char.boundingRectY + current_char.boundingRectHeight))
+    if len(list_of_matching_chars) == 0:
+        return ""
+
+    npaROIsResized = np.empty((len(list_of_matching_chars), RESIZED_CHAR_IMAGE_WIDTH * RESIZED_CHAR_IMAGE_HEIGHT), np.float32)
+
+    fill_char_samples(img_thresh, list_of_matching_chars, npaROIsResized, 0)
+
+    strChars, npaDistances = classify_char_samples(npaROIsResized)
 
+    return strChars
+
+
+def recognize_chars_in_plates(list_of_plates_and_chars):
+    '''
+        recognize the chars of several plates at once: every char ROI of
+        every (possible_plate, list_of_matching_chars) pair is written into
+        one float32 matrix, classified with a single findNearest call and
+        the results are split back into each plate's strChars
+    '''
+    list_of_char_counts = []
+
+    for possible_plate, list_of_matching_chars in list_of_plates_and_chars:
+        list_of_matching_chars.sort(key = lambda matching_char: matching_char.centerX)     # sort chars from left to right
+        list_of_char_counts.append(len(list_of_matching_chars))
+
+    total_number_of_chars = sum(list_of_char_counts)
+
+    if total_number_of_chars == 0:
+        for possible_plate, list_of_matching_chars in list_of_plates_and_chars:
+            possible_plate.strChars = ""
+            possible_plate.charDistances = []
+        return
+
+    npaROIsResized = np.empty((total_number_of_chars, RESIZED_CHAR_IMAGE_WIDTH * RESIZED_CHAR_IMAGE_HEIGHT), np.float32)
+
+    row = 0
+    for possible_plate, list_of_matching_chars in list_of_plates_and_chars:
+        row = fill_char_samples(possible_plate.img_thresh, list_of_matching_chars, npaROIsResized, row)
+
+    strAllChars, npaDistances = classify_char_samples(npaROIsResized)
+
+    row = 0
+    for (possible_plate, list_of_matching_chars), char_count in zip(list_of_plates_and_chars, list_of_char_counts):
+        possible_plate.strChars = strAllChars[row : row + char_count]
+        possible_plate.charDistances = npaDistances[row : row + char_count].tolist()
+        row = row + char_count
+
+
+def fill_char_samples(img_thresh, list_of_matching_chars, npaSamples, row):
+    for current_char in list_of_matching_chars:
         # crop char out of threshold image
         imgROI = img_thresh[current_char.boundingRectY : current_char.boundingRectY + current_char.boundingRectHeight,
                            current_char.boundingRectX : current_char.boundingRectX + current_char.boundingRectWidth]
 
-
         imgROIResized = cv2.resize(imgROI, (RESIZED_CHAR_IMAGE_WIDTH, RESIZED_CHAR_IMAGE_HEIGHT))           # resize image
-    
-        npaROIResized = imgROIResized.reshape((1, RESIZED_CHAR_IMAGE_WIDTH * RESIZED_CHAR_IMAGE_HEIGHT))        
 
-        npaROIResized = np.float32(npaROIResized)              
+        npaSamples[row] = imgROIResized.reshape(RESIZED_CHAR_IMAGE_WIDTH * RESIZED_CHAR_IMAGE_HEIGHT)      # converted to float32 on assignment
 
-        retval, npaResults, neigh_resp, dists = kNearest.findNearest(npaROIResized, k = 1)
+        row = row + 1
 
-        strCurrentChar = str(chr(int(npaResults[0][0])))            # get character from results
+    return row
 
-        strChars = strChars + strCurrentChar                        # append current char to full string
 
-    return strChars
+def classify_char_samples(npaSamples):
+    # return the recognized chars and the squared distance of each one to its nearest training sample
+    retval, npaResults, neigh_resp, dists = kNearest.findNearest(npaSamples, k = 1)
+
+    strChars = "".join(map(chr, npaResults[:, 0].astype(np.int32).tolist()))        # get characters from results
+
+    return strChars, dists[:, 0]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    subparsers = ap.add_subparsers(dest = "command")
+    compile_parser = subparsers.add_parser("compile", help = "build the compiled KNN training data")
+    compile_parser.add_argument("-f", "--force", action = "store_true", help = "rebuild even if it is up to date")
+    args = vars(ap.parse_args())
+
+    if args["command"] == "compile":
+        if not args["force"] and load_compiled_training_data() is not None:
+            print("compiled model in %s is up to date" % COMPILED_MODEL_DIR)
+        elif compile_training_data() is None:
+            print("\nerror: compiling the training data was not successful\n")
+        else:
+            print("compiled model written to %s" % COMPILED_MODEL_DIR)
+    else:
+        ap.print_help()
@@ -1,28 +1,40 @@
-import numpy as np
 import cv2
 import math
-import random
 
 import preprocess as Preprocess
 import possible_character as PossibleCharacter
 import detect_characters as DetectCharacters
 import possible_plate as PossiblePlate
+import metrics as Metrics
 
 # define constant
 PLATE_WIDTH_PADDING_FACTOR = 1.3
 PLATE_HEIGHT_PADDING_FACTOR = 1.45
 
+MIN_DESKEW_ANGLE = 0.5          # degrees, plates tilted less than this are cropped without rotating
+
+PLATE_HEIGHT = 320              # detector crops are resized to this height before OCR
+CHAR_SCALE = 1.33               # char size limits in a crop of PLATE_HEIGHT, relative to those in a plate row
+
 
 def detect_plates_in_image(image):
     list_of_possible_plates = []
 
-    img_grayscale, img_threshold = Preprocess.preprocess(image)    # preprocess image to get grayscale and threshold images
+    with Metrics.timed("normalize"):
+        image, scale = Preprocess.resize_to_height(image, PLATE_HEIGHT)
+
+    with Metrics.timed("preprocess"):
+        img_grayscale, img_threshold = Preprocess.preprocess(image)    # preprocess image to get grayscale and threshold images
 
-    list_of_possible_characters = find_possible_characters_in_image(img_threshold)
+    with Metrics.timed("find_chars"):
+        list_of_possible_characters = find_possible_characters_in_image(img_threshold)
+
+    with Metrics.timed("group_chars"):
+        list_of_groups_matching_chars = DetectCharacters.find_list_of_groups_of_matching_chars(list_of_possible_characters)
 
-    list_of_groups_matching_chars = DetectCharacters.find_list_of_groups_of_matching_chars(list_of_possible_characters)
     for group_of_matching_chars in list_of_groups_matching_chars:
-        possible_plate = extract_plate(image, group_of_matching_chars)
+        with Metrics.timed("extract_plate"):
+            possible_plate = extract_plate(image, group_of_matching_chars)
 
         if possible_plate.img_plate is not None:
             list_of_possible_plates.append(possible_plate)
@@ -31,19 +43,13 @@ def detect_plates_in_image(image):
 
 
 def find_possible_characters_in_image(img_threshold):
-    list_of_possible_characters = []
-
     img_thresh_copy = img_threshold.copy()
 
     contours, hierarchy = cv2.findContours(img_thresh_copy, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
 
-    for i in range(0, len(contours)):
-        possible_char = PossibleCharacter.PossibleCharacter(contours[i])
-
-        if DetectCharacters.check_if_possible_character(possible_char):
-            list_of_possible_characters.append(possible_char)
+    possible_characters = PossibleCharacter.PossibleCharacterSet.from_contours(contours)
 
-    return list_of_possible_characters
+    return possible_characters.filter(DetectCharacters.check_if_possible_characters(possible_characters, CHAR_SCALE)).to_list()
 
 
 def extract_plate(img_original, list_of_matching_chars):
@@ -81,14 +87,58 @@ def extract_plate(img_original, list_of_matching_chars):
 
     possible_plate.rrLocationOfPlateInScene = ( tuple(ptPlateCenter), (intPlateWidth, intPlateHeight), fltCorrectionAngleInDeg )
 
-    rotationMatrix = cv2.getRotationMatrix2D(tuple(ptPlateCenter), fltCorrectionAngleInDeg, 1.0)
+    # warp the plate straight to the row height the char filters are tuned for
+    fltScale = DetectCharacters.PLATE_ROW_HEIGHT / float(intPlateHeight)
 
-    height, width, numChannels = img_original.shape
-
-    imgRotated = cv2.warpAffine(img_original, rotationMatrix, (width, height))       # rotate the entire image
-
-    imgCropped = cv2.getRectSubPix(imgRotated, (intPlateWidth, intPlateHeight), tuple(ptPlateCenter))
+    imgCropped = crop_rotated_rect(img_original, tuple(ptPlateCenter), (intPlateWidth, intPlateHeight), fltCorrectionAngleInDeg, fltScale)
 
     possible_plate.img_plate = imgCropped
 
     return possible_plate
+
+
+def crop_rotated_rect(img_original, ptCenter, size, fltAngleInDeg, fltScale = 1.0):
+    '''
+        cut the rectangle of the given size, centered on ptCenter and rotated
+        by fltAngleInDeg, out of the image and return it upright and resized
+        by fltScale. only the region the rectangle can reach is warped, so
+        the cost depends on the plate size and not on the size of the image
+    '''
+    intWidth, intHeight = size
+    outputSize = (max(int(round(intWidth * fltScale)), 1), max(int(round(intHeight * fltScale)), 1))
+
+    if abs(fltAngleInDeg) < MIN_DESKEW_ANGLE:                                       # not worth a warp
+        imgCropped = cv2.getRectSubPix(img_original, size, ptCenter)
+        if outputSize == size:
+            return imgCropped
+
+        interpolation = cv2.INTER_LINEAR if fltScale < 1.0 else cv2.INTER_CUBIC
+        return cv2.resize(imgCropped, outputSize, interpolation = interpolation)
+
+    # every pixel of the rotated rectangle lies within half its diagonal of the center
+    intRadius = int(math.ceil(math.hypot(intWidth, intHeight) / 2.0)) + 2
+
+    intCenterX = int(round(ptCenter[0]))
+    intCenterY = int(round(ptCenter[1]))
+
+    intLeft, intTop = intCenterX - intRadius, intCenterY - intRadius
+    intRight, intBottom = intCenterX + intRadius + 1, intCenterY + intRadius + 1
+
+    height, width = img_original.shape[:2]
+
+    imgROI = img_original[max(intTop, 0):min(intBottom, height), max(intLeft, 0):min(intRight, width)]
+
+    if intLeft < 0 or intTop < 0 or intRight > width or intBottom > height:
+        # pad with black like warpAffine does outside the image
+        imgROI = cv2.copyMakeBorder(imgROI, max(-intTop, 0), max(intBottom - height, 0),
+                                    max(-intLeft, 0), max(intRight - width, 0), cv2.BORDER_CONSTANT, value = 0)
+
+    ptLocalCenter = (ptCenter[0] - intLeft, ptCenter[1] - intTop)
+
+    # rotate and scale only the plate region, in one warp that moves the plate center to the center of the output
+    rotationMatrix = cv2.getRotationMatrix2D(ptLocalCenter, fltAngleInDeg, fltScale)
+    rotationMatrix[0, 2] += (outputSize[0] - 1) / 2.0 - ptLocalCenter[0]
+    rotationMatrix[1, 2] += (outputSize[1] - 1) / 2.0 - ptLocalCenter[1]
+
+    interpolation = cv2.INTER_LINEAR if fltScale < 1.0 else cv2.INTER_CUBIC
+    return cv2.warpAffine(imgROI, rotationMatrix, outputSize, flags = interpolation)
@@ -0,0 +1,299 @@
+'''
+    plate detector backends. every backend takes the YOLO options dict of
+    plate_system and returns, per frame, the same result dicts as darkflow's
+    TFNet.return_predict. heavy libraries are only imported by the backend
+    that is actually created
+
+    python detector.py benchmark --backend darkflow --backend opencv
+'''
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import cv2
+
+# define constant
+BACKENDS = ("darkflow", "opencv")
+
+DEFAULT_WEIGHTS = "bin/tiny-yolo-voc-1c.weights"   # darknet weights for the opencv backend
+DEFAULT_LABELS = "labels.txt"
+NMS_THRESHOLD = 0.4                                 # same overlap darkflow suppresses boxes at
+
+
+def create_detector(backend, options):
+    if backend == "darkflow":
+        return DarkflowDetector(options)
+    elif backend == "opencv":
+        return OpenCVDetector(options)
+
+    raise ValueError("unknown detector backend %r, expected one of %s" % (backend, ", ".join(BACKENDS)))
+# end function
+
+
+class DarkflowDetector:
+    '''
+        plate detector on top of a darkflow TFNet. predict_batch runs the
+        frames of several streams through one session call and returns
+        the same result dicts as TFNet.return_predict for every frame
+    '''
+
+    def __init__(self, options):
+        from darkflow.net.build import TFNet                # pulls in tensorflow, only when this backend is used
+
+        self.tfnet = TFNet(options)
+    # end constructor
+
+    def predict(self, frame):
+        return self.tfnet.return_predict(frame)
+
+    def predict_batch(self, frames):
+        if len(frames) == 0:
+            return []
+
+        framework = self.tfnet.framework
+
+        npaInputs = np.stack([framework.resize_input(frame) for frame in frames])
+        npaOutputs = self.tfnet.sess.run(self.tfnet.out, {self.tfnet.inp: npaInputs})
+
+        list_of_results = []
+        for frame, npaOutput in zip(frames, npaOutputs):
+            h, w = frame.shape[:2]
+            results = []
+
+            for box in framework.findboxes(npaOutput):
+                processed_box = framework.process_box(box, h, w, self.tfnet.FLAGS.threshold)
+                if processed_box is None:
+                    continue
+
+                results.append(make_result(processed_box[4], processed_box[6], processed_box[0], processed_box[2],
+                                           processed_box[1], processed_box[3]))
+
+            list_of_results.append(results)
+
+        return list_of_results
+    # end function
+
+# end class
+
+
+class OpenCVDetector:
+    '''
+        the same YOLO network run by OpenCV's dnn module from the darknet
+        cfg and weights files, without tensorflow. the region layer gives
+        every anchor box with its class scores; boxes above the threshold
+        are kept after non-maximum suppression like darkflow does
+    '''
+
+    def __init__(self, options):
+        self.net = cv2.dnn.readNetFromDarknet(options["model"], options.get("weights", DEFAULT_WEIGHTS))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.output_names = self.net.getUnconnectedOutLayersNames()
+
+        self.input_size = read_input_size(options["model"])
+        self.threshold = options.get("threshold", 0.1)
+
+        with open(options.get("labels", DEFAULT_LABELS)) as f:
+            self.labels = [line.strip() for line in f if line.strip()]
+    # end constructor
+
+    def predict(self, frame):
+        return self.predict_batch([frame])[0]
+
+    def predict_batch(self, frames):
+        if len(frames) == 0:
+            return []
+
+        npaBlob = cv2.dnn.blobFromImages(frames, 1.0 / 255, self.input_size, swapRB = True, crop = False)
+        self.net.setInput(npaBlob)
+        npaOutputs = np.concatenate([npaOutput.reshape(len(frames), -1, npaOutput.shape[-1])
+                                     for npaOutput in self.net.forward(self.output_names)], axis = 1)
+
+        list_of_results = []
+        for frame, npaOutput in zip(frames, npaOutputs):
+            list_of_results.append(self.region_boxes(npaOutput, frame.shape[0], frame.shape[1]))
+
+        return list_of_results
+    # end function
+
+    def region_boxes(self, npaOutput, h, w):
+        # rows are cx, cy, bw, bh relative to the frame, objectness, then the score of every class
+        npaScores = npaOutput[:, 5:]
+        npaClasses = np.argmax(npaScores, axis = 1)
+        npaConfidences = npaScores[np.arange(len(npaScores)), npaClasses]
+
+        npaKeep = np.flatnonzero(npaConfidences > self.threshold)
+        if len(npaKeep) == 0:
+            return []
+
+        # edges rounded like darkflow's process_box, so both backends give the same pixels
+        list_of_edges = []
+        for i in npaKeep:
+            cx, cy, bw, bh = npaOutput[i, :4]
+            list_of_edges.append((int((cx - bw / 2.) * w), int((cy - bh / 2.) * h),
+                                  int((cx + bw / 2.) * w), int((cy + bh / 2.) * h)))
+
+        list_of_boxes = [[left, top, right - left, bottom - top] for left, top, right, bottom in list_of_edges]
+
+        results = []
+        for i in np.array(cv2.dnn.NMSBoxes(list_of_boxes, npaConfidences[npaKeep].tolist(),
+                                           self.threshold, NMS_THRESHOLD)).reshape(-1):
+            left, top, right, bottom = list_of_edges[i]
+            class_id = npaClasses[npaKeep[i]]
+            label = self.labels[class_id] if class_id < len(self.labels) else str(class_id)
+
+            # clamp to the frame like darkflow's process_box
+            results.append(make_result(label, float(npaConfidences[npaKeep[i]]), max(left, 0), max(top, 0),
+                                       min(right, w - 1), min(bottom, h - 1)))
+
+        return results
+    # end function
+
+# end class
+
+
+def make_result(label, confidence, left, top, right, bottom):
+    return {
+        "label": label,
+        "confidence": confidence,
+        "topleft": {"x": left, "y": top},
+        "bottomright": {"x": right, "y": bottom}
+    }
+# end function
+
+
+def read_input_size(cfg_path):
+    # network input (width, height) from the [net] section of a darknet cfg
+    size = {"width": 416, "height": 416}
+    section = None
+
+    with open(cfg_path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line.startswith("["):
+                section = line
+            elif section == "[net]" and "=" in line:
+                key, value = [part.strip() for part in line.split("=", 1)]
+                if key in size:
+                    size[key] = int(value)
+
+    return size["width"], size["height"]
+# end function
+
+
+def load_benchmark_frames(video, count):
+    frames = []
+
+    if video is not None:
+        capture = cv2.VideoCapture(video)
+        while len(frames) < count:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            frames.append(frame)
+        capture.release()
+
+    if len(frames) == 0:
+        rng = np.random.RandomState(0)
+        frames = [rng.randint(0, 256, (720, 1280, 3)).astype(np.uint8) for i in range(count)]
+
+    return frames
+# end function
+
+
+def benchmark_backend(backend, options, video, frames, batch_size, warmup):
+    '''
+        runs in a fresh process, so import and load time and memory are
+        those of this backend alone
+    '''
+    import resource
+
+    start_time = time.perf_counter()
+    detector = create_detector(backend, options)
+    startup = time.perf_counter() - start_time
+
+    list_of_frames = load_benchmark_frames(video, frames)
+    list_of_batches = [list_of_frames[i : i + batch_size] for i in range(0, len(list_of_frames), batch_size)]
+
+    for batch in list_of_batches[:warmup]:
+        detector.predict_batch(batch)
+
+    list_of_times = []
+    start_time = time.perf_counter()
+    for batch in list_of_batches:
+        batch_start = time.perf_counter()
+        detector.predict_batch(batch)
+        list_of_times.append((time.perf_counter() - batch_start) / len(batch))
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "backend": backend,
+        "startup_s": startup,
+        "frames": len(list_of_frames),
+        "batch_size": batch_size,
+        "fps": len(list_of_frames) / elapsed if elapsed > 0 else None,
+        "p50_ms": 1000 * float(np.percentile(list_of_times, 50)) if list_of_times else None,
+        "p95_ms": 1000 * float(np.percentile(list_of_times, 95)) if list_of_times else None,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    }
+# end function
+
+
+def format_figure(value, width, precision):
+    # a number of the benchmark table, or "-" where it could not be measured
+    if value is None:
+        return "-".rjust(width)
+    return "%*.*f" % (width, precision, value)
+# end function
+
+
+def format_benchmark_row(result):
+    return "%-10s %s %s %s %s %s" % (result["backend"], format_figure(result["startup_s"], 10, 2),
+                                     format_figure(result["fps"], 8, 1), format_figure(result["p50_ms"], 10, 1),
+                                     format_figure(result["p95_ms"], 10, 1), format_figure(result["max_rss_mb"], 12, 0))
+# end function
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    subparsers = ap.add_subparsers(dest = "command")
+    benchmark_parser = subparsers.add_parser("benchmark", help = "startup time and throughput of detector backends")
+    benchmark_parser.add_argument("--backend", action = "append", choices = BACKENDS, dest = "backends",
+                                  help = "backend to time, can be repeated, all by default")
+    benchmark_parser.add_argument("-vid", "--video", help = "frames to detect on, random frames if not given")
+    benchmark_parser.add_argument("--frames", type = int, default = 100)
+    benchmark_parser.add_argument("--batch-size", type = int, default = 1)
+    benchmark_parser.add_argument("--warmup", type = int, default = 3, help = "untimed batches")
+    benchmark_parser.add_argument("--weights", default = DEFAULT_WEIGHTS, help = "darknet weights for opencv")
+    benchmark_parser.add_argument("-o", "--output", help = "write the results to this JSON file")
+    args = vars(ap.parse_args())
+
+    if args["command"] != "benchmark":
+        ap.print_help()
+        sys.exit(0)
+
+    import plate_system as PlateSystem
+
+    options = dict(PlateSystem.options, weights = args["weights"])
+    context = multiprocessing.get_context("spawn")
+
+    report = []
+    print("%-10s %10s %8s %10s %10s %12s" % ("backend", "startup s", "fps", "p50 ms", "p95 ms", "max rss MB"))
+    for backend in args["backends"] or BACKENDS:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(benchmark_backend, (backend, options, args["video"], args["frames"],
+                                                        args["batch_size"], args["warmup"]))
+            except Exception as e:
+                print("%-10s failed: %s" % (backend, e))
+                continue
+
+        report.append(result)
+        print(format_benchmark_row(result))
+
+    if args["output"]:
+        with open(args["output"], "w") as f:
+            json.dump(report, f, indent = 2)
+# end if
@@ -0,0 +1,287 @@
+'''
+    accuracy and speed of the OCR path on a labeled set of plate images,
+    measured together so a speed-up that costs recognition shows up:
+
+        python evaluate.py labels.csv -o eval.json
+        python evaluate.py crops/ --compare eval.json
+
+    an input is a CSV file of "image,plate" lines, a JSONL file of
+    {"image": ..., "plate": ...} objects (image paths relative to the
+    file), or a directory / glob of images named after their plate, e.g.
+    59F12545_003.jpg. images are plate crops, or whole frames with
+    --frames, in which case the detector finds the plate first
+'''
+from multiprocessing import Pool
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+import benchmark as Benchmark
+import detect_characters as DetectCharacters
+import detect_plates as DetectPlates
+import detector as Detector
+import plate_system as PlateSystem
+
+# define constant
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+PERCENTILES = (50, 95, 99)
+REPORT_FORMAT_VERSION = 1
+
+# why a sample was not read right, in the order the OCR path can fail
+FAILURE_REASONS = ("unreadable", "no_detection", "no_groups", "no_chars", "regex_mismatch", "wrong_chars")
+
+WARM_UP_TASK_TIME = 0.05           # seconds every warm-up task takes, so each worker gets one
+
+# define global varialbles, set up once in every worker
+detector = None
+init_error = None
+
+
+def normalize_plate(text):
+    # compare plate numbers without separators or case, 59-F1 125.45 -> 59F112545
+    return re.sub(r"[^0-9A-Z]", "", text.upper())
+
+
+def load_dataset(list_of_inputs):
+    # (image path, expected plate) pairs of every input, in a stable order
+    list_of_samples = []
+
+    for path in list_of_inputs:
+        base_dir = os.path.dirname(path)
+
+        if path.lower().endswith(".csv"):
+            with open(path, newline = "") as f:
+                for row in csv.reader(f):
+                    if len(row) >= 2 and not row[0].startswith("#") and row[0] != "image":
+                        list_of_samples.append((os.path.join(base_dir, row[0].strip()), normalize_plate(row[1])))
+        elif path.lower().endswith(".jsonl"):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        sample = json.loads(line)
+                        list_of_samples.append((os.path.join(base_dir, sample["image"]), normalize_plate(sample["plate"])))
+        else:
+            if os.path.isdir(path):
+                list_of_files = sorted(os.path.join(path, name) for name in os.listdir(path))
+            else:
+                list_of_files = sorted(glob.glob(path)) or [path]
+
+            for image_path in list_of_files:
+                if image_path.lower().endswith(IMAGE_EXTENSIONS):
+                    # the plate is the file name up to the first "_", the rest tells shots of one plate apart
+                    plate = os.path.splitext(os.path.basename(image_path))[0].split("_")[0]
+                    list_of_samples.append((image_path, normalize_plate(plate)))
+
+    return list_of_samples
+# end function
+
+
+def init_worker(backend, options, classifier):
+    # a failure is kept and reported by worker_ready, an exception here would make the pool restart workers forever
+    global detector
+    global init_error
+
+    try:
+        if backend is not None:
+            detector = Detector.create_detector(backend, options)
+
+        if DetectCharacters.load_data_and_train(classifier) == False:
+            init_error = "training of the %s classifier was not successful" % classifier
+    except Exception as e:
+        init_error = "loading the %s detector failed: %r" % (backend, e)
+# end function
+
+
+def worker_ready(i):
+    # the worker's pid and why it could not be set up, if it could not
+    time.sleep(WARM_UP_TASK_TIME)                                       # leave the next task to another worker
+    return os.getpid(), init_error
+# end function
+
+
+def wait_for_workers(pool, number_of_workers):
+    # return the worker pids once every worker has trained its classifier and loaded the detector, exit if one failed to
+    set_of_pids = set()
+
+    while len(set_of_pids) < number_of_workers:
+        for pid, error in pool.map(worker_ready, range(number_of_workers), chunksize = 1):
+            if error is not None:
+                pool.terminate()
+                sys.exit("error: worker initialization failed: " + error)
+            set_of_pids.add(pid)
+
+    return set_of_pids
+# end function
+
+
+def evaluate_sample(sample):
+    # runs in a worker: read one labeled image the way process_image does, keeping why it failed
+    image_path, expected = sample
+    evaluation = {"image": image_path, "expected": expected, "read": "", "raw": "", "reason": None}
+
+    img = cv2.imread(image_path)
+    if img is None:
+        evaluation["reason"] = "unreadable"
+        return evaluation
+
+    start_time = time.perf_counter()
+
+    img_plate = img
+    if detector is not None:
+        results = [result for result in detector.predict(img) if result['confidence'] > PlateSystem.CONFIDENCE_RATE]
+        if len(results) > 0:
+            img_plate = PlateSystem.crop_plate(img, max(results, key = lambda result: result['confidence']))
+        if len(results) == 0 or img_plate is None:
+            evaluation["latency"] = time.perf_counter() - start_time
+            evaluation["reason"] = "no_detection"
+            return evaluation
+
+    list_of_possible_plates = DetectPlates.detect_plates_in_image(img_plate)
+    list_of_possible_plates = DetectCharacters.detect_chars_in_plates(list_of_possible_plates)
+    plate = PlateSystem.read_plate_number(list_of_possible_plates, img_plate)
+
+    evaluation["latency"] = time.perf_counter() - start_time
+
+    # every char read, rows top to bottom, to score what was read even when it is not a valid number
+    list_of_possible_plates.sort(key = lambda possible_plate: possible_plate.rrLocationOfPlateInScene[0][1])
+    evaluation["raw"] = "".join(possible_plate.strChars for possible_plate in list_of_possible_plates)
+
+    if plate != False:
+        evaluation["read"] = plate[0]
+
+    if len(list_of_possible_plates) == 0:
+        evaluation["reason"] = "no_groups"
+    elif len(evaluation["raw"]) == 0:
+        evaluation["reason"] = "no_chars"
+    elif plate == False:
+        evaluation["reason"] = "regex_mismatch"
+    elif plate[0] != expected:
+        evaluation["reason"] = "wrong_chars"
+
+    return evaluation
+# end function
+
+
+def edit_distance(first, second):
+    # levenshtein distance, one row at a time
+    previous_row = list(range(len(second) + 1))
+
+    for i, first_char in enumerate(first, 1):
+        current_row = [i]
+        for j, second_char in enumerate(second, 1):
+            current_row.append(min(previous_row[j] + 1, current_row[j - 1] + 1,
+                                   previous_row[j - 1] + (first_char != second_char)))
+        previous_row = current_row
+
+    return previous_row[-1]
+# end function
+
+
+def summarize(list_of_evaluations, elapsed):
+    '''
+        exact match is the share of samples read as the expected number;
+        char accuracy counts the expected chars left after the edits that
+        turn the reading (the valid number, else every char read) into
+        the expected one
+    '''
+    number_of_samples = len(list_of_evaluations)
+    number_of_chars = sum(len(evaluation["expected"]) for evaluation in list_of_evaluations)
+
+    correct_chars = 0
+    for evaluation in list_of_evaluations:
+        reading = evaluation["read"] or evaluation["raw"]
+        correct_chars += max(len(evaluation["expected"]) - edit_distance(reading, evaluation["expected"]), 0)
+
+    npaLatencies = np.array([evaluation["latency"] for evaluation in list_of_evaluations if "latency" in evaluation])
+
+    summary = {
+        "samples": number_of_samples,
+        "exact_match": sum(1 for evaluation in list_of_evaluations if evaluation["reason"] is None) / float(number_of_samples),
+        "char_accuracy": correct_chars / float(number_of_chars) if number_of_chars > 0 else 0.0,
+        "plates_per_sec": number_of_samples / elapsed if elapsed > 0 else None,
+        "failures": {reason: sum(1 for evaluation in list_of_evaluations if evaluation["reason"] == reason)
+                     for reason in FAILURE_REASONS}
+    }
+    for percentile in PERCENTILES:
+        summary["p%d_ms" % percentile] = 1000 * float(np.percentile(npaLatencies, percentile)) if len(npaLatencies) > 0 else None
+
+    return summary
+# end function
+
+
+def print_summary(summary, baseline = None):
+    def delta(key, scale = 1.0, unit = ""):
+        if baseline is None or baseline.get(key) is None or summary[key] is None:
+            return ""
+        return "   (%+.2f%s vs baseline)" % (scale * (summary[key] - baseline[key]), unit)
+
+    print("samples          %d" % summary["samples"])
+    print("exact match      %.2f%%%s" % (100 * summary["exact_match"], delta("exact_match", 100, " pts")))
+    print("char accuracy    %.2f%%%s" % (100 * summary["char_accuracy"], delta("char_accuracy", 100, " pts")))
+    print("plates/sec       %.1f%s" % (summary["plates_per_sec"], delta("plates_per_sec")))
+    for percentile in PERCENTILES:
+        key = "p%d_ms" % percentile
+        if summary[key] is not None:
+            print("%-16s %.2f%s" % ("p%d latency ms" % percentile, summary[key], delta(key, 1.0, " ms")))
+    for reason in FAILURE_REASONS:
+        if summary["failures"][reason] > 0:
+            print("  %-14s %d" % (reason, summary["failures"][reason]))
+# end function
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description = "accuracy and throughput of the OCR path on labeled plate images")
+    ap.add_argument("inputs", nargs = "+", help = "CSV or JSONL label files, directories or glob patterns of images")
+    ap.add_argument("-w", "--workers", type = int, default = os.cpu_count())
+    ap.add_argument("--classifier", choices = DetectCharacters.CLASSIFIERS, default = "knn")
+    ap.add_argument("--frames", action = "store_true", help = "images are whole frames, detect the plate first")
+    ap.add_argument("--detector", choices = Detector.BACKENDS, default = "darkflow")
+    ap.add_argument("--weights", default = Detector.DEFAULT_WEIGHTS, help = "darknet weights for --detector opencv")
+    ap.add_argument("-o", "--output", help = "write the JSON report to this file")
+    ap.add_argument("--compare", help = "JSON report of an earlier run to compare against")
+    args = vars(ap.parse_args())
+
+    list_of_samples = load_dataset(args["inputs"])
+    if len(list_of_samples) == 0:
+        sys.exit("error: no labeled images found")
+
+    backend = args["detector"] if args["frames"] else None
+    pool = Pool(args["workers"], initializer = init_worker,
+                initargs = (backend, dict(PlateSystem.options, weights = args["weights"]), args["classifier"]))
+    wait_for_workers(pool, args["workers"])                             # training and model loading are not timed
+
+    start_time = time.perf_counter()
+    list_of_evaluations = pool.map(evaluate_sample, list_of_samples,
+                                   chunksize = max(len(list_of_samples) // (4 * args["workers"]), 1))
+    elapsed = time.perf_counter() - start_time
+
+    pool.close()
+    pool.join()
+
+    summary = summarize(list_of_evaluations, elapsed)
+
+    baseline = None
+    if args["compare"]:
+        with open(args["compare"]) as f:
+            baseline = json.load(f)["summary"]
+    print_summary(summary, baseline)
+
+    if args["output"]:
+        report = {
+            "version": REPORT_FORMAT_VERSION,
+            "commit": Benchmark.git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {key: args[key] for key in ("inputs", "workers", "classifier", "frames", "detector")},
+            "summary": summary,
+            "errors": [evaluation for evaluation in list_of_evaluations if evaluation["reason"] is not None]
+        }
+        with open(args["output"], "w") as f:
+            json.dump(report, f, indent = 2)
+# end if
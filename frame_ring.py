@@ -0,0 +1,169 @@
+import math
+import time
+import threading
+import numpy as np
+import cv2
+
+# define constant
+CAMERA_HISTORY = 0.5                # seconds of driver camera kept to pick the photo from
+CAMERA_RING_BYTES = 64 << 20        # memory of one driver camera ring, big frames get less history
+DEFAULT_CAMERA_FPS = 30.0           # when the camera does not report its frame rate
+MIN_CAMERA_SLOTS = 2
+MAX_PACED_FPS = 120                 # sources reporting more (or no) fps are read as fast as they deliver
+
+
+def camera_slots(fps, frame_width, frame_height):
+    '''
+        frames in a driver camera ring: CAMERA_HISTORY seconds of them, as
+        far as they fit in CAMERA_RING_BYTES. at 30 fps that is 15 frames
+        (41 MB) at 720p, and 10 (62 MB, a third of a second) at 1080p
+    '''
+    if not 0 < fps <= MAX_PACED_FPS:
+        fps = DEFAULT_CAMERA_FPS
+    slots = int(math.ceil(CAMERA_HISTORY * fps))
+
+    frame_bytes = frame_width * frame_height * 3
+    if frame_bytes > 0:
+        slots = min(slots, CAMERA_RING_BYTES // frame_bytes)
+
+    return max(slots, MIN_CAMERA_SLOTS)
+# end function
+
+
+class FrameRing:
+    '''
+        a fixed number of frame buffers reused in turn, each with the time
+        its frame was decoded. a source decodes straight into the buffer
+        claim() hands out, the oldest one not held, with
+        capture.read(buffer); the buffers are allocated once, at the size
+        of the first frame. a frame handed on to other stages is marked
+        with hold() and not decoded over until release(); claim() waits
+        while every slot is held
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffers = [None] * capacity
+        self.npaTimestamps = np.full(capacity, -np.inf)                 # -inf while a slot holds no frame
+        self.npaSequence = np.zeros(capacity, dtype = np.int64)         # bumped on every claim, so readers see reuse
+        self.npaHeld = np.zeros(capacity, dtype = bool)                 # frames still in use by later stages
+        self.next = 0
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+    # end constructor
+
+    def claim(self, timeout = None):
+        '''
+            the slot to decode the next frame into and its buffer, None
+            until the first frame set the size. (None, None) if every slot
+            is still held after timeout seconds
+        '''
+        with self.released:
+            if not self.released.wait_for(lambda: not self.npaHeld.all(), timeout):
+                return None, None
+
+            slot = self.next
+            while self.npaHeld[slot]:
+                slot = (slot + 1) % self.capacity
+            self.next = (slot + 1) % self.capacity
+            self.npaTimestamps[slot] = -np.inf
+            self.npaSequence[slot] += 1
+
+            return slot, self.buffers[slot]
+    # end function
+
+    def publish(self, slot, frame, timestamp):
+        # a frame decoded into a claimed slot; one that did not fit the buffer (first frame, new size) resizes the ring
+        with self.lock:
+            if frame is not self.buffers[slot]:
+                self.buffers = [np.empty_like(frame) for i in range(self.capacity)]
+                self.buffers[slot] = frame
+                self.npaTimestamps[:] = -np.inf
+
+            self.npaTimestamps[slot] = timestamp
+    # end function
+
+    def hold(self, slot):
+        # the frame in slot was handed on, keep it until release(slot)
+        with self.lock:
+            self.npaHeld[slot] = True
+
+    def release(self, slot):
+        with self.released:
+            self.npaHeld[slot] = False
+            self.released.notify_all()
+    # end function
+
+    def nearest(self, timestamp):
+        '''
+            copy of the frame decoded closest to timestamp and the time it
+            was decoded, or (None, None) if there is none. a slot reclaimed
+            while it is copied is read again
+        '''
+        while True:
+            with self.lock:
+                npaDistances = np.abs(self.npaTimestamps - timestamp)
+                slot = int(np.argmin(npaDistances))
+                if not np.isfinite(npaDistances[slot]):
+                    return None, None
+
+                frame = self.buffers[slot]
+                frame_timestamp = float(self.npaTimestamps[slot])
+                sequence = self.npaSequence[slot]
+
+            frame_copy = frame.copy()
+
+            with self.lock:
+                if self.npaSequence[slot] == sequence:
+                    return frame_copy, frame_timestamp
+    # end function
+
+# end class
+
+
+class CaptureThread(threading.Thread):
+    '''
+        decodes a source into a FrameRing on its own thread until the source
+        ends or stop() is called. files are played at their own frame rate,
+        like a camera delivers them
+    '''
+
+    def __init__(self, capture, ring, name = None):
+        threading.Thread.__init__(self, name = name, daemon = True)
+        self.capture = capture
+        self.ring = ring
+        self.frames = 0
+        self.stopped = threading.Event()
+
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        self.period = 1.0 / fps if 0 < fps <= MAX_PACED_FPS else 0.0
+    # end constructor
+
+    def run(self):
+        due = time.time()
+
+        while not self.stopped.is_set() and self.capture.isOpened():
+            slot, buffer = self.ring.claim()
+            ret, frame = self.capture.read(buffer)
+            if not ret:
+                break
+
+            self.ring.publish(slot, frame, time.time())
+            self.frames += 1
+
+            # a live source blocks in read() for the frame period itself, so this only waits for files
+            due += self.period
+            delay = due - time.time()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                due = time.time()
+    # end function
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+    # end function
+
+# end class
@@ -0,0 +1,119 @@
+import time
+import threading
+
+# define constant
+DEFAULT_FPS = 25.0                  # when the source does not report its frame rate
+MAX_IN_FLIGHT = 1                   # decoded frames of a lane waiting for or in detection
+LOST_FRAME_TIMEOUT = 5.0            # seconds after which a frame that never got detected stops blocking decode
+SMOOTHING = 0.2                     # weight of the newest measurement in the moving averages
+SCALE_STEP = 0.75                   # detector input scale is changed by this factor at a time
+SCALE_UP_MARGIN = 0.5               # scale back up once the latency is below this share of the budget
+
+
+class FrameScheduler:
+    '''
+        keeps one lane real-time. a frame is only decoded once the lane's
+        previous frame reached the detector, and the frames the source
+        produced in the meantime are grab()bed without decoding, so the
+        detector always gets a fresh frame instead of a queued one. the
+        detect stage reports how long each batch took and how old its
+        frames were; while that latency is above the budget the detector
+        input of the lane is scaled down step by step (not below
+        min_scale), and back up once there is room again
+    '''
+
+    def __init__(self, budget, fps = None, min_scale = 1.0):
+        self.budget = budget
+        self.frame_interval = 1.0 / (fps if fps and fps > 0 else DEFAULT_FPS)
+        self.min_scale = min_scale
+
+        self.detect_time = None             # moving average of the seconds one batch spends in detection
+        self.latency = None                 # moving average of the seconds from capture to detected
+        self.skip = 0                       # frames grabbed before the last decoded one
+        self.skipped = 0
+        self.scale = 1.0                    # detector input scale
+
+        self.in_flight = 0
+        self.start_time = None              # when the first frame was read
+        self.position = 0                   # frames read or grabbed since then
+        self.wait_started = None
+        self.condition = threading.Condition()
+    # end constructor
+
+    def wait_for_detector(self, timeout):
+        # wait until the lane has room for another frame, return False on timeout
+        with self.condition:
+            if self.condition.wait_for(lambda: self.in_flight < MAX_IN_FLIGHT, timeout):
+                self.wait_started = None
+                return True
+
+            now = time.time()
+            if self.wait_started is None:
+                self.wait_started = now
+            elif now - self.wait_started > LOST_FRAME_TIMEOUT:
+                self.in_flight = 0                                      # the detect stage dropped it, move on
+                self.wait_started = None
+                return True
+
+            return False
+    # end function
+
+    def frames_to_skip(self):
+        # frames the source produced since the last decoded one, that there was no time for
+        with self.condition:
+            if self.start_time is None:
+                self.skip = 0
+            else:
+                self.skip = max(int((time.time() - self.start_time) / self.frame_interval) - self.position, 0)
+            self.position += self.skip
+
+            return self.skip
+    # end function
+
+    def frame_read(self):
+        with self.condition:
+            self.in_flight += 1
+            self.position += 1
+            if self.start_time is None:
+                self.start_time = time.time()
+    # end function
+
+    def frame_dropped(self):
+        # a decoded frame that will not reach the detector, e.g. stopped by the motion gate
+        with self.condition:
+            self.in_flight = max(self.in_flight - 1, 0)
+            self.condition.notify_all()
+    # end function
+
+    def current_skip(self):
+        # the skip of the last decoded frame, for stats; frames_to_skip() is only for the decode loop
+        with self.condition:
+            return self.skip
+
+    def detector_scale(self):
+        with self.condition:
+            return self.scale
+
+    def record(self, detect_time, latency):
+        # called by the detect stage for every frame of this lane it processed
+        with self.condition:
+            self.in_flight = max(self.in_flight - 1, 0)
+            self.condition.notify_all()
+
+            self.detect_time = smooth(self.detect_time, detect_time)
+            self.latency = smooth(self.latency, latency)
+
+            if self.latency > self.budget and self.scale > self.min_scale:
+                self.scale = max(self.scale * SCALE_STEP, self.min_scale)
+                self.latency = None                                     # measure again at the new scale
+            elif self.latency < SCALE_UP_MARGIN * self.budget and self.scale < 1.0:
+                self.scale = min(self.scale / SCALE_STEP, 1.0)
+                self.latency = None
+    # end function
+
+# end class
+
+
+def smooth(average, value):
+    return value if average is None else (1.0 - SMOOTHING) * average + SMOOTHING * value
+# end function
@@ -0,0 +1,69 @@
+import numpy as np
+import cv2
+
+# define constant
+BINARY_THRESHOLD = 128                  # glyph pixels at or above this are set, the thresh images are 0 or 255
+PIXEL_DISTANCE = 255.0 ** 2             # one differing pixel, so distances match the KNN's squared L2 on 0/255 images
+
+
+def pack_glyphs(npaImages):
+    # one row of 600 pixel values per glyph -> one row of 75 bytes, 8 pixels per byte
+    npaImages = np.asarray(npaImages)
+    return np.packbits(npaImages.reshape(len(npaImages), -1) >= BINARY_THRESHOLD, axis = 1)
+# end function
+
+
+class HammingNearest:
+    '''
+        nearest neighbour classifier over bit-packed binary glyphs. it keeps
+        the part of the cv2.ml.KNearest API detect_characters uses (setDefaultK,
+        train, findNearest), but stores every training glyph in 75 bytes
+        instead of 600 floats and compares glyphs with XOR and popcount
+    '''
+
+    def __init__(self):
+        self.default_k = 1
+        self.npaPackedImages = np.zeros((0, 0), dtype = np.uint8)
+        self.npaResponses = np.zeros(0, dtype = np.float32)
+    # end constructor
+
+    def setDefaultK(self, k):
+        self.default_k = k
+
+    def train(self, npaSamples, layout, npaResponses):
+        # layout is accepted for compatibility, samples are always one per row
+        self.npaPackedImages = pack_glyphs(npaSamples)
+        self.npaResponses = np.asarray(npaResponses, dtype = np.float32).reshape(-1)
+
+        return True
+    # end function
+
+    def findNearest(self, npaSamples, k = None):
+        '''
+            return (retval, results, neighborResponses, dists) like
+            cv2.ml.KNearest.findNearest: results holds the majority response
+            of the k nearest glyphs, dists their squared L2 distances
+        '''
+        k = min(self.default_k if k is None else k, len(self.npaPackedImages))
+
+        # XOR + popcount of every sample against every training glyph, keeping the k nearest
+        npaHamming, npaNeighbors = cv2.batchDistance(pack_glyphs(npaSamples), self.npaPackedImages, cv2.CV_32S,
+                                                     normType = cv2.NORM_HAMMING, K = k)
+
+        neigh_resp = self.npaResponses[npaNeighbors]
+        dists = npaHamming.astype(np.float32) * PIXEL_DISTANCE
+
+        if k == 1:
+            npaResults = neigh_resp.copy()
+        else:
+            npaResults = np.empty((len(neigh_resp), 1), dtype = np.float32)
+            for row, responses in enumerate(neigh_resp):
+                values, counts = np.unique(responses, return_counts = True)
+                npaResults[row, 0] = values[np.argmax(counts)]
+
+        retval = float(npaResults[0, 0]) if len(npaResults) > 0 else 0.0
+
+        return retval, npaResults, neigh_resp, dists
+    # end function
+
+# end class
@@ -0,0 +1,126 @@
+import json
+import cv2
+
+import frame_ring as FrameRing
+
+# define constant
+MODES = ("in", "out")
+
+
+class Lane:
+    '''
+        one entry or exit lane: its video source, the optional camera that
+        photographs the driver, the check-in/out mode, the region plates
+        pass through and, once the gate is running, the lane's own frame
+        ring and queue, frame scheduler, motion gate and plate tracker. the
+        driver camera is decoded on its own thread into a ring of recent
+        frames, so a check-in gets the photo taken when the plate was seen
+    '''
+
+    def __init__(self, name, source, mode = "in", camera = None, roi = None):
+        if mode not in MODES:
+            raise ValueError("lane %s: mode must be one of %s, not %r" % (name, ", ".join(MODES), mode))
+
+        self.name = name
+        self.source = source
+        self.mode = mode
+        self.camera_source = camera
+        self.roi = roi                          # (x, y, w, h) watched for motion, None for the whole frame
+
+        self.capture = None
+        self.camera = None
+        self.camera_ring = None
+        self.camera_thread = None
+        self.frame_ring = None
+        self.frame_queue = None
+        self.scheduler = None
+        self.motion_gate = None
+        self.tracker = None
+        self.last_plate_number = None           # the last plate checked in or out, not sent again right after
+    # end constructor
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.source)
+        if self.camera_source is not None:
+            self.camera = cv2.VideoCapture(self.camera_source)
+            self.camera_ring = FrameRing.FrameRing(FrameRing.camera_slots(self.camera.get(cv2.CAP_PROP_FPS),
+                                                                          int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                                                          int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+            self.camera_thread = FrameRing.CaptureThread(self.camera, self.camera_ring, name = "camera-" + self.name)
+            self.camera_thread.start()
+    # end function
+
+    def driver_photo(self, timestamp):
+        # the driver camera frame decoded closest to timestamp, None without a camera or frames
+        if self.camera_ring is None:
+            return None
+
+        frame, frame_timestamp = self.camera_ring.nearest(timestamp)
+        return frame
+    # end function
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+        if self.camera_thread is not None:
+            self.camera_thread.stop()
+        if self.camera is not None:
+            self.camera.release()
+    # end function
+
+# end class
+
+
+def frame_size(source):
+    # (width, height) of the frames of a source, (0, 0) if it cannot be opened or does not tell
+    capture = cv2.VideoCapture(source)
+    size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    capture.release()
+
+    return size
+# end function
+
+
+def parse_source(source):
+    # "0" or 0 means a local camera index, anything else is a file or stream url
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+# end function
+
+
+def load_lanes(path):
+    '''
+        read a lane config file:
+
+        {
+            "max_batch_size": 8,
+            "lanes": [
+                {"name": "gate-1-in", "source": "demo.mov", "mode": "in", "camera": 0, "roi": [400, 300, 1120, 780]},
+                {"name": "gate-1-out", "source": "rtsp://10.0.0.12/stream", "mode": "out"}
+            ]
+        }
+    '''
+    with open(path) as f:
+        config = json.load(f)
+
+    list_of_lanes = []
+    names = set()
+
+    for i, lane_config in enumerate(config["lanes"]):
+        name = lane_config.get("name", "lane-%d" % i)
+        if name in names:
+            raise ValueError("lane name %r is used twice in %s" % (name, path))
+        names.add(name)
+
+        camera = lane_config.get("camera")
+        roi = lane_config.get("roi")
+        if roi is not None and (len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0):
+            raise ValueError("lane %s: roi must be [x, y, w, h] with a positive width and height" % name)
+
+        list_of_lanes.append(Lane(name, parse_source(lane_config["source"]), lane_config.get("mode", "in"),
+                                  parse_source(camera) if camera is not None else None,
+                                  tuple(roi) if roi is not None else None))
+
+    return list_of_lanes, config.get("max_batch_size", len(list_of_lanes))
+# end function
@@ -0,0 +1,351 @@
+'''
+    in-process instrumentation: per-stage latency histograms, counters and
+    gauges, a snapshot API and an optional local HTTP endpoint that serves
+    them in the Prometheus text format. everything is a no-op until enable()
+    is called, so the hooks cost one global check when it is off
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import json
+import threading
+import time
+
+# define constant
+PREFIX = "plate_"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# define global varialbles
+ENABLED = False
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_counter_funcs = {}
+_gauges = {}
+_help = {}
+
+
+class Histogram:
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)                  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+    # end constructor
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+    # end function
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+
+        return float("inf")
+    # end function
+
+# end class
+
+
+class _Timer:
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+# end class
+
+
+class _NullTimer:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+# end class
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+
+def stage_histogram(stage):
+    key = _key("stage_seconds", {"stage": stage})
+
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(key, Histogram())
+        _help.setdefault("stage_seconds", "latency of each processing stage in seconds")
+
+    return histogram
+# end function
+
+
+def timed(stage):
+    # with Metrics.timed("preprocess"): ... records the block's latency when enabled
+    if not ENABLED:
+        return _NULL_TIMER
+
+    return _Timer(stage_histogram(stage))
+# end function
+
+
+def observe(stage, seconds):
+    if ENABLED:
+        stage_histogram(stage).observe(seconds)
+
+
+def inc(name, amount = 1, help = None, **labels):
+    if not ENABLED:
+        return
+
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    if help is not None:
+        _help.setdefault(name, help)
+# end function
+
+
+def gauge(name, func, help = None, **labels):
+    # register a callable that is read whenever a snapshot is taken
+    with _lock:
+        _gauges[_key(name, labels)] = func
+    if help is not None:
+        _help.setdefault(name, help)
+# end function
+
+
+def counter(name, func, help = None, **labels):
+    # like gauge, for a total that only grows and is kept elsewhere (e.g. drops of a queue)
+    with _lock:
+        _counter_funcs[_key(name, labels)] = func
+    if help is not None:
+        _help.setdefault(name, help)
+# end function
+
+
+def drain():
+    '''
+        return the histograms and counters recorded since the last drain
+        and reset them. pool workers send this back with their results so
+        the parent can merge() what happened in other processes
+    '''
+    with _lock:
+        delta = {
+            "histograms": [(key, histogram.counts, histogram.sum, histogram.count)
+                           for key, histogram in _histograms.items() if histogram.count > 0],
+            "counters": list(_counters.items())
+        }
+
+        for histogram in _histograms.values():
+            histogram.counts = [0] * len(histogram.counts)
+            histogram.sum = 0.0
+            histogram.count = 0
+        _counters.clear()
+
+    return delta
+# end function
+
+
+def merge(delta):
+    if delta is None or not ENABLED:
+        return
+
+    for key, counts, total, count in delta["histograms"]:
+        with _lock:
+            histogram = _histograms.setdefault(key, Histogram())
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+            histogram.count += count
+
+    with _lock:
+        for key, amount in delta["counters"]:
+            _counters[key] = _counters.get(key, 0) + amount
+# end function
+
+
+def _escape(value):
+    # label values in the text format escape backslash, double quote and newline
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(key):
+    name, labels = key
+    return PREFIX + name, ",".join('%s="%s"' % (label, _escape(value)) for label, value in labels)
+
+
+def snapshot():
+    with _lock:
+        histograms = list(_histograms.items())
+        counters = dict(_counters)
+        counter_funcs = dict(_counter_funcs)
+        gauges = dict(_gauges)
+
+    result = {"enabled": ENABLED, "time": time.time(), "stages": {}, "counters": {}, "gauges": {}}
+
+    for (name, labels), histogram in histograms:
+        result["stages"][dict(labels).get("stage", name)] = {
+            "count": histogram.count,
+            "sum": histogram.sum,
+            "mean": histogram.sum / histogram.count if histogram.count else None,
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts))
+        }
+
+    for key, value in counters.items():
+        name, labels = _series(key)
+        result["counters"][name + ("{%s}" % labels if labels else "")] = value
+
+    for key, func in counter_funcs.items():
+        name, labels = _series(key)
+        try:
+            result["counters"][name + ("{%s}" % labels if labels else "")] = func()
+        except Exception:
+            continue
+
+    for key, func in gauges.items():
+        name, labels = _series(key)
+        try:
+            result["gauges"][name + ("{%s}" % labels if labels else "")] = func()
+        except Exception:
+            continue
+
+    return result
+# end function
+
+
+def prometheus_text():
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+        counter_funcs = sorted(_counter_funcs.items())
+        gauges = sorted(_gauges.items())
+
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            if name in _help:
+                lines.append("# HELP %s%s %s" % (PREFIX, name, _help[name]))
+            lines.append("# TYPE %s%s %s" % (PREFIX, name, kind))
+
+    for key, histogram in histograms:
+        declare(key[0], "histogram")
+        name, labels = _series(key)
+        separator = "," if labels else ""
+
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append('%s_bucket{%s%sle="%s"} %d' % (name, labels, separator, le, cumulative))
+        lines.append("%s_sum%s %r" % (name, "{%s}" % labels if labels else "", histogram.sum))
+        lines.append("%s_count%s %d" % (name, "{%s}" % labels if labels else "", histogram.count))
+
+    for key, value in counters:
+        declare(key[0], "counter")
+        name, labels = _series(key)
+        lines.append("%s%s %r" % (name, "{%s}" % labels if labels else "", value))
+
+    for key, func in counter_funcs:
+        try:
+            value = func()
+        except Exception:
+            continue
+        declare(key[0], "counter")
+        name, labels = _series(key)
+        lines.append("%s%s %r" % (name, "{%s}" % labels if labels else "", value))
+
+    for key, func in gauges:
+        try:
+            value = func()
+        except Exception:
+            continue
+        declare(key[0], "gauge")
+        name, labels = _series(key)
+        lines.append("%s%s %r" % (name, "{%s}" % labels if labels else "", value))
+
+    return "\n".join(lines) + "\n"
+# end function
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = prometheus_text().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/snapshot":
+            body = json.dumps(snapshot()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    # end function
+
+    def log_message(self, format, *args):
+        pass                                                    # keep scrapes out of the console
+
+# end class
+
+
+def serve(port, host = "127.0.0.1"):
+    # serve /metrics (Prometheus text) and /snapshot (JSON) from a background thread
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target = server.serve_forever, name = "metrics-http")
+    thread.daemon = True
+    thread.start()
+
+    return server
+# end function
@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+
+# define constant
+GATE_WIDTH = 160                    # frames are compared at this width
+BLUR_SIZE = 5
+PIXEL_THRESHOLD = 25                # gray level change that counts a pixel as moving
+MOTION_THRESHOLD = 0.01             # fraction of moving pixels in the ROI that wakes the detector
+HOLD_OFF_FRAMES = 15                # frames still passed after the last motion, so a vehicle that stops is read
+LEARNING_RATE = 0.05                # how fast the background adapts to light changes
+
+
+def parse_roi(text):
+    # "x,y,w,h" in pixels of the source frame
+    roi = tuple(int(value) for value in text.split(","))
+    if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+        raise ValueError("roi must be x,y,w,h with a positive width and height, not %r" % text)
+
+    return roi
+# end function
+
+
+def clip_roi(roi, frame_width, frame_height):
+    # the (left, top, right, bottom) part of an x,y,w,h roi inside the frame, an error if there is none
+    x, y, w, h = roi
+
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + w, frame_width), min(y + h, frame_height)
+    if right <= left or bottom <= top:
+        raise ValueError("roi %d,%d,%d,%d lies outside the %dx%d frame" % (x, y, w, h, frame_width, frame_height))
+
+    return left, top, right, bottom
+# end function
+
+
+class MotionGate:
+    '''
+        decides per frame whether the detector needs to see it. the ROI of
+        a downscaled gray copy is compared against a running average
+        background; frames pass while enough of it changes and for
+        hold_off frames afterwards, everything else is skipped
+    '''
+
+    def __init__(self, roi = None, threshold = MOTION_THRESHOLD, hold_off = HOLD_OFF_FRAMES,
+                 pixel_threshold = PIXEL_THRESHOLD, width = GATE_WIDTH, learning_rate = LEARNING_RATE):
+        self.roi = roi
+        self.threshold = threshold
+        self.hold_off = hold_off
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.learning_rate = learning_rate
+
+        self.frame_roi = None                   # the roi clipped to the frame, as slices
+        self.frame_shape = None
+
+        self.background = None
+        self.hold = 0
+        self.activity = 0.0
+        self.passed = 0
+        self.skipped = 0
+    # end constructor
+
+    def clip_roi(self, frame):
+        # the part of the roi inside the frame, worked out on the first frame and whenever the frame size changes
+        left, top, right, bottom = clip_roi(self.roi, frame.shape[1], frame.shape[0])
+
+        self.frame_roi = (slice(top, bottom), slice(left, right))
+        self.frame_shape = frame.shape[:2]
+    # end function
+
+    def small_gray(self, frame):
+        img = frame
+        if self.roi is not None:
+            if self.frame_shape != frame.shape[:2]:
+                self.clip_roi(frame)
+            img = frame[self.frame_roi]
+
+        scale = self.width / float(img.shape[1])
+        if scale < 1.0:
+            # nearest is ~30x cheaper than area on full HD frames, the blur below takes out its aliasing
+            img = cv2.resize(img, None, fx = scale, fy = scale, interpolation = cv2.INTER_NEAREST)
+
+        img_grayscale = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+        return cv2.GaussianBlur(img_grayscale, (BLUR_SIZE, BLUR_SIZE), 0)
+    # end function
+
+    def check(self, frame):
+        # return True if the frame should go to the detector
+        img_grayscale = self.small_gray(frame)
+
+        if self.background is None or self.background.shape != img_grayscale.shape:
+            self.background = img_grayscale.astype(np.float32)
+            self.hold = self.hold_off                                   # nothing to compare with yet
+            self.passed += 1
+            return True
+
+        img_diff = cv2.absdiff(img_grayscale, cv2.convertScaleAbs(self.background))
+        threshold_value, img_moving = cv2.threshold(img_diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        self.activity = cv2.countNonZero(img_moving) / float(img_moving.size)
+
+        cv2.accumulateWeighted(img_grayscale, self.background, self.learning_rate)
+
+        if self.activity >= self.threshold:
+            self.hold = self.hold_off
+        elif self.hold > 0:
+            self.hold -= 1
+        else:
+            self.skipped += 1
+            return False
+
+        self.passed += 1
+        return True
+    # end function
+
+    def skip_rate(self):
+        total = self.passed + self.skipped
+        return self.skipped / float(total) if total > 0 else 0.0
+
+# end class
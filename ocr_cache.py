@@ -0,0 +1,110 @@
+import time
+import threading
+import numpy as np
+import cv2
+
+import metrics as Metrics
+
+# define constant
+HASH_WIDTH = 64                     # crops are hashed at this size, about the aspect of a bike plate
+HASH_HEIGHT = 48
+HASH_ROWS = 24                      # lowest DCT frequencies kept, HASH_ROWS x HASH_COLS = 768 bits
+HASH_COLS = 32
+HASH_BYTES = HASH_ROWS * HASH_COLS // 8
+
+MAX_DISTANCE = 64                   # differing bits between two crops of one standing plate, other plates differ by 170+
+MAX_ENTRIES = 256
+TTL = 10.0                          # seconds a reading is reused, so a new vehicle at the barrier is read afresh
+
+
+def perceptual_hash(img):
+    '''
+        DCT hash of a plate crop: every kept frequency of the downscaled
+        gray crop is one bit, set when it is above their median. sensor
+        noise and a pixel of box jitter flip a few dozen bits, another
+        plate number several hundred
+    '''
+    img_grayscale = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    img_small = cv2.resize(img_grayscale, (HASH_WIDTH, HASH_HEIGHT), interpolation = cv2.INTER_AREA)
+
+    npaFrequencies = cv2.dct(img_small.astype(np.float32))[:HASH_ROWS, :HASH_COLS].reshape(-1)
+
+    # the first one is the mean brightness, it would skew the median
+    return np.packbits(npaFrequencies > np.median(npaFrequencies[1:]))
+# end function
+
+
+class OcrCache:
+    '''
+        OCR results by perceptual hash of the crop they were read from. a
+        lookup returns the result of the nearest cached crop within
+        max_distance bits that was stored by the same owner (e.g. a track);
+        entries expire ttl seconds after they were read and the least
+        recently used one makes room when the cache is full
+    '''
+
+    def __init__(self, max_entries = MAX_ENTRIES, ttl = TTL, max_distance = MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+
+        self.npaHashes = np.zeros((max_entries, HASH_BYTES), dtype = np.uint8)
+        self.npaStored = np.zeros(max_entries, dtype = np.float64)      # when every slot was read
+        self.npaLastUsed = np.zeros(max_entries, dtype = np.float64)
+        self.npaUsed = np.zeros(max_entries, dtype = bool)
+        self.results = [None] * max_entries
+        self.owners = [None] * max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    # end constructor
+
+    def lookup(self, img_hash, owner = None):
+        # return (True, result) of a near-identical crop the owner stored, or (False, None)
+        with self.lock:
+            now = time.time()
+            self.npaUsed &= self.npaStored > now - self.ttl              # drop expired entries
+
+            npaOwned = np.array([stored_owner == owner for stored_owner in self.owners])
+            npaSlots = np.flatnonzero(self.npaUsed & npaOwned)
+            if len(npaSlots) > 0:
+                # XOR + popcount against every live entry, keeping the nearest
+                npaDistances, npaNearest = cv2.batchDistance(img_hash[np.newaxis], self.npaHashes[npaSlots], cv2.CV_32S,
+                                                             normType = cv2.NORM_HAMMING, K = 1)
+
+                slot = int(npaSlots[npaNearest[0, 0]])
+                if npaDistances[0, 0] <= self.max_distance:
+                    self.npaLastUsed[slot] = now
+                    self.hits += 1
+                    Metrics.inc("ocr_cache_total", help="OCR cache lookups by outcome", outcome="hit")
+                    return True, self.results[slot]
+
+            self.misses += 1
+            Metrics.inc("ocr_cache_total", help="OCR cache lookups by outcome", outcome="miss")
+            return False, None
+    # end function
+
+    def store(self, img_hash, result, owner = None):
+        with self.lock:
+            npaFree = np.flatnonzero(~self.npaUsed)
+            slot = int(npaFree[0]) if len(npaFree) > 0 else int(np.argmin(self.npaLastUsed))
+
+            now = time.time()
+            self.npaHashes[slot] = img_hash
+            self.npaStored[slot] = now
+            self.npaLastUsed[slot] = now
+            self.npaUsed[slot] = True
+            self.results[slot] = result
+            self.owners[slot] = owner
+    # end function
+
+    def size(self):
+        with self.lock:
+            return int(self.npaUsed.sum())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total > 0 else 0.0
+
+# end class
@@ -0,0 +1,175 @@
+import os
+import queue
+import signal
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+import detect_characters as DetectCharacters
+import metrics as Metrics
+
+# define constant
+SLOT_SIZE = 1 << 20                     # bytes per ring slot, larger crops are pickled instead
+JOB_TIMEOUT = 30.0                      # seconds a crop may take before its worker is taken for dead or hung
+POLL_INTERVAL = 0.1                     # seconds between checks on a job that has not finished
+
+# define global varialbles, set in every worker by init_worker
+worker_ring = None
+
+
+def parse_cpu_list(text):
+    # "0,2,4-7" -> [0, 2, 4, 5, 6, 7]
+    list_of_cpus = []
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            list_of_cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            list_of_cpus.append(int(part))
+
+    return list_of_cpus
+# end function
+
+
+def init_worker(ring_name, classifier, metrics_enabled, list_of_cpus, worker_counter):
+    '''
+        runs once in every pool process: attach the crop ring, pin the
+        process to its cpu and train the char classifier from the compiled,
+        memory-mapped model, so workers never rely on state inherited by fork
+    '''
+    global worker_ring
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)                        # ctrl-c is for the parent, it closes the pool
+
+    worker_ring = shared_memory.SharedMemory(name = ring_name)          # the parent owns and unlinks it
+
+    if list_of_cpus and hasattr(os, "sched_setaffinity"):
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        cpu = list_of_cpus[index % len(list_of_cpus)]
+        try:
+            os.sched_setaffinity(0, [cpu])
+        except OSError as e:
+            print("warning, unable to pin OCR worker %d to cpu %d: %s\n" % (os.getpid(), cpu, e))
+
+    if metrics_enabled:
+        Metrics.enable()
+
+    if DetectCharacters.load_data_and_train(classifier) == False:
+        print("\nerror: Traning was not successful in OCR worker %d\n" % os.getpid())
+# end function
+
+
+def run_in_slot(func, offset, shape, dtype):
+    # worker side: call func on the image in a ring slot, without copying it out
+    img = np.ndarray(shape, dtype = dtype, buffer = worker_ring.buf, offset = offset)
+    img.flags.writeable = False
+
+    try:
+        return func(img)
+    finally:
+        del img                                                         # no view may outlive the call
+# end function
+
+
+class OcrPool:
+    '''
+        process pool for OCR. every worker loads the classifier once in its
+        initializer, and crops travel through a ring of shared memory slots
+        (one per in-flight job) instead of being pickled. works with the
+        fork, forkserver and spawn start methods. a job that does not
+        finish within timeout seconds, because its worker died or hangs,
+        raises and the workers are replaced
+    '''
+
+    def __init__(self, workers = None, classifier = "knn", slot_size = SLOT_SIZE, slots = None,
+                 list_of_cpus = None, start_method = None, timeout = JOB_TIMEOUT):
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.classifier = classifier
+        self.slot_size = slot_size
+        self.slots = slots or self.workers
+        self.list_of_cpus = list_of_cpus or []
+        self.context = multiprocessing.get_context(start_method)
+
+        self.ring = shared_memory.SharedMemory(create = True, size = self.slot_size * self.slots)
+        self.free_slots = queue.Queue()
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+
+        self.lock = threading.Lock()
+        self.pool = self.create_pool()
+    # end constructor
+
+    def create_pool(self):
+        worker_counter = self.context.Value("i", 0)
+        return self.context.Pool(self.workers, initializer = init_worker,
+                                 initargs = (self.ring.name, self.classifier, Metrics.ENABLED,
+                                             self.list_of_cpus, worker_counter))
+    # end function
+
+    def apply(self, func, img):
+        # call func(img) in a worker and return its result; func must not return img itself
+        img = np.ascontiguousarray(img)
+
+        with self.lock:
+            pool = self.pool
+
+        if img.nbytes > self.slot_size:
+            Metrics.inc("ocr_pool_pickled_total", help="crops too large for a ring slot")
+            return self.wait(pool, pool.apply_async(func, (img,)))
+
+        slot = self.free_slots.get()
+        try:
+            offset = slot * self.slot_size
+            npaSlot = np.ndarray(img.shape, dtype = img.dtype, buffer = self.ring.buf, offset = offset)
+            npaSlot[...] = img
+            del npaSlot
+
+            # a slot is only reused once its job finished or the workers that could still read it are gone
+            return self.wait(pool, pool.apply_async(run_in_slot, (func, offset, img.shape, img.dtype.str)))
+        finally:
+            self.free_slots.put(slot)
+    # end function
+
+    def wait(self, pool, async_result):
+        # the result of a job, or an error once the job is given up on
+        deadline = time.time() + self.timeout
+
+        while not async_result.ready():
+            async_result.wait(POLL_INTERVAL)
+
+            if self.pool is not pool:
+                raise RuntimeError("the OCR workers were restarted while the job ran")
+            if time.time() > deadline and not async_result.ready():
+                # a worker that dies (segfault, OOM killer) takes its job with it, the pool never answers
+                self.restart(pool)
+                raise RuntimeError("no OCR result after %.0f seconds, the OCR workers were restarted" % self.timeout)
+
+        return async_result.get()
+    # end function
+
+    def restart(self, broken_pool):
+        # replace the workers of broken_pool, unless another job already did
+        with self.lock:
+            if self.pool is not broken_pool:
+                return
+            self.pool = self.create_pool()
+
+        Metrics.inc("ocr_pool_restarts_total", help="times the OCR workers were replaced after a job got lost")
+        broken_pool.terminate()
+        broken_pool.join()
+    # end function
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.ring.close()
+        self.ring.unlink()
+    # end function
+
+# end class
@@ -0,0 +1,280 @@
+import queue
+import threading
+import time
+
+# define constant
+DROP_OLDEST = "latest"          # a full queue evicts its oldest item, so the latest frame wins
+BLOCK = "block"                 # a full queue blocks the producer until there is room
+
+DROP_POLICIES = (DROP_OLDEST, BLOCK)
+
+POLL_INTERVAL = 0.1             # seconds a stage waits on its input before checking for shutdown
+
+STOP = object()                 # returned by StageQueue.get once the queue is closed and drained
+
+
+class StageQueue:
+    '''
+        bounded queue between two stages. when it is full, put either drops
+        the oldest item (DROP_OLDEST) or waits for room (BLOCK). on_drop is
+        called with every item that is dropped or discarded, so whoever
+        handed it out can take it back
+    '''
+
+    def __init__(self, name, maxsize = 1, policy = DROP_OLDEST, on_drop = None):
+        if policy not in DROP_POLICIES:
+            raise ValueError("unknown drop policy %r, expected one of %s" % (policy, ", ".join(DROP_POLICIES)))
+
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+
+        self.queue = queue.Queue(maxsize)
+        self.closed = threading.Event()
+        self.lock = threading.Lock()
+
+        self.put_count = 0
+        self.dropped = 0
+    # end constructor
+
+    def put(self, item):
+        if self.policy == BLOCK:
+            while not self.closed.is_set():
+                try:
+                    self.queue.put(item, timeout = POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                if self.on_drop is not None:
+                    self.on_drop(item)
+                return False                                    # closed while waiting, item discarded
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        evicted = self.queue.get_nowait()       # make room by evicting the oldest item
+                    except queue.Empty:
+                        continue
+
+                    with self.lock:
+                        self.dropped += 1
+                    if self.on_drop is not None:
+                        self.on_drop(evicted)
+
+        with self.lock:
+            self.put_count += 1
+
+        return True
+    # end function
+
+    def get(self, timeout = POLL_INTERVAL):
+        # return the next item, None on timeout, or STOP once closed and drained
+        try:
+            return self.queue.get(timeout = timeout)
+        except queue.Empty:
+            if self.closed.is_set():
+                return STOP
+            return None
+    # end function
+
+    def close(self):
+        self.closed.set()
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.depth(),
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "put": self.put_count,
+                "dropped": self.dropped
+            }
+    # end function
+
+# end class
+
+
+class Stage:
+    '''
+        runs func on every item of the input queue in one or more threads.
+        func returns an iterable of items for the output queue (or None).
+        a stage without an input runs func() once and forwards everything
+        it yields, which is how sources such as a video decoder are built
+    '''
+
+    def __init__(self, name, func, input = None, output = None, workers = 1):
+        self.name = name
+        self.func = func
+        self.input = input
+        self.output = output
+        self.workers = workers if input is not None else 1
+
+        self.threads = []
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started_at = None
+        self.running_workers = 0
+    # end constructor
+
+    def start(self, stop_event = None):
+        if stop_event is not None:
+            self.stop_event = stop_event
+
+        self.started_at = time.time()
+        self.running_workers = self.workers
+
+        for i in range(self.workers):
+            thread = threading.Thread(target = self.run, name = "%s-%d" % (self.name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+    # end function
+
+    def run(self):
+        try:
+            if self.input is None:
+                self.run_source()
+            else:
+                self.run_worker()
+        finally:
+            with self.lock:
+                self.running_workers -= 1
+                last_worker = self.running_workers == 0
+
+            if last_worker and self.output is not None:
+                self.output.close()                             # let the next stage drain and finish
+    # end function
+
+    def run_source(self):
+        for item in self.func():
+            if self.stop_event.is_set():
+                if self.output is not None and self.output.on_drop is not None:
+                    self.output.on_drop(item)                   # never queued, hand it back like a dropped one
+                break
+
+            with self.lock:
+                self.processed += 1
+
+            self.emit((item,))
+    # end function
+
+    def run_worker(self):
+        while not self.stop_event.is_set():
+            item = self.input.get()
+
+            if item is STOP:
+                break
+            if item is None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.func(item)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                print("error in stage %s: %r" % (self.name, e))
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.processed += 1
+                    self.busy_time += elapsed
+            # end try
+
+            if results is not None:
+                self.emit(results)
+    # end function
+
+    def emit(self, results):
+        for result in results:
+            if self.output is not None:
+                self.output.put(result)
+
+            with self.lock:
+                self.emitted += 1
+    # end function
+
+    def join(self, timeout = None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.time() - self.started_at if self.started_at else 0.0
+
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "errors": self.errors,
+                "throughput": self.processed / elapsed if elapsed > 0 else 0.0,
+                "busy": self.busy_time / (elapsed * self.workers) if elapsed > 0 else 0.0,
+                "queue_depth": self.input.depth() if self.input is not None else 0
+            }
+    # end function
+
+# end class
+
+
+class Pipeline:
+
+    def __init__(self):
+        self.stages = []
+        self.queues = []
+        self.stop_event = threading.Event()
+    # end constructor
+
+    def queue(self, name, maxsize = 1, policy = DROP_OLDEST, on_drop = None):
+        stage_queue = StageQueue(name, maxsize, policy, on_drop)
+        self.queues.append(stage_queue)
+        return stage_queue
+    # end function
+
+    def stage(self, name, func, input = None, output = None, workers = 1):
+        stage = Stage(name, func, input, output, workers)
+        self.stages.append(stage)
+        return stage
+    # end function
+
+    def start(self):
+        for stage in self.stages:
+            stage.start(self.stop_event)
+
+    def stop(self):
+        self.stop_event.set()
+        for stage_queue in self.queues:
+            stage_queue.close()
+    # end function
+
+    def join(self, timeout = None):
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def is_running(self):
+        return not self.stop_event.is_set() and any(stage.is_alive() for stage in self.stages)
+
+    def stats(self):
+        return {
+            "stages": {stage.name: stage.stats() for stage in self.stages},
+            "queues": {stage_queue.name: stage_queue.stats() for stage_queue in self.queues}
+        }
+    # end function
+
+# end class
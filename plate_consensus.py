@@ -0,0 +1,147 @@
+import math
+import time
+from collections import deque
+
+# define constant
+DISTANCE_SCALE = 120 * 255 ** 2     # KNN distance (about 120 wrong pixels of 600) at which a char's confidence is 1/e
+COMMIT_CONFIDENCE = 1.2             # lead every char needs over its runner-up before the plate is accepted
+MIN_READINGS = 2                    # a single reading is never accepted on its own
+MAX_READINGS = 20                   # older readings are forgotten first
+READING_TTL = 10.0                  # seconds a reading counts towards the vote
+
+PREFIX_LENGTH = 4                   # \d{2}[A-Z]\d on the top row, 4 or 5 digits follow
+
+
+def distance_to_confidence(distance):
+    return math.exp(-distance / DISTANCE_SCALE)
+
+
+class PlateConsensus:
+    '''
+        votes on the plate number character by character. every reading
+        adds the confidence of each of its chars (from the KNN distance) to
+        that char at that position; readings of another length than the
+        winning one are aligned to it first. a plate is accepted as soon as
+        every position has a clear enough winner
+    '''
+
+    def __init__(self):
+        self.readings = deque(maxlen = MAX_READINGS)
+    # end constructor
+
+    def add(self, license_plate_number, list_of_char_distances, timestamp = None):
+        # add a reading and return the accepted plate number, or None if it is not clear yet
+        now = time.time() if timestamp is None else timestamp
+
+        if len(list_of_char_distances) == len(license_plate_number):
+            list_of_confidences = [distance_to_confidence(distance) for distance in list_of_char_distances]
+        else:
+            list_of_confidences = [distance_to_confidence(DISTANCE_SCALE)] * len(license_plate_number)
+
+        self.readings.append((now, license_plate_number, list_of_confidences))
+        self.expire(now)
+
+        license_plate_number = self.accepted_plate()
+        if license_plate_number is not None:
+            self.readings.clear()
+
+        return license_plate_number
+    # end function
+
+    def expire(self, now):
+        while len(self.readings) > 0 and now - self.readings[0][0] > READING_TTL:
+            self.readings.popleft()
+
+    def votes(self):
+        # return the winning length, the votes per length and the votes per position for that length
+        length_votes = {}
+        for timestamp, license_plate_number, list_of_confidences in self.readings:
+            length = len(license_plate_number)
+            length_votes[length] = length_votes.get(length, 0.0) + sum(list_of_confidences) / max(length, 1)
+
+        length = max(length_votes, key = length_votes.get)
+        position_votes = [{} for i in range(length)]
+
+        # readings of the winning length vote first, the others are aligned to their leader
+        for timestamp, license_plate_number, list_of_confidences in self.readings:
+            if len(license_plate_number) == length:
+                for position, (char, confidence) in enumerate(zip(license_plate_number, list_of_confidences)):
+                    position_votes[position][char] = position_votes[position].get(char, 0.0) + confidence
+
+        leader = "".join(max(votes, key = votes.get) if votes else "?" for votes in position_votes)
+
+        for timestamp, license_plate_number, list_of_confidences in self.readings:
+            if len(license_plate_number) != length:
+                for position, char, confidence in align(license_plate_number, list_of_confidences, leader):
+                    position_votes[position][char] = position_votes[position].get(char, 0.0) + confidence
+
+        return length, length_votes, position_votes
+    # end function
+
+    def accepted_plate(self):
+        if len(self.readings) < MIN_READINGS:
+            return None
+
+        length, length_votes, position_votes = self.votes()
+
+        if lead(length_votes) < COMMIT_CONFIDENCE and len(length_votes) > 1:
+            return None
+
+        for votes in position_votes:
+            if lead(votes) < COMMIT_CONFIDENCE:
+                return None
+
+        return "".join(max(votes, key = votes.get) for votes in position_votes)
+    # end function
+
+# end class
+
+
+def lead(votes):
+    # how far the best entry is ahead of the second best
+    if len(votes) == 0:
+        return 0.0
+
+    ordered = sorted(votes.values(), reverse = True)
+    return ordered[0] - (ordered[1] if len(ordered) > 1 else 0.0)
+# end function
+
+
+def align(license_plate_number, list_of_confidences, leader):
+    '''
+        map a reading onto the positions of a leader of another length: the
+        top row prefix lines up directly, the digits after it are shifted
+        to wherever they agree with the leader the most
+    '''
+    list_of_positions = []
+
+    prefix_length = min(PREFIX_LENGTH, len(license_plate_number), len(leader))
+    for position in range(prefix_length):
+        list_of_positions.append((position, license_plate_number[position], list_of_confidences[position]))
+
+    suffix = license_plate_number[prefix_length:]
+    leader_suffix = leader[prefix_length:]
+    shorter, longer = sorted((len(suffix), len(leader_suffix)))
+
+    best_offset = 0
+    best_agreement = -1
+    for offset in range(longer - shorter + 1):
+        if len(suffix) <= len(leader_suffix):
+            agreement = sum(1 for i, char in enumerate(suffix) if leader_suffix[offset + i] == char)
+        else:
+            agreement = sum(1 for i, char in enumerate(leader_suffix) if suffix[offset + i] == char)
+
+        if agreement > best_agreement:
+            best_offset, best_agreement = offset, agreement
+
+    for i in range(shorter):
+        if len(suffix) <= len(leader_suffix):
+            reading_index, leader_index = i, best_offset + i
+        else:
+            reading_index, leader_index = best_offset + i, i
+
+        list_of_positions.append((prefix_length + leader_index,
+                                  suffix[reading_index], list_of_confidences[prefix_length + reading_index]))
+
+    return list_of_positions
+# end function
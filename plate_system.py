@@ -1,35 +1,38 @@
-from darkflow.net.build import TFNet
-from collections import Counter
-from multiprocessing import Pool
-from PIL import Image
-from io import BytesIO
+import multiprocessing
 import numpy as np
 import cv2
 import time
 import os
+import sys
 import re
 import argparse
-import requests
-import json
 
 import detect_characters as DetectCharacters
 import detect_plates as DetectPlates
+import preprocess as Preprocess
 import possible_plate as PossiblePlate
+import pipeline as Pipeline
+import detector as Detector
+import lanes as Lanes
+import metrics as Metrics
+import tracker as Tracker
+import plate_consensus as PlateConsensus
+import motion_gate as MotionGate
+import frame_scheduler as FrameScheduler
+import ocr_pool as OcrPool
+import ocr_cache as OcrCache
+import frame_ring as FrameRing
+import recording as Recording
+import publisher as Publisher
 
 # define constant
 BASE_URL = "http://5f7fe4bb.ngrok.io"
 URL_CHECK_IN = BASE_URL + "/api/records/check-in"
 URL_CHECK_OUT = BASE_URL + "/api/records/check-out"
-URL_IMAGE = BASE_URL + "/api/photos/raw/%s"
 CONFIDENCE_RATE = 0.3
-LICENSE_PLATE_COUNT = 3
-
-# define global varialbles
-processing = False
-licensePlate = []
-displayPlate = False
-plateToDisplay = None
-last_sent_plate = None
+DISPLAY_SCALE = 0.25                # lanes are shown at this fraction of the camera resolution
+FRAMES_IN_FLIGHT = 4                # frames of a lane outside its frame queue: decoding, gathered, batched, detected;
+                                    # a lane whose ring buffers are all still in use waits for one to be released
 
 # define the model options for YOLO and run
 options = {
@@ -43,6 +46,23 @@ def process_image(img_plate):
     list_of_possible_plates = DetectPlates.detect_plates_in_image(img_plate)
     list_of_possible_plates = DetectCharacters.detect_chars_in_plates(list_of_possible_plates)
 
+    return read_plate_number(list_of_possible_plates, img_plate)
+# end funtion
+
+
+def process_image_with_metrics(img_plate):
+    # runs in a pool process: also return the stage timings recorded there, but not the image, the caller has it
+    result = process_image(img_plate)
+    if result != False:
+        license_plate_number, img_plate, list_of_char_distances = result
+        result = (license_plate_number, None, list_of_char_distances)
+
+    return result, Metrics.drain() if Metrics.ENABLED else None
+# end function
+
+
+def read_plate_number(list_of_possible_plates, img_plate):
+    # join the rows read from the plate into one number and check its pattern
     if len(list_of_possible_plates) == 0:
         return False
     else:
@@ -50,14 +70,18 @@ def process_image(img_plate):
         list_of_possible_plates.sort(key = lambda possible_plate: len(possible_plate.strChars), reverse = True)
 
         license_plate_number = ''
+        list_of_char_distances = []                                     # KNN distance of every char of the number
         for list_of_possible_plate in list_of_possible_plates:
             if len(list_of_possible_plate.strChars) > 0:
                 if re.match(r'\d{5}', list_of_possible_plate.strChars):
                     license_plate_number += list_of_possible_plate.strChars
+                    list_of_char_distances = list_of_char_distances + list_of_possible_plate.charDistances
                 elif re.match(r'(?<!\d)\d{4}(?!\d)$', list_of_possible_plate.strChars):
                     license_plate_number += list_of_possible_plate.strChars
+                    list_of_char_distances = list_of_char_distances + list_of_possible_plate.charDistances
                 elif re.match(r'\d{2}[A-Z]\d', list_of_possible_plate.strChars):
                     license_plate_number = ''.join((list_of_possible_plate.strChars, license_plate_number))
+                    list_of_char_distances = list_of_possible_plate.charDistances + list_of_char_distances
 
         if len(license_plate_number) == 0:
             return False
@@ -66,64 +90,403 @@ def process_image(img_plate):
 
     # return true if license plate number is writen in right patten
     if re.match(r'\d{2}[A-Z]\d\d{5}', license_plate_number) or re.match(r'\d{2}[A-Z]\d\d{4}', license_plate_number):
-        if license_plate_number == last_sent_plate:
-            return False
-        else:
-            return license_plate_number, img_plate
+        return license_plate_number, img_plate, list_of_char_distances
     else:
         return False
-# end funtion
+# end function
+
+
+def crop_plate(frame, result):
+    # cut a detected plate out of the frame and bring it to the plate height OCR works at
+    h = result['bottomright']['y'] - result['topleft']['y']
+    w = result['bottomright']['x'] - result['topleft']['x']
+    crop_img = frame[
+        result['topleft']['y']:result['topleft']['y']+h, result['topleft']['x']:result['topleft']['x']+w]
+    if crop_img.size == 0:
+        return None
+
+    resized_crop, scale = Preprocess.resize_to_height(crop_img, DetectPlates.PLATE_HEIGHT)
+    if scale == 1.0:
+        resized_crop = resized_crop.copy()                              # not a view of a frame buffer that gets reused
+    return resized_crop
+# end function
+
+
+def read_frames(lane):
+    '''
+        source stage: decode frames of one lane until its video ends, each
+        into the next free buffer of the lane's frame ring instead of a new
+        array; the buffer is held until the detect stage is done with it or
+        a queue drops it. frames the lane's scheduler has no time for are
+        grab()bed without decoding, idle ones are dropped if the lane is
+        motion gated
+    '''
+    capture = lane.capture
+    frame_index = 0
+
+    while capture.isOpened():
+        if lane.scheduler is not None:
+            while not lane.scheduler.wait_for_detector(Pipeline.POLL_INTERVAL):
+                if lane.frame_queue.closed.is_set():
+                    return
+
+            skip = lane.scheduler.frames_to_skip()
+            if skip > 0:
+                with Metrics.timed("grab"):
+                    grabbed = all(capture.grab() for i in range(skip))
+                Metrics.inc("scheduler_skipped_frames_total", skip, help="frames grabbed without decoding to keep up",
+                            lane=lane.name)
+                lane.scheduler.skipped += skip
+                frame_index += skip
+                if not grabbed:
+                    break
+
+        slot, buffer = lane.frame_ring.claim(Pipeline.POLL_INTERVAL)
+        while slot is None:                                             # every buffer is still in use downstream
+            if lane.frame_queue.closed.is_set():
+                return
+            slot, buffer = lane.frame_ring.claim(Pipeline.POLL_INTERVAL)
+
+        with Metrics.timed("decode"):
+            ret, frame = capture.read(buffer)
+        if not ret:
+            break
+        timestamp = time.time()
+        lane.frame_ring.publish(slot, frame, timestamp)
+
+        if lane.scheduler is not None:
+            lane.scheduler.frame_read()
+
+        if lane.motion_gate is not None:
+            with Metrics.timed("motion_gate"):
+                moving = lane.motion_gate.check(frame)
+            Metrics.inc("motion_gate_frames_total", help="frames the motion gate passed or skipped",
+                        lane=lane.name, outcome="passed" if moving else "skipped")
+            if not moving:
+                if lane.scheduler is not None:
+                    lane.scheduler.frame_dropped()
+                frame_index += 1
+                continue
+
+        lane.frame_ring.hold(slot)
+        yield frame_index, frame, timestamp, slot
+        frame_index += 1
+# end function
+
+
+def gather_frames(list_of_lanes, max_batch_size):
+    # source stage: take the newest frame of every lane that has one, so the detector sees them in one batch
+    active_lanes = list(list_of_lanes)
+
+    while len(active_lanes) > 0:
+        batch = []
+
+        for lane in list(active_lanes):
+            item = lane.frame_queue.get(timeout=0)
+            if item is Pipeline.STOP:
+                active_lanes.remove(lane)
+            elif item is not None:
+                frame_index, frame, timestamp, slot = item
+                batch.append((lane, frame_index, frame, timestamp, slot))
+
+            if len(batch) >= max_batch_size:
+                break
+
+        if len(batch) > 0:
+            yield batch
+        else:
+            time.sleep(0.005)                                           # nothing decoded yet
+# end function
+
+
+def release_frames(batch):
+    # hand the buffers of a batch's frames back to their lanes' frame rings
+    for lane, frame_index, frame, timestamp, slot in batch:
+        lane.frame_ring.release(slot)
+# end function
+
+
+def scale_result(result, factor):
+    # a detector result with its box scaled, e.g. back to the full frame
+    scaled = dict(result)
+    scaled['topleft'] = {'x': int(result['topleft']['x'] * factor), 'y': int(result['topleft']['y'] * factor)}
+    scaled['bottomright'] = {'x': int(result['bottomright']['x'] * factor), 'y': int(result['bottomright']['y'] * factor)}
+
+    return scaled
+# end function
 
 
-def mycallback(result):
-    global processing
-    global displayPlate
-    global plateToDisplay
+def detector_input_scale(frame, detector_width):
+    # scale that brings a frame down to the detector input width, 1 if it is narrower or the width is not set
+    if detector_width <= 0 or frame.shape[1] <= detector_width:
+        return 1.0
+    return detector_width / float(frame.shape[1])
+# end function
+
+
+def detect_plates_in_frames(detector, colors, display_queue, recorder, detector_width, batch):
+    # detect stage: find plates in a batch of frames, queue their crops for OCR and the annotated frames for display
+    start_time = time.time()
+
+    try:
+        # the detector sees a copy at most detector_width wide, smaller still for lanes whose scheduler is behind;
+        # boxes are mapped back to the full frame, which crops are cut from
+        list_of_scales = [detector_input_scale(frame, detector_width) *
+                          (lane.scheduler.detector_scale() if lane.scheduler is not None else 1.0)
+                          for lane, frame_index, frame, timestamp, slot in batch]
+        # linear like the detector's own resize to its network input; INTER_AREA takes 15-35 ms on a 4K frame
+        list_of_inputs = [frame if scale >= 1.0
+                          else cv2.resize(frame, None, fx=scale, fy=scale, interpolation = cv2.INTER_LINEAR)
+                          for (lane, frame_index, frame, timestamp, slot), scale in zip(batch, list_of_scales)]
+
+        with Metrics.timed("yolo"):
+            list_of_results = detector.predict_batch(list_of_inputs)                               # plate detection
+
+        list_of_results = [results if scale >= 1.0 else [scale_result(result, 1.0 / scale) for result in results]
+                           for results, scale in zip(list_of_results, list_of_scales)]
+
+        list_of_crops = []
+        for (lane, frame_index, frame, timestamp, slot), results in zip(batch, list_of_results):
+            if recorder is not None:
+                for result in results:
+                    if result['confidence'] <= CONFIDENCE_RATE:
+                        recorder.write(lane.name, frame_index, timestamp, result)     # no crop is cut for these
+
+            # only confident boxes are tracked, and only tracks due a read get OCR
+            results = [result for result in results if result['confidence'] > CONFIDENCE_RATE]
+            list_of_tracks = lane.tracker.update([Tracker.box_from_result(result) for result in results], frame_index)
+
+            for result, track in zip(results, list_of_tracks):
+                resized_crop = crop_plate(frame, result)
+                if recorder is not None:
+                    recorder.write(lane.name, frame_index, timestamp, result, resized_crop)
+                if resized_crop is None:
+                    continue
+
+                job = lane.tracker.offer_crop(track, resized_crop, frame_index, timestamp)
+                if job is not None:
+                    list_of_crops.append((lane, track, job))
+
+            # resize frame, boxes are drawn on the display copy so the full frame is left untouched
+            resized = cv2.resize(frame, None, fx=DISPLAY_SCALE, fy=DISPLAY_SCALE, interpolation = cv2.INTER_AREA)
+
+            for color, result, track in zip(colors, results, list_of_tracks):
+                # draw box on plate
+                shown = scale_result(result, DISPLAY_SCALE)
+                tl = (shown['topleft']['x'], shown['topleft']['y'])
+                br = (shown['bottomright']['x'], shown['bottomright']['y'])
+                resized = cv2.rectangle(resized, tl, br, color, 2)
+                text = '#%d %s, %.2f' % (track.id, track.plate_number or result['label'], result['confidence'])
+                resized = cv2.putText(resized, text, tl, cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
+
+            display_queue.put((lane, resized))
+
+        return list_of_crops
+    finally:
+        # a batch the detector failed on is done with too, or its lanes would wait for it
+        end_time = time.time()
+        for lane, frame_index, frame, timestamp, slot in batch:
+            if lane.scheduler is not None:
+                lane.scheduler.record(end_time - start_time, end_time - timestamp)
+
+        release_frames(batch)                                           # crops and the display copy do not share them
+    # end try
+# end function
+
+
+def read_crop(pool, ocr_cache, resized_crop, owner = None):
+    # OCR one crop in the pool, unless the owner read a near-identical crop moments ago; return the result and if it was cached
+    if ocr_cache is not None:
+        with Metrics.timed("ocr_cache"):
+            img_hash = OcrCache.perceptual_hash(resized_crop)
+            hit, result = ocr_cache.lookup(img_hash, owner)
+        if hit:
+            return result, True
+
+    result, metrics_delta = pool.apply(process_image_with_metrics, resized_crop)
+    Metrics.merge(metrics_delta)
+
+    if ocr_cache is not None:
+        ocr_cache.store(img_hash, result, owner)
 
-    if result[0] != False:
-        license_plate_number, imgPlate = result[0][0], result[0][1]
+    return result, False
+# end function
+
+
+def recognize_plate(pool, ocr_cache, item):
+    # OCR stage: read the plate number of one track in one of the shared pool processes
+    lane, track, (resized_crop, crop_timestamp) = item
+
+    try:
+        with Metrics.timed("ocr"):
+            # only the track's own readings are reused, OCR of a near-identical crop would read the same
+            result, cached = read_crop(pool, ocr_cache, resized_crop, (lane.name, track.id))
+    finally:
+        lane.tracker.ocr_finished(track)
+
+    Metrics.inc("ocr_results_total", help="OCR attempts by outcome",
+                outcome="cached" if cached else "fail" if result == False else "success")
+    if result == False:
+        return None
 
-        if addPossiblePlate(license_plate_number):
-            displayPlate = True
-            plateToDisplay = (license_plate_number, imgPlate)
+    license_plate_number, img_plate, list_of_char_distances = result
 
-    processing = False
+    return ((lane, track, (license_plate_number, resized_crop, list_of_char_distances, crop_timestamp)),)
 # end function
 
 
-# check if plate number read from plate is constant
-def addPossiblePlate(license_plate_number):
-    global licensePlate
+def publish_plate(publisher, plate_queue, item):
+    # publish stage: vote on the reading and check the vehicle in or out once it is constant
+    lane, track, (license_plate_number, imgPlate, list_of_char_distances, crop_timestamp) = item
 
-    licensePlate.append(license_plate_number)
-    c = Counter(licensePlate)
+    if track.converged:
+        return None
 
-    if c.most_common(1)[0][1] >= LICENSE_PLATE_COUNT:
-        licensePlate = []
-        c.clear()
+    license_plate_number = track.voter.add(license_plate_number, list_of_char_distances)
+    if license_plate_number is None:
+        return None
 
-        return True
+    lane.tracker.converge(track, license_plate_number)                  # no more OCR for this vehicle
+
+    if license_plate_number == lane.last_plate_number:
+        return None                                                     # the same vehicle on a new track, sent already
+    lane.last_plate_number = license_plate_number
+
+    print(lane.name, {"plateNumber": license_plate_number})
+    resized_cam = None
+    if lane.mode == "out":
+        publisher.check_out(license_plate_number)
     else:
-        return False
+        # the driver as the camera saw them when the crop that completed the vote was decoded
+        frame_cam = lane.driver_photo(crop_timestamp)
+        if frame_cam is not None:
+            resized_cam = cv2.resize(frame_cam, None, fx=0.25, fy=0.25, interpolation = cv2.INTER_AREA)
+
+        publisher.check_in(license_plate_number, imgPlate, resized_cam)    # sent in the background
+
+    plate_queue.put((lane, imgPlate, resized_cam))
+
+    return None
+# end function
+
+
+def plate_published(event, r):
+    # called by the publisher thread once the server accepted a check-in/out
+    print('server return code: ' + str(r.status_code))
 # end function
 
+
+def print_pipeline_stats(stats):
+    for name, stage_stats in stats["stages"].items():
+        print("%-16s processed %6d  %6.1f/s  busy %3.0f%%  queue %d" % (
+            name, stage_stats["processed"], stage_stats["throughput"],
+            100 * stage_stats["busy"], stage_stats["queue_depth"]))
+    for name, queue_stats in stats["queues"].items():
+        print("%-16s queue %d/%d  dropped %d" % (
+            name, queue_stats["depth"], queue_stats["maxsize"], queue_stats["dropped"]))
+# end function
+
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()                                      # setup argument
     ap.add_argument("-vid", "--video", type=str)                        # argument for load video
     ap.add_argument("-m", "--mode", type=str)
+    ap.add_argument("--detector", choices=Detector.BACKENDS, default="darkflow",
+                    help="plate detector backend, opencv runs the darknet cfg and weights without tensorflow")
+    ap.add_argument("--weights", type=str, default=Detector.DEFAULT_WEIGHTS,   # darknet weights for --detector opencv
+                    help="darknet weights file of the opencv detector")
+    ap.add_argument("--lanes", type=str,                                # serve several lanes instead of -vid
+                    help="lane config file, see lanes.example.json")
+    ap.add_argument("--frame-policy", choices=Pipeline.DROP_POLICIES, default=Pipeline.DROP_OLDEST,
+                    help="what decoding does when detection falls behind")
+    ap.add_argument("--ocr-policy", choices=Pipeline.DROP_POLICIES, default=Pipeline.DROP_OLDEST,
+                    help="what detection does when OCR falls behind")
+    ap.add_argument("--latency-budget", type=float, default=0,         # seconds from capture to detection, 0 to disable
+                    help="skip decoding and shrink the detector input to stay within this latency")
+    ap.add_argument("--min-detector-scale", type=float, default=1.0,    # 1 never shrinks the detector input
+                    help="smallest detector input scale the scheduler may choose")
+    ap.add_argument("--detector-width", type=int, default=0,           # 0 detects on the full frame
+                    help="width of the frame copy the detector runs on, crops are still cut at full resolution")
+    ap.add_argument("--motion-gate", action="store_true",              # only detect on frames with motion in the ROI
+                    help="skip detection on frames without motion")
+    ap.add_argument("--motion-threshold", type=float, default=MotionGate.MOTION_THRESHOLD,
+                    help="fraction of the ROI that must change to count as motion")
+    ap.add_argument("--motion-hold-off", type=int, default=MotionGate.HOLD_OFF_FRAMES,
+                    help="frames still detected after the last motion")
+    ap.add_argument("--roi", type=MotionGate.parse_roi, default=None,  # x,y,w,h of the -vid lane
+                    help="region of the frame watched for motion")
+    ap.add_argument("--queue-size", type=int, default=2)                # capacity of each stage queue
+    ap.add_argument("--ocr-workers", type=int, default=os.cpu_count())
+    ap.add_argument("--ocr-cpus", type=OcrPool.parse_cpu_list, default=None,   # e.g. 2-7, one cpu per worker in turn
+                    help="cpus to pin the OCR workers to")
+    ap.add_argument("--ocr-start-method", choices=multiprocessing.get_all_start_methods(), default=None)
+    ap.add_argument("--ocr-slot-size", type=int, default=OcrPool.SLOT_SIZE,   # bytes of shared memory per in-flight crop
+                    help="largest crop passed through shared memory")
+    ap.add_argument("--ocr-cache-size", type=int, default=OcrCache.MAX_ENTRIES,   # 0 reads every crop
+                    help="readings of recent crops kept to answer near-identical crops")
+    ap.add_argument("--ocr-cache-ttl", type=float, default=OcrCache.TTL,
+                    help="seconds a cached reading is reused")
+    ap.add_argument("--ocr-cache-distance", type=int, default=OcrCache.MAX_DISTANCE,
+                    help="differing hash bits up to which two crops count as the same")
+    ap.add_argument("--record", type=str,                               # replay with python recording.py replay
+                    help="append every detector result and its crop to this recording")
+    ap.add_argument("--record-encoding", choices=Recording.ENCODINGS, default="png",
+                    help="how recorded crops are stored, raw is ~20x bigger but read without decoding")
+    ap.add_argument("--stats-interval", type=float, default=0)          # seconds between stage stats, 0 to disable
+    ap.add_argument("--metrics-port", type=int, default=0,              # serve /metrics and /snapshot on localhost
+                    help="enable instrumentation and serve it on this port")
+    ap.add_argument("--classifier", choices=DetectCharacters.CLASSIFIERS, default="knn",
+                    help="char classifier, hamming matches bit-packed glyphs")
+    ap.add_argument("--outbox", type=str, default=Publisher.OUTBOX_DIR,   # check-ins/outs not yet sent
+                    help="directory unsent check-ins/outs are kept in")
     args = vars(ap.parse_args())
 
-    tfnet = TFNet(options)                                              # setup the model options
-    training_result = DetectCharacters.load_data_and_train()            # training OCR
-
-    if training_result == False:                                        # if KNN training was not successful
-        print("\nerror: Traning was not successful\n")
-    # end if
-
-    pool = Pool()
-
-    capture = cv2.VideoCapture(args["video"])                           # load video
-    camera = cv2.VideoCapture(0)                                        # load camera
+    if args["lanes"] is not None:
+        list_of_lanes, max_batch_size = Lanes.load_lanes(args["lanes"])
+    else:
+        mode = "out" if args["mode"] == "out" else "in"
+        list_of_lanes, max_batch_size = [Lanes.Lane("frame", args["video"], mode, camera=0, roi=args["roi"])], 1
+
+    # a region outside the frame would only fail on the lane's first frame, in its decode thread
+    if args["motion_gate"]:
+        for lane in list_of_lanes:
+            frame_width, frame_height = Lanes.frame_size(lane.source)
+            if lane.roi is not None and frame_width > 0 and frame_height > 0:
+                try:
+                    MotionGate.clip_roi(lane.roi, frame_width, frame_height)
+                except ValueError as e:
+                    sys.exit("error: lane %s: %s" % (lane.name, e))
+
+    detector = Detector.create_detector(args["detector"], dict(options, weights=args["weights"]))   # setup the model options
+
+    if args["metrics_port"]:
+        Metrics.enable()                                                # before the pool starts, so workers record too
+        Metrics.serve(args["metrics_port"])
+
+    # shared by all lanes, every worker trains the OCR classifier itself
+    pool = OcrPool.OcrPool(args["ocr_workers"], args["classifier"], args["ocr_slot_size"],
+                           list_of_cpus=args["ocr_cpus"], start_method=args["ocr_start_method"])
+
+    ocr_cache = None
+    if args["ocr_cache_size"] > 0:
+        ocr_cache = OcrCache.OcrCache(args["ocr_cache_size"], args["ocr_cache_ttl"], args["ocr_cache_distance"])
+
+    recorder = None
+    if args["record"] is not None:
+        recorder = Recording.Recorder(args["record"], args["record_encoding"])
+
+    publisher = Publisher.Publisher(URL_CHECK_IN, URL_CHECK_OUT, args["outbox"], on_response=plate_published)
+    publisher.start()                                                   # also resends what an earlier run left
+
+    for lane in list_of_lanes:
+        lane.open()                                                     # load video and camera
+        lane.tracker = Tracker.PlateTracker(PlateConsensus.PlateConsensus)
+        lane.frame_ring = FrameRing.FrameRing(args["queue_size"] + FRAMES_IN_FLIGHT)
+        if args["latency_budget"] > 0:
+            lane.scheduler = FrameScheduler.FrameScheduler(args["latency_budget"], lane.capture.get(cv2.CAP_PROP_FPS),
+                                                           args["min_detector_scale"])
+        if args["motion_gate"]:
+            lane.motion_gate = MotionGate.MotionGate(lane.roi, args["motion_threshold"], args["motion_hold_off"])
 
     colors = [tuple(255 * np.random.rand(3)) for i in range(5)]
 
@@ -132,89 +495,93 @@ if __name__ == "__main__":
     cv2.namedWindow("cam")
     cv2.moveWindow("cam", 20, 500)
 
-    while (capture.isOpened()):
-        ret, frame = capture.read()
-        if ret:
-            results = tfnet.return_predict(frame)                       # plate detection
-            for color, result in zip(colors, results):
-                if result['confidence'] > CONFIDENCE_RATE:              # detec chars if high confidence
-                    if processing == False:
-                        processing = True
-                        h = result['bottomright']['y'] - result['topleft']['y']
-                        w = result['bottomright']['x'] - result['topleft']['x']
-                        crop_img = frame[
-                            result['topleft']['y']:result['topleft']['y']+h, result['topleft']['x']:result['topleft']['x']+w]
-                        resized_crop = cv2.resize(crop_img, None, fx=0.5, fy=0.5, interpolation = cv2.INTER_AREA)
-                        async_result = pool.map_async(process_image, (resized_crop,), callback=mycallback)
-                        # process_image(resized_crop)
-
-                # draw box on plate
-                tl = (result['topleft']['x'], result['topleft']['y'])
-                br = (result['bottomright']['x'], result['bottomright']['y'])
-                frame = cv2.rectangle(frame, tl, br, color, 7)
-                text = result['label'] + ', ' + str(result['confidence'])
-                frame = cv2.putText(frame, text, tl, cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
-
-            # resize frame
-            resized = cv2.resize(frame, None, fx=0.25, fy=0.25, interpolation = cv2.INTER_AREA)
-
-            if displayPlate == True:                                 # display plate on screen
-                # write plate image for test
-                send_time = time.time()
-                data = {"plateNumber": plateToDisplay[0]}
-                print(data)
-                if args["mode"]=="out":
-                    r = requests.patch(URL_CHECK_OUT, data=data)
-                else:
-                    # capture camera
-                    ret_cam, frame_cam = camera.read()
-                    resized_cam = cv2.resize(frame_cam, None, fx=0.25, fy=0.25, interpolation = cv2.INTER_AREA)
-
-                    # prepare data
-                    cv2.imwrite("platePhoto" + "-%d.jpg" % send_time, plateToDisplay[1])
-                    cv2.imwrite("driverPhoto" + "-%d.jpg" % send_time, resized_cam)
-                    multiple_files = [('platePhoto', ("platePhoto" + "-%d.jpg" % send_time,
-                                        open("platePhoto" + "-%d.jpg" % send_time, 'rb'), 'image/jpg')),
-                                      ('driverPhoto', ("driverPhoto" + "-%d.jpg" % send_time,
-                                        open("driverPhoto" + "-%d.jpg" % send_time, 'rb'), 'image/jpg'))]
-                    # r = requests.post(URL_CHECK_IN, files=multiple_files, data=data)
-                    os.remove("platePhoto" + "-%d.jpg" % send_time)
-                    os.remove("driverPhoto" + "-%d.jpg" % send_time)
-
-                # print('server return code: ' + str(r.status_code))
-                # if r.status_code == 200:
-                #     last_sent_plate = plateToDisplay[0]
-                #     if args["mode"]=="out":
-                #         parsed = json.loads(r.content)
-                #         platePhotoReq = requests.get(URL_IMAGE % parsed['platePhotoId'])
-                #         driverPhotoReq = requests.get(URL_IMAGE % parsed['driverPhotoId'])
-
-                #         platePhotoPIL = np.array(Image.open(BytesIO(platePhotoReq.content)).convert('RGB'))
-                #         driverPhotoPIL = np.array(Image.open(BytesIO(driverPhotoReq.content)).convert('RGB'))
-
-                #         platePhoto = cv2.cvtColor(platePhotoPIL, cv2.COLOR_RGB2BGR)
-                #         driverPhoto = cv2.cvtColor(driverPhotoPIL, cv2.COLOR_RGB2BGR)
-
-                #         cv2.imshow("Plate Image", platePhoto)
-                #         cv2.imshow("cam", driverPhoto)
-
-                #     else:
-                #         cv2.imshow('Plate Image', plateToDisplay[1])
-                #         cv2.imshow("cam", resized_cam)
-                cv2.imshow('Plate Image', plateToDisplay[1])
+    # decode (one per lane) -> batched detect -> OCR -> publish, each stage on its own thread(s)
+    pipeline = Pipeline.Pipeline()
+    # frames are views of their lane's ring buffers, a dropped one hands its buffer back
+    batch_queue = pipeline.queue("batches", 1, Pipeline.BLOCK, on_drop=release_frames)
+    # a dropped OCR job still marks its track as being read, release it or the track never expires
+    crop_queue = pipeline.queue("crops", args["queue_size"] * len(list_of_lanes), args["ocr_policy"],
+                                on_drop=lambda item: item[0].tracker.ocr_finished(item[1]))
+    result_queue = pipeline.queue("results", args["queue_size"], Pipeline.BLOCK)
+    display_queue = pipeline.queue("display", len(list_of_lanes), Pipeline.DROP_OLDEST)
+    plate_queue = pipeline.queue("plates", len(list_of_lanes), Pipeline.DROP_OLDEST)
+
+    for lane in list_of_lanes:
+        lane.frame_queue = pipeline.queue("frames-" + lane.name, args["queue_size"], args["frame_policy"],
+                                          on_drop=lambda item, lane=lane: lane.frame_ring.release(item[3]))
+        pipeline.stage("decode-" + lane.name, lambda lane=lane: read_frames(lane), output=lane.frame_queue)
+
+    pipeline.stage("batch", lambda: gather_frames(list_of_lanes, max_batch_size), output=batch_queue)
+    pipeline.stage("detect", lambda batch: detect_plates_in_frames(detector, colors, display_queue, recorder,
+                                                                   args["detector_width"], batch),
+                   input=batch_queue, output=crop_queue)
+    pipeline.stage("ocr", lambda item: recognize_plate(pool, ocr_cache, item),
+                   input=crop_queue, output=result_queue, workers=args["ocr_workers"])
+    pipeline.stage("publish", lambda item: publish_plate(publisher, plate_queue, item),
+                   input=result_queue)
+    for stage_queue in pipeline.queues:
+        Metrics.gauge("queue_depth", stage_queue.depth, help="items waiting in a stage queue", queue=stage_queue.name)
+        Metrics.counter("queue_dropped_total", lambda stage_queue=stage_queue: stage_queue.dropped,
+                        help="items a full stage queue dropped, crops means OCR was busy", queue=stage_queue.name)
+    for lane in list_of_lanes:
+        Metrics.gauge("active_tracks", lambda lane=lane: len(lane.tracker.active_tracks()),
+                      help="plates currently tracked", lane=lane.name)
+        if lane.scheduler is not None:
+            Metrics.gauge("scheduler_skip", lane.scheduler.current_skip,
+                          help="frames grabbed without decoding between two decoded frames", lane=lane.name)
+            Metrics.gauge("scheduler_detector_scale", lane.scheduler.detector_scale,
+                          help="scale of the detector input chosen by the scheduler", lane=lane.name)
+            Metrics.gauge("scheduler_latency_seconds", lambda lane=lane: lane.scheduler.latency or 0.0,
+                          help="average seconds from capture to detection", lane=lane.name)
+        if lane.motion_gate is not None:
+            Metrics.gauge("motion_gate_skip_ratio", lane.motion_gate.skip_rate,
+                          help="fraction of frames the motion gate kept from the detector", lane=lane.name)
+    if ocr_cache is not None:
+        Metrics.gauge("ocr_cache_entries", ocr_cache.size, help="readings in the OCR cache")
+    Metrics.gauge("publish_pending", publisher.pending, help="check-ins/outs waiting to be sent")
+    pipeline.start()
+
+    last_stats_time = time.time()
+
+    while pipeline.is_running():
+        accepted_plate = plate_queue.get(timeout=0)
+        if accepted_plate is not None and accepted_plate is not Pipeline.STOP:    # display plate on screen
+            lane, imgPlate, resized_cam = accepted_plate
+            cv2.imshow('Plate Image', imgPlate)
+            if resized_cam is not None:
                 cv2.imshow("cam", resized_cam)
-
-                # reset
-                plateToDisplay = None
-                displayPlate = False
-            else:
-                cv2.imshow('frame', resized)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
         else:
-            capture.release()
-            camera.release()
-            cv2.destroyAllWindows()
-            pool.close()
-            pool.join()
+            item = display_queue.get()
+            if item is not None and item is not Pipeline.STOP:
+                lane, resized = item
+                cv2.imshow(lane.name, resized)
+
+        if args["stats_interval"] > 0 and time.time() - last_stats_time >= args["stats_interval"]:
+            print_pipeline_stats(pipeline.stats())
+            if ocr_cache is not None:
+                print("%-16s hits %d  misses %d  (%.0f%%)  entries %d" % (
+                    "ocr cache", ocr_cache.hits, ocr_cache.misses, 100 * ocr_cache.hit_rate(), ocr_cache.size()))
+            for lane in list_of_lanes:
+                if lane.scheduler is not None:
+                    print("%-16s scheduler skip %d  detector scale %.2f  latency %.0f ms  skipped %d frames" % (
+                        lane.name, lane.scheduler.current_skip(), lane.scheduler.detector_scale(),
+                        1000 * (lane.scheduler.latency or 0.0), lane.scheduler.skipped))
+                if lane.motion_gate is not None:
+                    print("%-16s motion gate skipped %d of %d frames (%.0f%%)" % (
+                        lane.name, lane.motion_gate.skipped, lane.motion_gate.passed + lane.motion_gate.skipped,
+                        100 * lane.motion_gate.skip_rate()))
+            last_stats_time = time.time()
+
+        if cv2.waitKey(1) & 0xFF == ord('q'):
             break
+
+    pipeline.stop()
+    pipeline.join()
+    publisher.stop(timeout=Publisher.REQUEST_TIMEOUT)
+    for lane in list_of_lanes:
+        lane.release()
+    cv2.destroyAllWindows()
+    pool.close()
+    if recorder is not None:
+        recorder.close()
+        print("recorded %d detector results to %s" % (recorder.records, args["record"]))
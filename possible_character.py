@@ -4,6 +4,10 @@ import math
 
 class PossibleCharacter:
 
+    __slots__ = ("contour", "boundingRect",
+                 "boundingRectX", "boundingRectY", "boundingRectWidth", "boundingRectHeight",
+                 "boundingRectArea", "centerX", "centerY", "diagonalSize", "aspectRatio")
+
     def __init__(self, _contour):
         self.contour = _contour
         self.boundingRect = cv2.boundingRect(self.contour)
@@ -21,4 +25,94 @@ class PossibleCharacter:
         self.aspectRatio = float(self.boundingRectWidth) / float(self.boundingRectHeight)
     # end constructor
 
+    @classmethod
+    def from_values(cls, contour, x, y, width, height, area, centerX, centerY, diagonalSize, aspectRatio):
+        # build a char from values already computed by PossibleCharacterSet
+        possible_char = cls.__new__(cls)
+
+        possible_char.contour = contour
+        possible_char.boundingRect = (x, y, width, height)
+
+        possible_char.boundingRectX = x
+        possible_char.boundingRectY = y
+        possible_char.boundingRectWidth = width
+        possible_char.boundingRectHeight = height
+
+        possible_char.boundingRectArea = area
+        possible_char.centerX = centerX
+        possible_char.centerY = centerY
+        possible_char.diagonalSize = diagonalSize
+        possible_char.aspectRatio = aspectRatio
+
+        return possible_char
+    # end function
+
+# end class
+
+
+class PossibleCharacterSet:
+    '''
+        the geometry of many candidate chars kept as parallel numpy arrays,
+        so all contours can be measured and filtered in bulk. only the chars
+        that survive filtering are turned into PossibleCharacter objects
+    '''
+
+    def __init__(self, contours, npaBoundingRects):
+        self.contours = contours
+        npaBoundingRects = np.asarray(npaBoundingRects, dtype = np.int64).reshape(-1, 4)
+
+        self.boundingRectX = npaBoundingRects[:, 0]
+        self.boundingRectY = npaBoundingRects[:, 1]
+        self.boundingRectWidth = npaBoundingRects[:, 2]
+        self.boundingRectHeight = npaBoundingRects[:, 3]
+
+        self.boundingRectArea = self.boundingRectWidth * self.boundingRectHeight
+        self.centerX = (self.boundingRectX + self.boundingRectX + self.boundingRectWidth) / 2
+        self.centerY = (self.boundingRectY + self.boundingRectY + self.boundingRectHeight) / 2
+        self.diagonalSize = np.sqrt((self.boundingRectWidth ** 2) + (self.boundingRectHeight ** 2)).astype(np.float64)
+        self.aspectRatio = self.boundingRectWidth / self.boundingRectHeight.astype(np.float64)
+    # end constructor
+
+    @classmethod
+    def from_contours(cls, contours):
+        # bounding rects of all contours at once, same as cv2.boundingRect on each
+        if len(contours) == 0:
+            return cls([], np.empty((0, 4), dtype = np.int64))
+
+        npaPoints = np.concatenate(contours).reshape(-1, 2)
+        npaStarts = np.zeros(len(contours), dtype = np.intp)
+        np.cumsum([len(contour) for contour in contours[:-1]], out = npaStarts[1:])
+
+        npaMinX = np.minimum.reduceat(npaPoints[:, 0], npaStarts)
+        npaMinY = np.minimum.reduceat(npaPoints[:, 1], npaStarts)
+        npaMaxX = np.maximum.reduceat(npaPoints[:, 0], npaStarts)
+        npaMaxY = np.maximum.reduceat(npaPoints[:, 1], npaStarts)
+
+        npaBoundingRects = np.stack((npaMinX, npaMinY, npaMaxX - npaMinX + 1, npaMaxY - npaMinY + 1), axis = 1)
+
+        return cls(list(contours), npaBoundingRects)
+    # end function
+
+    def __len__(self):
+        return len(self.contours)
+
+    def filter(self, npaMask):
+        npaIndices = np.flatnonzero(npaMask)
+
+        npaBoundingRects = np.stack((self.boundingRectX[npaIndices], self.boundingRectY[npaIndices],
+                                     self.boundingRectWidth[npaIndices], self.boundingRectHeight[npaIndices]), axis = 1)
+
+        return PossibleCharacterSet([self.contours[i] for i in npaIndices.tolist()], npaBoundingRects)
+    # end function
+
+    def to_list(self):
+        return [PossibleCharacter.from_values(*values) for values in zip(
+            self.contours,
+            self.boundingRectX.tolist(), self.boundingRectY.tolist(),
+            self.boundingRectWidth.tolist(), self.boundingRectHeight.tolist(),
+            self.boundingRectArea.tolist(),
+            self.centerX.tolist(), self.centerY.tolist(),
+            self.diagonalSize.tolist(), self.aspectRatio.tolist())]
+    # end function
+
 # end class
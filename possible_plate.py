@@ -11,6 +11,7 @@ class PossiblePlate:
         self.rrLocationOfPlateInScene = None
 
         self.strChars = ""
+        self.charDistances = []             # KNN distance of every char in strChars
     # end constructor
 
 # end class
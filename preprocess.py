@@ -26,6 +26,20 @@ def preprocess(image):
 # end function
 
 
+def resize_to_height(image, height):
+    # scale the image to the given height, return it and the scale factor
+    scale = height / float(image.shape[0])
+    if scale == 1.0:
+        return image, scale
+
+    width = max(int(round(image.shape[1] * scale)), 1)
+    # area would alias less on big shrinks but costs 10-30x more on large crops, the blur in preprocess covers it
+    interpolation = cv2.INTER_LINEAR if scale < 1.0 else cv2.INTER_CUBIC
+
+    return cv2.resize(image, (width, height), interpolation = interpolation), scale
+# end function
+
+
 def increase_contrast(image):
     structuringElement = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
 
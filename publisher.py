@@ -0,0 +1,232 @@
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import uuid
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics as Metrics
+
+# define constant
+OUTBOX_DIR = "outbox"
+FAILED_DIR = "failed"                   # inside the outbox, events the server rejected or that kept failing
+EVENT_FILE = "event.json"
+
+JPEG_QUALITY = 90
+REQUEST_TIMEOUT = 10.0                  # seconds
+POOL_SIZE = 4                           # keep-alive connections to the server
+
+RETRY_BASE_DELAY = 1.0                  # seconds, doubled after every failed attempt
+RETRY_MAX_DELAY = 60.0
+MAX_ATTEMPTS = 10                       # failed sends of one event before it is set aside, not counting unreachable
+
+
+class Publisher:
+    '''
+        sends check-in and check-out events from a background thread, so
+        video processing never waits on the network. photos are encoded
+        to JPEG in memory, every event is written to an on-disk outbox
+        before it is queued and only removed once the server accepted it,
+        so events survive network loss and restarts. failed sends are
+        retried with exponential backoff, in order; an event that still
+        fails after MAX_ATTEMPTS server errors or errors of its own (e.g. a
+        photo that cannot be read) is set aside in FAILED_DIR, so it does
+        not hold up the events behind it. while the server cannot be
+        reached at all, events wait however long it takes. every request
+        carries the event id as Idempotency-Key, so the server can
+        recognize a retry of a request it already handled
+    '''
+
+    def __init__(self, check_in_url, check_out_url, outbox_dir = OUTBOX_DIR, on_response = None):
+        self.check_in_url = check_in_url
+        self.check_out_url = check_out_url
+        self.outbox_dir = outbox_dir
+        self.on_response = on_response
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        os.makedirs(os.path.join(self.outbox_dir, FAILED_DIR), exist_ok = True)
+    # end constructor
+
+    def start(self):
+        # queue what is left in the outbox from an earlier run, then start sending
+        for event_dir in self.pending_event_dirs():
+            self.queue.put(event_dir)
+
+        self.thread = threading.Thread(target = self.run, name = "publisher")
+        self.thread.daemon = True
+        self.thread.start()
+    # end function
+
+    def stop(self, timeout = None):
+        # events that were not sent yet stay in the outbox for the next start
+        self.stop_event.set()
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.session.close()
+    # end function
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def check_in(self, plate_number, plate_image, driver_image = None):
+        photos = {"platePhoto": plate_image}
+        if driver_image is not None:
+            photos["driverPhoto"] = driver_image
+
+        return self.add_event("check-in", plate_number, photos)
+    # end function
+
+    def check_out(self, plate_number):
+        return self.add_event("check-out", plate_number, {})
+
+    def add_event(self, kind, plate_number, photos):
+        created = time.time()
+        event_id = "%d-%s" % (int(created * 1000), uuid.uuid4().hex[:8])       # sorts in creation order
+
+        event = {"id": event_id, "kind": kind, "plateNumber": plate_number, "created": created, "photos": []}
+
+        # write everything to a temporary directory and rename it, so the outbox never holds half an event
+        tmp_dir = os.path.join(self.outbox_dir, event_id + ".tmp")
+        os.makedirs(tmp_dir)
+
+        for name, image in photos.items():
+            ret, npaJpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            if not ret:
+                continue
+            with open(os.path.join(tmp_dir, name + ".jpg"), "wb") as f:
+                f.write(npaJpeg.tobytes())
+            event["photos"].append(name)
+
+        with open(os.path.join(tmp_dir, EVENT_FILE), "w") as f:
+            json.dump(event, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        event_dir = os.path.join(self.outbox_dir, event_id)
+        os.rename(tmp_dir, event_dir)
+
+        self.queue.put(event_dir)
+        return event_id
+    # end function
+
+    def pending_event_dirs(self):
+        list_of_event_dirs = []
+
+        for name in sorted(os.listdir(self.outbox_dir)):
+            path = os.path.join(self.outbox_dir, name)
+            if name == FAILED_DIR or not os.path.isdir(path):
+                continue
+            if name.endswith(".tmp"):
+                shutil.rmtree(path, ignore_errors = True)              # interrupted while writing
+                continue
+            list_of_event_dirs.append(path)
+
+        return list_of_event_dirs
+    # end function
+
+    def run(self):
+        while not self.stop_event.is_set():
+            event_dir = self.queue.get()
+            if event_dir is None:
+                break
+
+            delay = RETRY_BASE_DELAY
+            attempts = 0
+            while not self.stop_event.is_set():
+                try:
+                    outcome = self.send(event_dir)
+                except Exception as e:
+                    # whatever went wrong, the thread must keep draining the outbox; the event stays in it
+                    print("publisher: sending %s failed: %r" % (os.path.basename(event_dir), e))
+                    outcome = "retry"
+
+                if outcome not in ("retry", "unreachable"):
+                    break
+
+                if outcome == "retry":
+                    attempts += 1
+                    if attempts >= MAX_ATTEMPTS:
+                        print("publisher: giving up on %s after %d attempts" % (os.path.basename(event_dir), attempts))
+                        self.set_aside(event_dir)
+                        Metrics.inc("publish_total", help="check-in/out sends by outcome", outcome="given_up")
+                        break
+
+                Metrics.inc("publish_total", help="check-in/out sends by outcome", outcome="retry")
+                self.stop_event.wait(delay * random.uniform(0.5, 1.0))   # back off with jitter
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+    # end function
+
+    def set_aside(self, event_dir):
+        os.rename(event_dir, os.path.join(self.outbox_dir, FAILED_DIR, os.path.basename(event_dir)))
+
+    def send(self, event_dir):
+        # try to deliver one event, return "sent", "rejected", "retry" or "unreachable" (retried, but not counted)
+        if not os.path.isdir(event_dir):
+            return "sent"                                               # queued twice and handled already
+
+        try:
+            with open(os.path.join(event_dir, EVENT_FILE)) as f:
+                event = json.load(f)
+        except (OSError, ValueError):
+            print("publisher: %s is unreadable, setting it aside" % os.path.basename(event_dir))
+            self.set_aside(event_dir)
+            return "rejected"
+
+        data = {"plateNumber": event["plateNumber"]}
+        headers = {"Idempotency-Key": event["id"]}
+
+        try:
+            with Metrics.timed(event["kind"].replace("-", "_")):
+                if event["kind"] == "check-out":
+                    r = self.session.patch(self.check_out_url, data = data, headers = headers, timeout = REQUEST_TIMEOUT)
+                else:
+                    files = []
+                    for name in event["photos"]:
+                        with open(os.path.join(event_dir, name + ".jpg"), "rb") as f:
+                            files.append((name, ("%s-%s.jpg" % (name, event["id"]), f.read(), "image/jpeg")))
+                    r = self.session.post(self.check_in_url, files = files, data = data, headers = headers,
+                                          timeout = REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print("publisher: %s %s failed: %s" % (event["kind"], event["plateNumber"], e))
+            return "unreachable"
+        except (requests.RequestException, OSError) as e:
+            print("publisher: %s %s failed: %s" % (event["kind"], event["plateNumber"], e))
+            return "retry"
+        # end try
+
+        if r.status_code >= 500 or r.status_code in (408, 429):
+            return "retry"
+
+        if r.status_code >= 400:
+            print("publisher: server rejected %s %s with %d" % (event["kind"], event["plateNumber"], r.status_code))
+            self.set_aside(event_dir)
+            Metrics.inc("publish_total", help="check-in/out sends by outcome", outcome="rejected")
+            return "rejected"
+
+        shutil.rmtree(event_dir, ignore_errors = True)
+        Metrics.inc("publish_total", help="check-in/out sends by outcome", outcome="sent")
+
+        if self.on_response is not None:
+            try:
+                self.on_response(event, r)
+            except Exception as e:
+                print("publisher: handling the response to %s %s failed: %r" % (event["kind"], event["plateNumber"], e))
+
+        return "sent"
+    # end function
+
+# end class
@@ -0,0 +1,240 @@
+'''
+    long-running recognition service. the detector and the OCR workers are
+    loaded once, then images are recognized on request over a local HTTP
+    API, on a TCP port or a Unix socket:
+
+        python recognize_daemon.py --port 8500
+        curl --data-binary @snapshot.jpg http://127.0.0.1:8500/recognize
+
+    requests that arrive within a few milliseconds of each other share one
+    detector batch. every response carries its own latency breakdown, and
+    /metrics and /snapshot serve the totals
+'''
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+import numpy as np
+import cv2
+
+import detect_characters as DetectCharacters
+import detector as Detector
+import metrics as Metrics
+import ocr_pool as OcrPool
+import plate_system as PlateSystem
+
+# define constant
+BATCH_WINDOW = 0.01                 # seconds the batcher waits for more requests after the first one
+MAX_BATCH_SIZE = 8
+MAX_IMAGE_BYTES = 32 << 20
+
+
+class DetectionBatcher:
+    '''
+        runs the detector on its own thread. submit() queues one image and
+        returns a Future; the thread takes the first waiting image, collects
+        whatever else arrives within the batch window (up to max_batch_size)
+        and detects them all in one predict_batch call
+    '''
+
+    def __init__(self, detector, max_batch_size = MAX_BATCH_SIZE, window = BATCH_WINDOW):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.queue = queue.Queue()
+
+        self.thread = threading.Thread(target = self.run, name = "detect-batcher")
+        self.thread.daemon = True
+        self.thread.start()
+    # end constructor
+
+    def submit(self, img):
+        future = Future()
+        self.queue.put((img, future))
+        return future
+    # end function
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout = remaining))
+                except queue.Empty:
+                    break
+
+            Metrics.inc("detect_batches_total", help="detector batches run")
+            Metrics.inc("detect_batch_images_total", len(batch),
+                        help="images detected, divided by detect_batches_total the mean batch size")
+            try:
+                with Metrics.timed("yolo"):
+                    list_of_results = self.detector.predict_batch([img for img, future in batch])
+            except Exception as e:
+                for img, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (img, future), results in zip(batch, list_of_results):
+                future.set_result((results, len(batch)))
+    # end function
+
+# end class
+
+
+def recognize(batcher, pool, img):
+    # detect the plates of one image and read every confident one, with the latency of each step
+    start = time.perf_counter()
+
+    results, batch_size = batcher.submit(img).result()
+    detect_time = time.perf_counter() - start
+
+    plates = []
+    for result in results:
+        if result['confidence'] <= PlateSystem.CONFIDENCE_RATE:
+            continue
+
+        resized_crop = PlateSystem.crop_plate(img, result)
+        if resized_crop is None:
+            continue
+
+        plate, metrics_delta = pool.apply(PlateSystem.process_image_with_metrics, resized_crop)
+        Metrics.merge(metrics_delta)
+
+        plates.append({
+            "box": {"topleft": result['topleft'], "bottomright": result['bottomright']},
+            "confidence": float(result['confidence']),
+            "plate": plate[0] if plate != False else None,
+            "char_distances": plate[2] if plate != False else None
+        })
+
+    total_time = time.perf_counter() - start
+
+    return {
+        "plates": plates,
+        "batch_size": batch_size,
+        "timings": {
+            "detect_ms": 1000 * detect_time,
+            "ocr_ms": 1000 * (total_time - detect_time),
+            "total_ms": 1000 * total_time
+        }
+    }
+# end function
+
+
+class RecognizeHandler(Metrics.MetricsHandler):
+    '''
+        POST /recognize with the encoded image (jpg, png, ...) as the body,
+        GET /metrics and /snapshot like the metrics endpoint
+    '''
+
+    batcher = None
+    pool = None
+
+    def do_POST(self):
+        if self.path != "/recognize":
+            self.send_error(404)
+            return
+
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > MAX_IMAGE_BYTES:
+            self.send_json(400, {"error": "body must be an encoded image of at most %d bytes" % MAX_IMAGE_BYTES})
+            return
+
+        img = cv2.imdecode(np.frombuffer(self.rfile.read(length), dtype = np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            self.send_json(400, {"error": "body is not an image OpenCV can decode"})
+            return
+
+        try:
+            response = recognize(self.batcher, self.pool, img)
+        except Exception as e:
+            Metrics.inc("requests_total", help="recognize requests by outcome", outcome="error")
+            self.send_json(500, {"error": repr(e)})
+            return
+
+        latency = time.perf_counter() - start
+        response["timings"]["request_ms"] = 1000 * latency
+        Metrics.observe("request", latency)
+        Metrics.inc("requests_total", help="recognize requests by outcome", outcome="ok")
+
+        self.send_json(200, response)
+    # end function
+
+    def send_json(self, status, body):
+        body = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    # end function
+
+    def address_string(self):
+        # unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+# end class
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+# end class
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type = int, default = 8500, help = "serve on this localhost port")
+    ap.add_argument("--host", default = "127.0.0.1")
+    ap.add_argument("--unix", help = "serve on this unix socket path instead of a port")
+    ap.add_argument("--detector", choices = Detector.BACKENDS, default = "darkflow")
+    ap.add_argument("--weights", default = Detector.DEFAULT_WEIGHTS, help = "darknet weights for --detector opencv")
+    ap.add_argument("--classifier", choices = DetectCharacters.CLASSIFIERS, default = "knn")
+    ap.add_argument("--ocr-workers", type = int, default = os.cpu_count())
+    ap.add_argument("--batch-window", type = float, default = BATCH_WINDOW,
+                    help = "seconds to wait for more requests to detect in one batch")
+    ap.add_argument("--max-batch-size", type = int, default = MAX_BATCH_SIZE)
+    args = vars(ap.parse_args())
+
+    Metrics.enable()                                                    # every request reports its latency
+
+    detector = Detector.create_detector(args["detector"], dict(PlateSystem.options, weights = args["weights"]))
+    RecognizeHandler.batcher = DetectionBatcher(detector, args["max_batch_size"], args["batch_window"])
+    RecognizeHandler.pool = OcrPool.OcrPool(args["ocr_workers"], args["classifier"])
+
+    if args["unix"]:
+        if os.path.exists(args["unix"]):
+            os.remove(args["unix"])                                     # left over from an earlier run
+        server = ThreadingUnixHTTPServer(args["unix"], RecognizeHandler)
+        print("recognizing on unix socket %s" % args["unix"])
+    else:
+        server = ThreadingHTTPServer((args["host"], args["port"]), RecognizeHandler)
+        print("recognizing on http://%s:%d/recognize" % (args["host"], args["port"]))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        RecognizeHandler.pool.close()
+        if args["unix"]:
+            os.remove(args["unix"])
+# end if
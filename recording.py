@@ -0,0 +1,250 @@
+'''
+    record and replay of the detector output. plate_system --record appends
+    every detector result of every frame (lane, frame index, timestamp,
+    box, confidence) and the crop OCR was given to one file; replay runs
+    the recorded crops through the OCR path as fast as it goes, without
+    TensorFlow, the video or a display:
+
+        python plate_system.py -vid demo.mov --record demo.plrec
+        python recording.py replay demo.plrec --repeat 5 -o replay.json
+
+    the file is a header followed by self-describing records, written
+    with one append each, so a recording cut short by a crash is read up
+    to its last whole record. raw crops are read straight out of the
+    memory-mapped file without copying
+'''
+import sys
+import mmap
+import json
+import time
+import struct
+import hashlib
+import argparse
+import threading
+import numpy as np
+import cv2
+
+import detect_characters as DetectCharacters
+import detect_plates as DetectPlates
+
+# define constant
+FILE_HEADER = struct.Struct("<8sI")                 # magic, version
+FILE_MAGIC = b"PLATEREC"
+FILE_VERSION = 1
+
+# magic, lane name length, frame index, timestamp, confidence, left, top, right, bottom,
+# crop height, width, channels, encoding, crop bytes; followed by the lane name and the crop
+RECORD_HEADER = struct.Struct("<IHqdfiiiiHHBBI")
+RECORD_MAGIC = 0x43455250
+
+ENCODINGS = ("raw", "png")                          # both lossless, raw is much bigger but read without decoding
+PERCENTILES = (50, 95, 99)
+
+
+class Recorder:
+    '''
+        appends detector results and their crops to a recording, creating
+        it if needed. safe to call from several threads
+    '''
+
+    def __init__(self, path, encoding = "png"):
+        if encoding not in ENCODINGS:
+            raise ValueError("unknown crop encoding %r, expected one of %s" % (encoding, ", ".join(ENCODINGS)))
+
+        self.encoding = encoding
+        self.records = 0
+        self.lock = threading.Lock()
+
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+        else:
+            with open(path, "rb") as f:
+                check_file_header(f.read(FILE_HEADER.size), path)
+    # end constructor
+
+    def write(self, lane_name, frame_index, timestamp, result, crop = None):
+        # one detector result, with the crop cut for it or None if there is none (low confidence, empty box)
+        name = lane_name.encode("utf-8")
+
+        if crop is None:
+            height, width, channels, payload = 0, 0, 0, b""
+        else:
+            crop = np.ascontiguousarray(crop, dtype = np.uint8)
+            height, width = crop.shape[:2]
+            channels = crop.shape[2] if crop.ndim == 3 else 1
+            if self.encoding == "png":
+                ret, npaEncoded = cv2.imencode(".png", crop, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                payload = npaEncoded.tobytes()
+            else:
+                payload = crop.tobytes()
+
+        header = RECORD_HEADER.pack(RECORD_MAGIC, len(name), frame_index, timestamp, float(result['confidence']),
+                                    result['topleft']['x'], result['topleft']['y'],
+                                    result['bottomright']['x'], result['bottomright']['y'],
+                                    height, width, channels, ENCODINGS.index(self.encoding), len(payload))
+
+        with self.lock:
+            self.file.write(header + name + payload)                    # one append per record
+            self.records += 1
+    # end function
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# end class
+
+
+class Recording:
+    '''
+        a recording opened for reading through a read-only memory map.
+        iterating yields one dict per whole record; "crop" is None for
+        results without a crop, raw crops are views into the map
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.truncated = False
+
+        with open(path, "rb") as f:
+            check_file_header(f.read(FILE_HEADER.size), path)
+            self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    # end constructor
+
+    def __iter__(self):
+        offset = FILE_HEADER.size
+        size = len(self.map)
+
+        while offset < size:
+            if offset + RECORD_HEADER.size > size:
+                self.truncated = True
+                break
+
+            (magic, name_length, frame_index, timestamp, confidence, left, top, right, bottom,
+             height, width, channels, encoding, payload_length) = RECORD_HEADER.unpack_from(self.map, offset)
+            if magic != RECORD_MAGIC:
+                raise ValueError("%s: no record at byte %d, the file is damaged" % (self.path, offset))
+
+            name_offset = offset + RECORD_HEADER.size
+            payload_offset = name_offset + name_length
+            end = payload_offset + payload_length
+            if end > size:
+                self.truncated = True                                   # the recorder stopped mid-write
+                break
+
+            crop = None
+            if payload_length > 0:
+                npaPayload = np.frombuffer(self.map, dtype = np.uint8, count = payload_length, offset = payload_offset)
+                if ENCODINGS[encoding] == "png":
+                    crop = cv2.imdecode(npaPayload, cv2.IMREAD_UNCHANGED)
+                else:
+                    crop = npaPayload.reshape((height, width, channels) if channels > 1 else (height, width))
+
+            yield {
+                "lane": self.map[name_offset:payload_offset].decode("utf-8"),
+                "frame": frame_index,
+                "timestamp": timestamp,
+                "confidence": confidence,
+                "topleft": {"x": left, "y": top},
+                "bottomright": {"x": right, "y": bottom},
+                "crop": crop
+            }
+
+            offset = end
+    # end function
+
+# end class
+
+
+def check_file_header(data, path):
+    if len(data) < FILE_HEADER.size:
+        raise ValueError("%s is not a plate recording" % path)
+
+    magic, version = FILE_HEADER.unpack(data)
+    if magic != FILE_MAGIC:
+        raise ValueError("%s is not a plate recording" % path)
+    if version != FILE_VERSION:
+        raise ValueError("%s is a version %d recording, this reads version %d" % (path, version, FILE_VERSION))
+# end function
+
+
+def replay(path, repeat = 1, classifier = "knn"):
+    '''
+        run every recorded crop through detect_plates_in_image and
+        detect_chars_in_plates, repeat times, and return throughput,
+        latency and a digest of the readings, which only changes if the
+        OCR reads something differently
+    '''
+    import plate_system as PlateSystem                                  # imports this module, so only here
+
+    if DetectCharacters.load_data_and_train(classifier) == False:
+        raise RuntimeError("training of the %s classifier was not successful" % classifier)
+
+    recording = Recording(path)
+    list_of_records = list(recording)
+    list_of_crops = [record["crop"] for record in list_of_records if record["crop"] is not None]   # decoded before timing
+
+    npaLatencies = np.empty(len(list_of_crops) * repeat, dtype = np.float64)
+    list_of_readings = []
+
+    i = 0
+    start_time = time.perf_counter()
+    for r in range(repeat):
+        for crop in list_of_crops:
+            crop_start = time.perf_counter()
+            list_of_possible_plates = DetectPlates.detect_plates_in_image(crop)
+            list_of_possible_plates = DetectCharacters.detect_chars_in_plates(list_of_possible_plates)
+            npaLatencies[i] = time.perf_counter() - crop_start
+            i += 1
+
+            if r == 0:
+                plate = PlateSystem.read_plate_number(list_of_possible_plates, crop)
+                list_of_readings.append(plate[0] if plate != False else "")
+    elapsed = time.perf_counter() - start_time
+
+    report = {
+        "recording": path,
+        "records": len(list_of_records),
+        "crops": len(list_of_crops),
+        "truncated": recording.truncated,
+        "repeat": repeat,
+        "classifier": classifier,
+        "plates_read": sum(1 for reading in list_of_readings if reading),
+        "readings_digest": hashlib.sha1("\n".join(list_of_readings).encode("utf-8")).hexdigest(),
+        "crops_per_sec": len(npaLatencies) / elapsed if elapsed > 0 else None
+    }
+    for percentile in PERCENTILES:
+        report["p%d_ms" % percentile] = 1000 * float(np.percentile(npaLatencies, percentile)) if len(npaLatencies) > 0 else None
+
+    return report
+# end function
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    subparsers = ap.add_subparsers(dest = "command")
+    replay_parser = subparsers.add_parser("replay", help = "time the OCR path on the crops of a recording")
+    replay_parser.add_argument("recording")
+    replay_parser.add_argument("--repeat", type = int, default = 1, help = "times every crop is read")
+    replay_parser.add_argument("--classifier", choices = DetectCharacters.CLASSIFIERS, default = "knn")
+    replay_parser.add_argument("-o", "--output", help = "write the report to this JSON file")
+    args = vars(ap.parse_args())
+
+    if args["command"] != "replay":
+        ap.print_help()
+        sys.exit(0)
+
+    report = replay(args["recording"], args["repeat"], args["classifier"])
+
+    print("%d records, %d crops%s" % (report["records"], report["crops"],
+                                      ", the recording ends in a partial record" if report["truncated"] else ""))
+    if report["crops"] > 0:
+        print("%.1f crops/sec  p50 %.2f ms  p95 %.2f ms  p99 %.2f ms" % (
+            report["crops_per_sec"], report["p50_ms"], report["p95_ms"], report["p99_ms"]))
+    print("%d plates read, readings digest %s" % (report["plates_read"], report["readings_digest"]))
+
+    if args["output"]:
+        with open(args["output"], "w") as f:
+            json.dump(report, f, indent = 2)
+# end if
@@ -0,0 +1,93 @@
+import numpy as np
+import cv2
+
+# define constant
+PLATE_LETTERS = "ABCDEFGHKLMNPSTUVXYZ"
+
+PLATE_ASPECT_RATIO = 1.3                    # width / height of a two row bike plate
+PLATE_MARGIN_FACTOR = 0.15                  # background around the plate, as a fraction of its height
+
+BACKGROUND_COLOR = (90, 90, 90)
+PLATE_COLOR = (235, 235, 235)
+INK_COLOR = (15, 15, 15)
+
+
+def random_plate_number(rng):
+    # Vietnamese bike plate: \d{2}[A-Z]\d on the top row and 4 or 5 digits below
+    top_row = "%02d%s%d" % (rng.randint(10, 100), PLATE_LETTERS[rng.randint(len(PLATE_LETTERS))], rng.randint(10))
+    number_of_digits = 4 + rng.randint(2)
+    bottom_row = "".join(str(rng.randint(10)) for i in range(number_of_digits))
+
+    return top_row, bottom_row
+# end function
+
+
+def render_plate(top_row, bottom_row, height = 260, skew = 0.0, noise = 0.0, distractors = 0, rng = None):
+    '''
+        draw a plate crop like the ones the detector hands to OCR. height is
+        the plate height in pixels, skew the rotation in degrees, noise the
+        standard deviation of the gaussian noise and distractors the number
+        of random non-character shapes drawn around the characters
+    '''
+    if rng is None:
+        rng = np.random.RandomState(0)
+
+    plate_width = int(height * PLATE_ASPECT_RATIO)
+    img_plate = np.full((height, plate_width, 3), PLATE_COLOR, np.uint8)
+    cv2.rectangle(img_plate, (4, 4), (plate_width - 5, height - 5), INK_COLOR, max(2, height // 80))
+
+    font_scale = height / 140.0
+    thickness = max(2, int(3 * font_scale))
+
+    for i, text in enumerate((top_row, bottom_row)):
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        x = (plate_width - text_width) // 2
+        y = int(height * (0.42 + 0.45 * i))
+        cv2.putText(img_plate, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, INK_COLOR, thickness, cv2.LINE_AA)
+
+    margin = int(height * PLATE_MARGIN_FACTOR)
+    image = cv2.copyMakeBorder(img_plate, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value = BACKGROUND_COLOR)
+
+    for i in range(distractors):
+        draw_distractor(image, rng, height)
+
+    if skew != 0.0:
+        center = (image.shape[1] / 2.0, image.shape[0] / 2.0)
+        rotationMatrix = cv2.getRotationMatrix2D(center, skew, 1.0)
+        image = cv2.warpAffine(image, rotationMatrix, (image.shape[1], image.shape[0]), borderValue = BACKGROUND_COLOR)
+
+    if noise > 0.0:
+        image = np.clip(image + rng.normal(0.0, noise, image.shape), 0, 255).astype(np.uint8)
+
+    return image
+# end function
+
+
+def draw_distractor(image, rng, height):
+    # a small dark shape that the character filters have to reject or group
+    h, w = image.shape[:2]
+    x, y = rng.randint(w), rng.randint(h)
+    size = max(3, int(height * rng.uniform(0.03, 0.3)))
+    kind = rng.randint(3)
+
+    if kind == 0:
+        cv2.rectangle(image, (x, y), (x + size // 2, y + size), INK_COLOR, max(1, size // 10))
+    elif kind == 1:
+        cv2.circle(image, (x, y), size // 2, INK_COLOR, -1)
+    else:
+        angle = rng.uniform(0, np.pi)
+        cv2.line(image, (x, y), (int(x + size * np.cos(angle)), int(y + size * np.sin(angle))), INK_COLOR, max(1, size // 8))
+# end function
+
+
+def generate_plates(count, height = 260, skew = 0.0, noise = 0.0, distractors = 0, seed = 0):
+    # yield (plate number, image) pairs; skew is the maximum absolute rotation
+    rng = np.random.RandomState(seed)
+
+    for i in range(count):
+        top_row, bottom_row = random_plate_number(rng)
+        angle = rng.uniform(-skew, skew) if skew > 0 else 0.0
+        image = render_plate(top_row, bottom_row, height, angle, noise, distractors, rng)
+
+        yield top_row + bottom_row, image
+# end function
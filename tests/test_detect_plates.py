@@ -0,0 +1,65 @@
+import numpy as np
+import cv2
+
+import detect_plates as DetectPlates
+
+
+def full_frame_crop(img, ptCenter, size, fltAngleInDeg, fltScale):
+    # reference: warp the entire image so the rectangle ends up upright in the output
+    outputSize = (int(round(size[0] * fltScale)), int(round(size[1] * fltScale)))
+    interpolation = cv2.INTER_LINEAR if fltScale < 1.0 else cv2.INTER_CUBIC
+
+    rotationMatrix = cv2.getRotationMatrix2D(ptCenter, fltAngleInDeg, fltScale)
+    rotationMatrix[0, 2] += (outputSize[0] - 1) / 2.0 - ptCenter[0]
+    rotationMatrix[1, 2] += (outputSize[1] - 1) / 2.0 - ptCenter[1]
+
+    return cv2.warpAffine(img, rotationMatrix, outputSize, flags = interpolation)
+# end function
+
+
+def textured_frame():
+    rng = np.random.RandomState(0)
+    img = cv2.resize(rng.randint(0, 256, (90, 160, 3)).astype(np.uint8), (1280, 720), interpolation = cv2.INTER_LINEAR)
+    return img
+# end function
+
+
+def test_rotated_crop_matches_the_full_frame_warp():
+    img = textured_frame()
+
+    for ptCenter, size, fltAngleInDeg, fltScale in [((640.5, 360.25), (120, 90), 7.5, 1.0),
+                                                    ((300.0, 500.0), (151, 77), -12.0, 1.6),
+                                                    ((900.25, 200.75), (200, 150), 3.0, 0.5)]:
+        imgCropped = DetectPlates.crop_rotated_rect(img, ptCenter, size, fltAngleInDeg, fltScale)
+        imgExpected = full_frame_crop(img, ptCenter, size, fltAngleInDeg, fltScale)
+
+        assert imgCropped.shape == imgExpected.shape
+        assert np.abs(imgCropped.astype(int) - imgExpected.astype(int)).max() <= 1
+# end function
+
+
+def test_rotated_crop_at_the_frame_edge_is_padded_like_the_full_frame_warp():
+    img = textured_frame()
+
+    for ptCenter in [(20.0, 15.5), (1270.5, 710.0)]:
+        imgCropped = DetectPlates.crop_rotated_rect(img, ptCenter, (120, 90), 10.0)
+        imgExpected = full_frame_crop(img, ptCenter, (120, 90), 10.0, 1.0)
+
+        assert np.abs(imgCropped.astype(int) - imgExpected.astype(int)).max() <= 1
+# end function
+
+
+def test_rotated_crop_is_close_to_rotating_the_entire_image_then_cropping():
+    # what extract_plate did before it warped only the plate region
+    img = textured_frame()
+    ptCenter, size, fltAngleInDeg = (640.0, 360.0), (120, 90), 7.5
+
+    rotationMatrix = cv2.getRotationMatrix2D(ptCenter, fltAngleInDeg, 1.0)
+    imgRotated = cv2.warpAffine(img, rotationMatrix, (img.shape[1], img.shape[0]))
+    imgExpected = cv2.getRectSubPix(imgRotated, size, ptCenter)
+
+    imgCropped = DetectPlates.crop_rotated_rect(img, ptCenter, size, fltAngleInDeg)
+
+    assert imgCropped.shape == imgExpected.shape
+    assert np.mean(np.abs(imgCropped.astype(int) - imgExpected.astype(int))) < 2.0
+# end function
@@ -0,0 +1,59 @@
+import numpy as np
+
+import detector as Detector
+
+
+def darkflow_process_box(cx, cy, bw, bh, h, w):
+    # the box edges of darkflow's yolo process_box, for a box that passed its threshold
+    left = int((cx - bw / 2.) * w)
+    right = int((cx + bw / 2.) * w)
+    top = int((cy - bh / 2.) * h)
+    bottom = int((cy + bh / 2.) * h)
+
+    return max(left, 0), max(top, 0), min(right, w - 1), min(bottom, h - 1)
+# end function
+
+
+def opencv_detector(threshold = 0.1):
+    # the post-processing of the opencv backend, without loading a network
+    detector = Detector.OpenCVDetector.__new__(Detector.OpenCVDetector)
+    detector.threshold = threshold
+    detector.labels = ["plate"]
+    return detector
+
+
+def region_row(cx, cy, bw, bh, score):
+    return [cx, cy, bw, bh, score, score]
+
+
+def test_region_boxes_match_darkflow_results():
+    h, w = 720, 1280
+    list_of_rows = [region_row(0.3137, 0.5219, 0.1011, 0.0523, 0.9),
+                    region_row(0.3140, 0.5220, 0.1000, 0.0520, 0.6),     # the same plate again, suppressed
+                    region_row(0.0150, 0.9900, 0.0800, 0.0600, 0.4),     # sticks out of the frame, clamped
+                    region_row(0.7000, 0.2000, 0.0500, 0.0300, 0.05)]    # below the threshold
+
+    results = opencv_detector().region_boxes(np.array(list_of_rows, dtype = np.float32), h, w)
+
+    assert len(results) == 2
+    for result, row in zip(results, (list_of_rows[0], list_of_rows[2])):
+        assert set(result) == {"label", "confidence", "topleft", "bottomright"}
+        assert result["label"] == "plate"
+        assert type(result["confidence"]) is float and abs(result["confidence"] - row[5]) < 1e-6
+
+        box = (result["topleft"]["x"], result["topleft"]["y"], result["bottomright"]["x"], result["bottomright"]["y"])
+        assert all(type(value) is int for value in box)
+        assert box == darkflow_process_box(*[float(value) for value in np.float32(row[:4])], h, w)
+
+
+def test_no_box_above_the_threshold():
+    npaOutput = np.array([region_row(0.5, 0.5, 0.1, 0.1, 0.05)], dtype = np.float32)
+    assert opencv_detector().region_boxes(npaOutput, 720, 1280) == []
+
+
+def test_benchmark_row_without_timings():
+    result = {"backend": "opencv", "startup_s": 0.42, "fps": None, "p50_ms": None, "p95_ms": None,
+              "max_rss_mb": 180.0}
+
+    assert Detector.format_benchmark_row(result) == "%-10s %10.2f %8s %10s %10s %12.0f" % (
+        "opencv", 0.42, "-", "-", "-", 180.0)
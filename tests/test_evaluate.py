@@ -0,0 +1,22 @@
+from multiprocessing import Pool
+import pytest
+
+import evaluate as Evaluate
+import plate_system as PlateSystem
+
+
+def test_every_worker_is_ready_before_timing():
+    pool = Pool(3, initializer = Evaluate.init_worker, initargs = (None, None, "knn"))
+
+    assert len(Evaluate.wait_for_workers(pool, 3)) == 3
+
+    pool.close()
+    pool.join()
+
+
+def test_worker_that_cannot_load_the_detector_stops_the_run():
+    options = dict(PlateSystem.options, weights = "does-not-exist.weights")
+    pool = Pool(2, initializer = Evaluate.init_worker, initargs = ("opencv", options, "knn"))
+
+    with pytest.raises(SystemExit, match = "worker initialization failed: loading the opencv detector failed"):
+        Evaluate.wait_for_workers(pool, 2)
@@ -0,0 +1,95 @@
+import threading
+import time
+import numpy as np
+
+import frame_ring as FrameRing
+import lanes as Lanes
+import pipeline as Pipeline
+import plate_system as PlateSystem
+
+
+class CountingCapture:
+    '''
+        a source of numbered frames, every pixel of frame i is i % 256,
+        decoded into the buffer it is given like cv2.VideoCapture.read
+    '''
+
+    def __init__(self, number_of_frames):
+        self.number_of_frames = number_of_frames
+        self.frames = 0
+
+    def isOpened(self):
+        return self.frames < self.number_of_frames
+
+    def read(self, buffer = None):
+        if buffer is None:
+            buffer = np.empty((48, 64, 3), dtype = np.uint8)
+        buffer[:] = self.frames % 256
+        self.frames += 1
+        return True, buffer
+
+# end class
+
+
+def test_held_slots_are_not_claimed():
+    ring = FrameRing.FrameRing(3)
+    capture = CountingCapture(10)
+
+    for i in range(3):
+        slot, buffer = ring.claim()
+        ret, frame = capture.read(buffer)
+        ring.publish(slot, frame, float(i))
+        ring.hold(slot)
+
+    assert ring.claim(timeout = 0.05) == (None, None)                   # all three frames are still in use
+
+    ring.release(1)
+    slot, buffer = ring.claim()
+    assert slot == 1 and buffer is not frame                            # frame 2 is left alone
+    assert frame[0, 0, 0] == 2
+
+
+def test_slow_detector_keeps_its_frames_under_the_latest_policy():
+    # a decoder running far ahead of the detector, frames evicted from the queue as it goes
+    lane = Lanes.Lane("gate", "unused.mov")
+    lane.capture = CountingCapture(300)
+    queue_size = 2
+    lane.frame_ring = FrameRing.FrameRing(queue_size + PlateSystem.FRAMES_IN_FLIGHT)
+    lane.frame_queue = Pipeline.StageQueue("frames", queue_size, Pipeline.DROP_OLDEST,
+                                           on_drop = lambda item: lane.frame_ring.release(item[3]))
+
+    def decode():
+        for item in PlateSystem.read_frames(lane):
+            lane.frame_queue.put(item)
+        lane.frame_queue.close()
+
+    thread = threading.Thread(target = decode, daemon = True)
+    thread.start()
+
+    list_of_mismatches = []
+    frames_detected = 0
+    while True:
+        item = lane.frame_queue.get()
+        if item is Pipeline.STOP:
+            break
+        if item is None:
+            continue
+
+        frame_index, frame, timestamp, slot = item
+        batch = [(lane, frame_index, frame, timestamp, slot)]
+        time.sleep(0.002)                                               # the detector is busy with the frame
+        if frame[0, 0, 0] != frame_index % 256:
+            list_of_mismatches.append((frame_index, int(frame[0, 0, 0])))
+        PlateSystem.release_frames(batch)
+        frames_detected += 1
+
+    thread.join(5)
+    assert frames_detected > 0 and lane.frame_queue.dropped > 0
+    assert list_of_mismatches == []
+
+
+def test_camera_ring_keeps_half_a_second_within_its_memory_budget():
+    assert FrameRing.camera_slots(30, 1280, 720) == 15
+    assert FrameRing.camera_slots(0, 1280, 720) == 15                   # camera without a frame rate
+    assert FrameRing.camera_slots(30, 1920, 1080) * 1920 * 1080 * 3 <= FrameRing.CAMERA_RING_BYTES
+    assert FrameRing.camera_slots(25, 7680, 4320) == FrameRing.MIN_CAMERA_SLOTS
@@ -0,0 +1,59 @@
+import time
+import numpy as np
+import pytest
+
+import frame_ring as FrameRing
+import frame_scheduler as FrameScheduler
+import lanes as Lanes
+import pipeline as Pipeline
+import plate_system as PlateSystem
+
+
+def test_reading_the_skip_does_not_advance_the_lane(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(FrameScheduler.time, "time", lambda: now[0])
+
+    scheduler = FrameScheduler.FrameScheduler(0.3, fps = 10)
+    scheduler.frames_to_skip()
+    scheduler.frame_read()
+
+    now[0] += 0.5                                                       # the source produced 5 frames meanwhile
+    assert scheduler.frames_to_skip() == 4
+    position = scheduler.position
+
+    for i in range(3):                                                  # metric scrapes and stats prints
+        assert scheduler.current_skip() == 4
+    assert scheduler.position == position
+
+    scheduler.frame_read()
+    now[0] += 0.1
+    assert scheduler.frames_to_skip() == 0                              # nothing lost to the reads above
+
+
+class FailingDetector:
+
+    def predict_batch(self, list_of_inputs):
+        raise RuntimeError("detector failed")
+
+# end class
+
+
+def test_failed_batch_lets_the_lane_decode_again():
+    lane = Lanes.Lane("gate", "unused.mov")
+    lane.scheduler = FrameScheduler.FrameScheduler(0.3, fps = 25)
+    lane.frame_ring = FrameRing.FrameRing(2)
+
+    slot, buffer = lane.frame_ring.claim()
+    frame = np.zeros((48, 64, 3), dtype = np.uint8)
+    lane.frame_ring.publish(slot, frame, time.time())
+    lane.frame_ring.hold(slot)
+    lane.scheduler.frame_read()
+    assert not lane.scheduler.wait_for_detector(0)
+
+    display_queue = Pipeline.StageQueue("display", 1)
+    with pytest.raises(RuntimeError):
+        PlateSystem.detect_plates_in_frames(FailingDetector(), [], display_queue, None, 0,
+                                            [(lane, 0, frame, time.time(), slot)])
+
+    assert lane.scheduler.wait_for_detector(0)                          # not after LOST_FRAME_TIMEOUT
+    assert not lane.frame_ring.npaHeld.any()
@@ -0,0 +1,53 @@
+import numpy as np
+import cv2
+import pytest
+
+import detect_characters as DetectCharacters
+import hamming_classifier as HammingClassifier
+
+# define constant
+MAX_ACCURACY_LOSS = 0.03            # leave-one-out accuracy the hamming classifier may lose against KNN (76.9% vs 78.7%)
+
+
+@pytest.fixture(scope = "module")
+def training_data():
+    return DetectCharacters.load_training_text_files()
+
+
+def leave_one_out(create_classifier, npaClassifications, npaFlattenedImages):
+    # the response of every training glyph when it is classified by all the others
+    npaResults = np.zeros(len(npaFlattenedImages), dtype = np.float32)
+
+    for i in range(len(npaFlattenedImages)):
+        npaOthers = np.arange(len(npaFlattenedImages)) != i
+
+        classifier = create_classifier()
+        classifier.setDefaultK(1)
+        classifier.train(np.ascontiguousarray(npaFlattenedImages[npaOthers]), cv2.ml.ROW_SAMPLE,
+                         np.ascontiguousarray(npaClassifications[npaOthers]))
+        retval, npaResult, neigh_resp, dists = classifier.findNearest(npaFlattenedImages[i : i + 1], k = 1)
+        npaResults[i] = npaResult[0, 0]
+
+    return npaResults
+# end function
+
+
+def test_accuracy_is_close_to_knn(training_data):
+    npaClassifications, npaFlattenedImages = training_data
+    npaExpected = npaClassifications.reshape(-1)
+
+    knn_accuracy = np.mean(leave_one_out(cv2.ml.KNearest_create, *training_data) == npaExpected)
+    hamming_accuracy = np.mean(leave_one_out(HammingClassifier.HammingNearest, *training_data) == npaExpected)
+
+    assert hamming_accuracy >= knn_accuracy - MAX_ACCURACY_LOSS
+
+
+def test_same_answers_as_knn_on_binary_glyphs(training_data):
+    # on the 0/255 images plates are classified from, hamming distance is the squared L2 distance
+    npaClassifications, npaFlattenedImages = training_data
+    npaBinaryImages = np.where(npaFlattenedImages >= HammingClassifier.BINARY_THRESHOLD, 255, 0).astype(np.float32)
+
+    npaKnnResults = leave_one_out(cv2.ml.KNearest_create, npaClassifications, npaBinaryImages)
+    npaHammingResults = leave_one_out(HammingClassifier.HammingNearest, npaClassifications, npaBinaryImages)
+
+    np.testing.assert_array_equal(npaHammingResults, npaKnnResults)
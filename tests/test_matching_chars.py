@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import detect_characters as DetectCharacters
+import detect_plates as DetectPlates
+import possible_character as PossibleCharacter
+import preprocess as Preprocess
+import synthetic_plates as SyntheticPlates
+
+
+def pairwise_groups(list_of_possible_chars):
+    '''
+        the grouping before matching_chars_matrix: find_list_of_matching_chars
+        on every char and recursion on the chars not grouped yet. the
+        original recursed on a set difference, whose order depends on object
+        ids; the remaining chars are kept in list order here, the order the
+        vectorized grouping documents
+    '''
+    for possible_char in list_of_possible_chars:
+        list_of_matching_chars = DetectCharacters.find_list_of_matching_chars(possible_char, list_of_possible_chars)
+        list_of_matching_chars.append(possible_char)
+
+        if len(list_of_matching_chars) < DetectCharacters.MIN_NUMBER_OF_MATCHING_CHARS:
+            continue
+
+        list_of_remaining_chars = [char for char in list_of_possible_chars if char not in list_of_matching_chars]
+
+        return [list_of_matching_chars] + pairwise_groups(list_of_remaining_chars)
+
+    return []
+
+
+def rect_char(x, y, width, height):
+    contour = np.array([[[x, y]], [[x + width - 1, y]], [[x + width - 1, y + height - 1]], [[x, y + height - 1]]],
+                       dtype = np.int32)
+    return PossibleCharacter.PossibleCharacter(contour)
+
+
+def random_chars(rng):
+    # a few rows of similar chars with jitter, plus chars of random size anywhere
+    list_of_possible_chars = []
+
+    for row in range(rng.randint(1, 4)):
+        y = rng.randint(0, 300)
+        height = rng.randint(25, 60)
+        x = rng.randint(0, 50)
+        for i in range(rng.randint(2, 9)):
+            list_of_possible_chars.append(rect_char(x, y + rng.randint(-4, 5), rng.randint(8, 30),
+                                                    height + rng.randint(-6, 7)))
+            x += rng.randint(15, 60)
+
+    for i in range(rng.randint(0, 15)):
+        list_of_possible_chars.append(rect_char(rng.randint(0, 400), rng.randint(0, 400),
+                                                rng.randint(4, 40), rng.randint(10, 80)))
+
+    rng.shuffle(list_of_possible_chars)
+    return list_of_possible_chars
+
+
+def assert_same_groups(list_of_possible_chars):
+    expected = [[id(char) for char in group] for group in pairwise_groups(list_of_possible_chars)]
+    actual = [[id(char) for char in group]
+              for group in DetectCharacters.find_list_of_groups_of_matching_chars(list_of_possible_chars)]
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_chars_group_like_pairwise(seed):
+    assert_same_groups(random_chars(np.random.RandomState(seed)))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_plate_chars_group_like_pairwise(seed):
+    for plate_number, image in SyntheticPlates.generate_plates(3, skew = 5, noise = 6, distractors = 20, seed = seed):
+        image, scale = Preprocess.resize_to_height(image, DetectPlates.PLATE_HEIGHT)
+        img_grayscale, img_threshold = Preprocess.preprocess(image)
+
+        assert_same_groups(DetectPlates.find_possible_characters_in_image(img_threshold))
+
+
+def test_matrix_matches_pairwise_rule():
+    list_of_possible_chars = random_chars(np.random.RandomState(1234))
+    npaMatches = DetectCharacters.matching_chars_matrix(list_of_possible_chars)
+
+    for i, possible_char in enumerate(list_of_possible_chars):
+        list_of_matching_chars = DetectCharacters.find_list_of_matching_chars(possible_char, list_of_possible_chars)
+        assert [list_of_possible_chars[j] for j in np.flatnonzero(npaMatches[i])] == list_of_matching_chars
@@ -0,0 +1,16 @@
+import metrics as Metrics
+
+
+def test_callable_counter_is_exported_as_counter():
+    Metrics.counter("test_dropped_total", lambda: 3, help="dropped items", queue="crops")
+    text = Metrics.prometheus_text()
+
+    assert "# TYPE plate_test_dropped_total counter" in text
+    assert 'plate_test_dropped_total{queue="crops"} 3' in text
+    assert Metrics.snapshot()["counters"]['plate_test_dropped_total{queue="crops"}'] == 3
+
+
+def test_label_values_are_escaped():
+    Metrics.gauge("test_lane_up", lambda: 1, lane='gate "1" \\ in\nout')
+
+    assert 'plate_test_lane_up{lane="gate \\"1\\" \\\\ in\\nout"} 1' in Metrics.prometheus_text()
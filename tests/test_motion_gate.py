@@ -0,0 +1,38 @@
+import numpy as np
+import cv2
+import pytest
+
+import lanes as Lanes
+import motion_gate as MotionGate
+
+
+def frame(value = 0):
+    return np.full((720, 1280, 3), value, dtype = np.uint8)
+
+
+def test_roi_is_clipped_to_the_frame():
+    gate = MotionGate.MotionGate(roi = (1200, -50, 400, 200))
+
+    assert gate.check(frame())
+    assert gate.small_gray(frame()).shape == (150, 80)                  # the 80x150 px left of the roi
+    assert gate.check(frame(255))                                       # the visible part still sees motion
+
+
+@pytest.mark.parametrize("roi", [(1280, 0, 100, 100), (0, 720, 100, 100), (-200, 0, 200, 100)])
+def test_roi_outside_the_frame_is_an_error(roi):
+    gate = MotionGate.MotionGate(roi = roi)
+
+    with pytest.raises(ValueError, match = "outside the 1280x720 frame"):
+        gate.check(frame())
+
+
+def test_roi_is_checked_against_the_source_at_startup(tmp_path):
+    path = str(tmp_path / "lane.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (1280, 720))
+    writer.write(frame())
+    writer.release()
+
+    assert Lanes.frame_size(path) == (1280, 720)
+    assert MotionGate.clip_roi((1200, -50, 400, 200), 1280, 720) == (1200, 0, 1280, 150)
+    with pytest.raises(ValueError, match = "outside the 1280x720 frame"):
+        MotionGate.clip_roi((1280, 0, 100, 100), *Lanes.frame_size(path))
@@ -0,0 +1,87 @@
+import numpy as np
+
+import lanes as Lanes
+import ocr_cache as OcrCache
+import plate_consensus as PlateConsensus
+import plate_system as PlateSystem
+import tracker as Tracker
+
+
+class CountingPool:
+    '''
+        stands in for the OCR pool, reading every crop as the same plate
+    '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def apply(self, func, img_plate):
+        self.calls += 1
+        return ("59F12545", None, [0.0] * 8), None
+
+# end class
+
+
+class RecordingPublisher:
+
+    def __init__(self):
+        self.plates = []
+
+    def check_in(self, license_plate_number, img_plate, img_cam = None):
+        self.plates.append(license_plate_number)
+
+    def check_out(self, license_plate_number):
+        self.plates.append(license_plate_number)
+
+# end class
+
+
+def make_lane():
+    lane = Lanes.Lane("gate", "unused.mov")
+    lane.tracker = Tracker.PlateTracker(PlateConsensus.PlateConsensus)
+    return lane
+
+
+def plate_crop(seed = 0):
+    return np.random.RandomState(seed).randint(0, 256, (120, 160, 3)).astype(np.uint8)
+
+
+def test_standing_vehicle_converges_with_the_cache():
+    lane = make_lane()
+    pool = CountingPool()
+    publisher = RecordingPublisher()
+    plate_queue = PlateSystem.Pipeline.StageQueue("plates", 10)
+    ocr_cache = OcrCache.OcrCache()
+    img_crop = plate_crop()
+
+    # a vehicle waiting at the barrier, the same crop on every frame
+    for frame_index in range(200):
+        track, = lane.tracker.update([(0, 0, 100, 50)], frame_index)
+        job = lane.tracker.offer_crop(track, img_crop, frame_index, 0.0)
+        if job is None:
+            continue
+
+        for item in PlateSystem.recognize_plate(pool, ocr_cache, (lane, track, job)) or ():
+            PlateSystem.publish_plate(publisher, plate_queue, item)
+
+    assert publisher.plates == ["59F12545"]
+    assert track.converged and track.ocr_attempts == PlateConsensus.MIN_READINGS
+    assert pool.calls == 1                                              # the repeat came from the cache
+
+
+def test_readings_of_other_tracks_are_not_reused():
+    lane = make_lane()
+    pool = CountingPool()
+    ocr_cache = OcrCache.OcrCache()
+    img_crop = plate_crop()
+
+    first_track, second_track = lane.tracker.update([(0, 0, 100, 50), (500, 0, 600, 50)], 0)
+    for track in (first_track, second_track, first_track):
+        track.ocr_in_flight = True
+        items = PlateSystem.recognize_plate(pool, ocr_cache, (lane, track, (img_crop, 0.0)))
+
+        assert not track.ocr_in_flight
+        assert len(items) == 1
+
+    assert pool.calls == 2 and ocr_cache.hits == 1
+
@@ -0,0 +1,32 @@
+import os
+import numpy as np
+import pytest
+
+import ocr_pool as OcrPool
+
+
+def crop_mean(img):
+    return float(img.mean())
+
+
+def crash(img):
+    os._exit(1)                                                         # like a segfault in cv2 or the OOM killer
+
+
+def test_crop_is_read_through_shared_memory():
+    pool = OcrPool.OcrPool(2, start_method = "fork")
+
+    assert pool.apply(crop_mean, np.full((40, 80, 3), 7, dtype = np.uint8)) == 7.0
+    pool.close()
+
+
+def test_lost_job_raises_and_the_workers_are_replaced():
+    pool = OcrPool.OcrPool(1, start_method = "fork", timeout = 2.0)
+    broken_pool = pool.pool
+
+    with pytest.raises(RuntimeError, match = "OCR workers were restarted"):
+        pool.apply(crash, np.zeros((40, 80, 3), dtype = np.uint8))
+
+    assert pool.pool is not broken_pool
+    assert pool.apply(crop_mean, np.full((40, 80, 3), 3, dtype = np.uint8)) == 3.0
+    pool.close()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pipeline as Pipeline
+
+
+def drain(stage_queue):
+    # every item left in a closed queue
+    list_of_items = []
+    while True:
+        item = stage_queue.get(timeout = 0)
+        if item is Pipeline.STOP:
+            return list_of_items
+        if item is not None:
+            list_of_items.append(item)
+# end function
+
+
+def wait_for(condition, timeout = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_full_queue_drops_its_oldest_item():
+    list_of_dropped = []
+    stage_queue = Pipeline.StageQueue("frames", 2, Pipeline.DROP_OLDEST, on_drop = list_of_dropped.append)
+
+    for i in range(5):
+        assert stage_queue.put(i)
+    stage_queue.close()
+
+    assert list_of_dropped == [0, 1, 2]
+    assert drain(stage_queue) == [3, 4]
+    assert stage_queue.stats()["dropped"] == 3 and stage_queue.stats()["put"] == 5
+
+
+def test_blocked_put_is_discarded_when_the_queue_closes():
+    list_of_dropped = []
+    stage_queue = Pipeline.StageQueue("batches", 1, Pipeline.BLOCK, on_drop = list_of_dropped.append)
+    stage_queue.put("first")
+
+    list_of_returns = []
+    thread = threading.Thread(target = lambda: list_of_returns.append(stage_queue.put("second")))
+    thread.start()
+    time.sleep(2 * Pipeline.POLL_INTERVAL)
+    assert thread.is_alive()                                            # waiting for room
+
+    stage_queue.close()
+    thread.join(5)
+
+    assert list_of_returns == [False] and list_of_dropped == ["second"]
+    assert drain(stage_queue) == ["first"]
+
+
+def test_last_worker_closes_the_output():
+    slow_item_done = threading.Event()
+
+    def func(item):
+        if item == "slow":
+            slow_item_done.wait(5)
+        return (item,)
+
+    input = Pipeline.StageQueue("input", 10)
+    output = Pipeline.StageQueue("output", 10)
+    stage = Pipeline.Stage("work", func, input = input, output = output, workers = 2)
+
+    input.put("slow")
+    stage.start()
+    assert wait_for(lambda: input.depth() == 0)
+    input.close()
+
+    assert wait_for(lambda: stage.running_workers == 1)                 # the idle worker saw the input end
+    assert not output.closed.is_set()
+
+    slow_item_done.set()
+    stage.join(5)
+
+    assert output.closed.is_set()
+    assert drain(output) == ["slow"]
+
+
+def test_source_item_cut_off_by_stop_is_handed_back():
+    list_of_dropped = []
+    stop_event = threading.Event()
+
+    def source():
+        yield 1
+        stop_event.set()
+        yield 2
+        yield 3
+
+    output = Pipeline.StageQueue("frames", 10, on_drop = list_of_dropped.append)
+    stage = Pipeline.Stage("decode", source, output = output)
+    stage.start(stop_event)
+    stage.join(5)
+
+    assert list_of_dropped == [2]
+    assert drain(output) == [1]
+
+
+def test_failing_item_is_counted_and_skipped():
+    input = Pipeline.StageQueue("input", 10)
+    output = Pipeline.StageQueue("output", 10)
+    stage = Pipeline.Stage("work", lambda item: (10 // item,), input = input, output = output)
+
+    for item in (1, 0, 2):
+        input.put(item)
+    input.close()
+    stage.start()
+    stage.join(5)
+
+    assert drain(output) == [10, 5]
+    assert stage.stats()["errors"] == 1 and stage.stats()["processed"] == 3
@@ -0,0 +1,68 @@
+import pytest
+
+import plate_consensus as PlateConsensus
+
+# define constant
+CLEAR = [0.0] * 8                                                       # every char right on a training glyph
+DOUBTFUL_LAST_CHAR = [0.0] * 7 + [3 * PlateConsensus.DISTANCE_SCALE]    # the last char far from any
+
+
+def add_readings(voter, list_of_readings):
+    # add (plate number, char distances) readings in turn, return what the last one returned
+    accepted = None
+    for license_plate_number, list_of_char_distances in list_of_readings:
+        accepted = voter.add(license_plate_number, list_of_char_distances, timestamp = 0.0)
+    return accepted
+# end function
+
+
+def test_single_reading_is_never_accepted():
+    voter = PlateConsensus.PlateConsensus()
+
+    assert PlateConsensus.MIN_READINGS == 2
+    assert voter.add("59F12545", CLEAR) is None
+    assert voter.add("59F12545", CLEAR) == "59F12545"
+
+
+def test_tied_char_is_not_accepted_until_it_has_a_clear_lead():
+    voter = PlateConsensus.PlateConsensus()
+
+    assert add_readings(voter, [("59F12545", CLEAR), ("59F12546", CLEAR)]) is None    # 5 and 6 tie
+    assert add_readings(voter, [("59F12545", CLEAR)]) is None                         # 2 against 1 is too close
+    assert add_readings(voter, [("59F12545", CLEAR)]) == "59F12545"
+    assert len(voter.readings) == 0                                                   # a new vote starts afresh
+
+
+def test_low_confidence_outlier_does_not_hold_up_the_vote():
+    voter = PlateConsensus.PlateConsensus()
+
+    assert add_readings(voter, [("59F12546", DOUBTFUL_LAST_CHAR), ("59F12545", CLEAR)]) is None
+    assert add_readings(voter, [("59F12545", CLEAR)]) == "59F12545"
+
+    # the same outlier read with full confidence needs another reading to be outvoted
+    voter = PlateConsensus.PlateConsensus()
+    assert add_readings(voter, [("59F12546", CLEAR), ("59F12545", CLEAR), ("59F12545", CLEAR)]) is None
+    assert add_readings(voter, [("59F12545", CLEAR)]) == "59F12545"
+
+
+def test_reading_with_a_missing_char_is_aligned_to_the_leader():
+    voter = PlateConsensus.PlateConsensus()
+
+    # the 2 was not found, the digits after it line up with the leader's last three
+    assert add_readings(voter, [("59F1545", [0.0] * 7), ("59F12545", CLEAR), ("59F12545", CLEAR)]) is None
+    length, length_votes, position_votes = voter.votes()
+
+    assert length == 8 and length_votes == {8: pytest.approx(2.0), 7: pytest.approx(1.0)}
+    assert position_votes[4] == {"2": pytest.approx(2.0)}
+    assert [position_votes[position][char] for position, char in ((5, "5"), (6, "4"), (7, "5"))] == \
+        [pytest.approx(3.0)] * 3
+
+    assert add_readings(voter, [("59F12545", CLEAR)]) == "59F12545"     # the length is clear once 3 to 1
+
+
+def test_old_readings_stop_counting():
+    voter = PlateConsensus.PlateConsensus()
+
+    assert voter.add("59F12545", CLEAR, timestamp = 0.0) is None
+    assert voter.add("59F12545", CLEAR, timestamp = PlateConsensus.READING_TTL + 1.0) is None
+    assert len(voter.readings) == 1
@@ -0,0 +1,56 @@
+import numpy as np
+import cv2
+
+import possible_character as PossibleCharacter
+import synthetic_plates as SyntheticPlates
+
+
+def plate_contours():
+    # every contour of a thresholded synthetic plate, the chars among them
+    image = SyntheticPlates.render_plate("59F1", "25451", distractors = 6, rng = np.random.RandomState(1))
+    imgThresh = cv2.adaptiveThreshold(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                      cv2.THRESH_BINARY_INV, 19, 9)
+    contours, hierarchy = cv2.findContours(imgThresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return list(contours)
+# end function
+
+
+def edge_case_contours():
+    return [np.array([[[5, 7]]], dtype = np.int32),                                # a single point
+            np.array([[[3, 4]], [[12, 4]]], dtype = np.int32),                      # a horizontal line
+            np.array([[[8, 2]], [[8, 20]], [[8, 9]]], dtype = np.int32),            # a vertical line
+            np.array([[[40, 30]], [[10, 50]], [[25, 5]], [[60, 45]]], dtype = np.int32)]
+# end function
+
+
+def test_bounding_rects_match_cv2_per_contour():
+    contours = edge_case_contours() + plate_contours() + edge_case_contours()[:1]
+
+    possible_chars = PossibleCharacter.PossibleCharacterSet.from_contours(contours)
+
+    assert len(possible_chars) == len(contours)
+    for i, contour in enumerate(contours):
+        assert (possible_chars.boundingRectX[i], possible_chars.boundingRectY[i],
+                possible_chars.boundingRectWidth[i], possible_chars.boundingRectHeight[i]) == cv2.boundingRect(contour)
+# end function
+
+
+def test_set_gives_the_same_chars_as_one_by_one():
+    contours = plate_contours() + edge_case_contours()
+
+    list_of_possible_chars = PossibleCharacter.PossibleCharacterSet.from_contours(contours).to_list()
+
+    for possible_char, contour in zip(list_of_possible_chars, contours):
+        expected_char = PossibleCharacter.PossibleCharacter(contour)
+        assert possible_char.contour is contour
+        for name in PossibleCharacter.PossibleCharacter.__slots__[1:]:
+            assert getattr(possible_char, name) == getattr(expected_char, name), name
+# end function
+
+
+def test_set_of_no_contours_is_empty():
+    possible_chars = PossibleCharacter.PossibleCharacterSet.from_contours([])
+
+    assert len(possible_chars) == 0
+    assert possible_chars.to_list() == []
+# end function
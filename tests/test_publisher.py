@@ -0,0 +1,245 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+import numpy as np
+import pytest
+
+import lanes as Lanes
+import plate_consensus as PlateConsensus
+import plate_system as PlateSystem
+import publisher as Publisher
+import tracker as Tracker
+
+
+class StubServer:
+    '''
+        a local stand-in for the check-in/out server. it answers with the
+        status codes in "responses" in turn (200 once they run out) and
+        records every request it got
+    '''
+
+    def __init__(self, responses = ()):
+        self.responses = list(responses)
+        self.requests = []
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def handle_request(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.lock:
+                    stub.requests.append((self.command, self.path, self.headers.get("Idempotency-Key"), body))
+                    status = stub.responses.pop(0) if stub.responses else 200
+
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_POST = handle_request
+            do_PATCH = handle_request
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+    # end constructor
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# end class
+
+
+@pytest.fixture(autouse = True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(Publisher, "RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(Publisher, "REQUEST_TIMEOUT", 2.0)
+    monkeypatch.setattr(Publisher, "MAX_ATTEMPTS", 5)
+
+
+def wait_for(condition, timeout = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def outbox_events(outbox_dir):
+    return [name for name in os.listdir(outbox_dir) if name != Publisher.FAILED_DIR]
+
+
+def make_publisher(server_url, outbox_dir, on_response = None):
+    return Publisher.Publisher(server_url + "/check-in", server_url + "/check-out", outbox_dir, on_response)
+
+
+def test_failed_sends_are_retried_with_the_same_key(tmp_path):
+    server = StubServer([503, 503, 429])
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+
+    publisher.check_in("59F12545", np.zeros((40, 80, 3), dtype = np.uint8))
+
+    assert wait_for(lambda: len(server.requests) == 4 and outbox_events(str(tmp_path)) == [])
+    assert len(set(key for method, path, key, body in server.requests)) == 1       # one event, four attempts
+    assert server.requests[0][0] == "POST" and server.requests[0][1] == "/check-in"
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_outbox_is_replayed_after_a_restart(tmp_path):
+    server = StubServer()
+    server.close()                                                      # nothing listens on the port any more
+
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+    publisher.check_in("59F12545", np.zeros((40, 80, 3), dtype = np.uint8))
+    publisher.check_out("30A11111")
+    publisher.stop(timeout = 5)
+
+    assert len(outbox_events(str(tmp_path))) == 2
+
+    server = StubServer()
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+
+    assert wait_for(lambda: outbox_events(str(tmp_path)) == [])
+    assert [(method, path) for method, path, key, body in server.requests] == [("POST", "/check-in"),
+                                                                                ("PATCH", "/check-out")]
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_rejected_event_is_kept_aside(tmp_path):
+    server = StubServer([422])
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+    publisher.check_out("59F12545")
+
+    assert wait_for(lambda: len(os.listdir(os.path.join(str(tmp_path), Publisher.FAILED_DIR))) == 1)
+    assert outbox_events(str(tmp_path)) == []
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_errors_outside_the_request_do_not_stop_the_publisher(tmp_path, monkeypatch):
+    monkeypatch.setattr(Publisher, "MAX_ATTEMPTS", 1000)                # the photo is only gone for a moment
+    server = StubServer()
+    responses = []
+
+    def on_response(event, r):
+        responses.append(event["plateNumber"])
+        raise RuntimeError("broken callback")
+
+    publisher = make_publisher(server.url, str(tmp_path), on_response)
+
+    # a photo that cannot be read is retried, and does not kill the thread
+    event_id = publisher.add_event("check-in", "59F12545", {"platePhoto": np.zeros((40, 80, 3), dtype = np.uint8)})
+    photo_path = os.path.join(str(tmp_path), event_id, "platePhoto.jpg")
+    os.rename(photo_path, photo_path + ".away")
+    publisher.start()
+
+    time.sleep(0.2)
+    assert server.requests == [] and publisher.thread.is_alive()
+    os.rename(photo_path + ".away", photo_path)
+
+    assert wait_for(lambda: responses == ["59F12545"])
+
+    publisher.check_out("30A11111")                                     # still draining after the callback raised
+    assert wait_for(lambda: responses == ["59F12545", "30A11111"] and outbox_events(str(tmp_path)) == [])
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_same_plate_is_published_once_per_lane(tmp_path):
+    server = StubServer()
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+
+    lane = Lanes.Lane("gate", "unused.mov")
+    lane.tracker = Tracker.PlateTracker(PlateConsensus.PlateConsensus)
+    plate_queue = PlateSystem.Pipeline.StageQueue("plates", 10)
+
+    img_plate = np.zeros((40, 80, 3), dtype = np.uint8)
+    list_of_char_distances = [0.0] * 8
+
+    # the same vehicle read on two tracks (lost and found again), then another vehicle
+    for plate_number, box in (("59F12545", (0, 0, 100, 50)), ("59F12545", (500, 0, 600, 50)),
+                              ("30A11111", (0, 300, 100, 350))):
+        track, = lane.tracker.update([box], 0)
+        for i in range(PlateConsensus.MIN_READINGS):
+            PlateSystem.publish_plate(publisher, plate_queue,
+                                      (lane, track, (plate_number, img_plate, list_of_char_distances, time.time())))
+
+    assert wait_for(lambda: len(server.requests) == 2 and outbox_events(str(tmp_path)) == [])
+    assert [b"59F12545" in body for method, path, key, body in server.requests] == [True, False]
+    assert [b"30A11111" in body for method, path, key, body in server.requests] == [False, True]
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_event_that_keeps_failing_is_set_aside(tmp_path):
+    server = StubServer([500] * Publisher.MAX_ATTEMPTS)                # the first event fails on every attempt
+    publisher = make_publisher(server.url, str(tmp_path))
+
+    # a photo gone for good and a server error that does not clear, each would hold up everything behind it
+    event_id = publisher.add_event("check-in", "59F12545", {"platePhoto": np.zeros((40, 80, 3), dtype = np.uint8)})
+    os.remove(os.path.join(str(tmp_path), event_id, "platePhoto.jpg"))
+    publisher.check_out("30A11111")
+    publisher.check_out("51G22222")
+    publisher.start()
+
+    failed_dir = os.path.join(str(tmp_path), Publisher.FAILED_DIR)
+    assert wait_for(lambda: outbox_events(str(tmp_path)) == [] and len(os.listdir(failed_dir)) == 2)
+    assert sorted(os.listdir(failed_dir))[0] == event_id
+
+    list_of_bodies = [body for method, path, key, body in server.requests]
+    assert len(list_of_bodies) == Publisher.MAX_ATTEMPTS + 1
+    assert b"30A11111" in list_of_bodies[0] and b"51G22222" in list_of_bodies[-1]
+
+    publisher.stop(timeout = 5)
+    server.close()
+
+
+def test_unreachable_server_is_waited_for(tmp_path):
+    server = StubServer()
+    server.close()
+
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+    publisher.check_out("59F12545")
+
+    time.sleep(1.0)                                                     # far more than MAX_ATTEMPTS retries
+    assert len(outbox_events(str(tmp_path))) == 1
+    assert os.listdir(os.path.join(str(tmp_path), Publisher.FAILED_DIR)) == []
+
+    publisher.stop(timeout = 5)
+
+
+def test_unreadable_event_is_set_aside(tmp_path):
+    event_dir = os.path.join(str(tmp_path), "1-broken")
+    os.makedirs(event_dir)
+    with open(os.path.join(event_dir, Publisher.EVENT_FILE), "w") as f:
+        f.write("{not json")
+
+    server = StubServer()
+    publisher = make_publisher(server.url, str(tmp_path))
+    publisher.start()
+
+    assert wait_for(lambda: os.listdir(os.path.join(str(tmp_path), Publisher.FAILED_DIR)) == ["1-broken"])
+    assert server.requests == []
+
+    publisher.stop(timeout = 5)
+    server.close()
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+import http.client
+import json
+import os
+import socket
+import threading
+import numpy as np
+import cv2
+import pytest
+
+import recognize_daemon as RecognizeDaemon
+
+
+class BoxDetector:
+    '''
+        finds one confident plate in the middle of every image, and records
+        the size of every batch it was given
+    '''
+
+    def __init__(self, fail = False):
+        self.fail = fail
+        self.batch_sizes = []
+
+    def predict_batch(self, frames):
+        self.batch_sizes.append(len(frames))
+        if self.fail:
+            raise RuntimeError("detector failed")
+
+        return [[{"label": "plate", "confidence": 0.9, "topleft": {"x": 40, "y": 30},
+                  "bottomright": {"x": 200, "y": 150}}] for frame in frames]
+
+# end class
+
+
+class PlatePool:
+
+    def apply(self, func, img_plate):
+        return ("59F12545", None, [0.0] * 8), None
+
+# end class
+
+
+def encoded_image():
+    ret, npaJpeg = cv2.imencode(".jpg", np.full((240, 320, 3), 128, dtype = np.uint8))
+    return npaJpeg.tobytes()
+
+
+@pytest.fixture
+def daemon():
+    # a daemon on a free local port, its detector and a function that posts a body and returns (status, json)
+    detector = BoxDetector()
+    handler = type("Handler", (RecognizeDaemon.RecognizeHandler,), {
+        "batcher": RecognizeDaemon.DetectionBatcher(detector, window = 0.2),
+        "pool": PlatePool()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    def post(body, path = "/recognize"):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout = 10)
+        connection.request("POST", path, body)
+        response = connection.getresponse()
+        status, data = response.status, response.read()
+        connection.close()
+        return status, json.loads(data) if data and status != 404 else None
+
+    yield detector, handler, post
+
+    server.shutdown()
+    server.server_close()
+# end function
+
+
+def test_recognize_returns_plates_and_timings(daemon):
+    detector, handler, post = daemon
+
+    status, response = post(encoded_image())
+
+    assert status == 200
+    assert [plate["plate"] for plate in response["plates"]] == ["59F12545"]
+    assert response["plates"][0]["box"] == {"topleft": {"x": 40, "y": 30}, "bottomright": {"x": 200, "y": 150}}
+    assert set(response["timings"]) == {"detect_ms", "ocr_ms", "total_ms", "request_ms"}
+
+
+def test_requests_arriving_together_share_a_batch(daemon):
+    detector, handler, post = daemon
+
+    with ThreadPoolExecutor(4) as executor:
+        list_of_responses = list(executor.map(lambda i: post(encoded_image()), range(4)))
+
+    assert [status for status, response in list_of_responses] == [200] * 4
+    assert sum(detector.batch_sizes) == 4 and max(detector.batch_sizes) > 1
+    assert max(response["batch_size"] for status, response in list_of_responses) == max(detector.batch_sizes)
+
+
+def test_bad_requests_are_refused(daemon):
+    detector, handler, post = daemon
+
+    assert post(b"not an image")[0] == 400
+    assert post(b"")[0] == 400
+    assert post(encoded_image(), "/elsewhere")[0] == 404
+    assert detector.batch_sizes == []
+
+
+def test_detector_error_is_a_server_error(daemon):
+    detector, handler, post = daemon
+    detector.fail = True
+
+    status, response = post(encoded_image())
+    assert status == 500 and "detector failed" in response["error"]
+
+
+def test_unix_socket_server(tmp_path):
+    path = str(tmp_path / "plates.sock")
+    handler = type("Handler", (RecognizeDaemon.RecognizeHandler,), {
+        "batcher": RecognizeDaemon.DetectionBatcher(BoxDetector()),
+        "pool": PlatePool()
+    })
+    server = RecognizeDaemon.ThreadingUnixHTTPServer(path, handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    body = encoded_image()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.sendall(b"POST /recognize HTTP/1.0\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+    data = b""
+    while True:
+        chunk = client.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    client.close()
+
+    headers, response = data.split(b"\r\n\r\n", 1)
+    assert headers.startswith(b"HTTP/1.0 200")
+    assert json.loads(response)["plates"][0]["plate"] == "59F12545"
+
+    server.shutdown()
+    server.server_close()
+    os.remove(path)
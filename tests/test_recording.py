@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import recording as Recording
+import synthetic_plates as SyntheticPlates
+
+
+def detector_result(confidence, left, top, right, bottom):
+    return {"label": "plate", "confidence": confidence,
+            "topleft": {"x": left, "y": top}, "bottomright": {"x": right, "y": bottom}}
+
+
+def write_recording(path, encoding, list_of_crops):
+    recorder = Recording.Recorder(path, encoding)
+    for i, crop in enumerate(list_of_crops):
+        recorder.write("gate-%d" % (i % 2), 10 * i, 1000.0 + i, detector_result(0.5 + 0.1 * i, i, 2 * i, 100 + i, 50 + i),
+                       crop)
+    recorder.close()
+# end function
+
+
+@pytest.mark.parametrize("encoding", Recording.ENCODINGS)
+def test_records_are_read_back_as_written(tmp_path, encoding):
+    path = str(tmp_path / "capture.plrec")
+    rng = np.random.RandomState(0)
+    list_of_crops = [rng.randint(0, 256, (30, 40, 3)).astype(np.uint8), None,
+                     rng.randint(0, 256, (25, 35)).astype(np.uint8)]
+
+    write_recording(path, encoding, list_of_crops)
+    recording = Recording.Recording(path)
+    list_of_records = list(recording)
+
+    assert len(list_of_records) == 3 and not recording.truncated
+    for i, (record, crop) in enumerate(zip(list_of_records, list_of_crops)):
+        assert record["lane"] == "gate-%d" % (i % 2)
+        assert record["frame"] == 10 * i and record["timestamp"] == 1000.0 + i
+        assert record["confidence"] == pytest.approx(0.5 + 0.1 * i)
+        assert record["topleft"] == {"x": i, "y": 2 * i} and record["bottomright"] == {"x": 100 + i, "y": 50 + i}
+        if crop is None:
+            assert record["crop"] is None
+        else:
+            np.testing.assert_array_equal(record["crop"], crop)
+
+
+def test_recording_is_appended_to_and_read_up_to_a_partial_record(tmp_path):
+    path = str(tmp_path / "capture.plrec")
+    crop = np.full((30, 40, 3), 9, dtype = np.uint8)
+
+    write_recording(path, "raw", [crop])
+    write_recording(path, "png", [crop, crop])                         # a second run appends
+    with open(path, "ab") as f:
+        f.write(Recording.RECORD_HEADER.pack(Recording.RECORD_MAGIC, 4, 0, 0.0, 0.9, 0, 0, 1, 1, 30, 40, 3, 0, 3600))
+        f.write(b"gate" + b"\0" * 100)                                 # cut short by a crash
+
+    recording = Recording.Recording(path)
+    assert len(list(recording)) == 3 and recording.truncated
+
+
+def test_other_files_are_refused(tmp_path):
+    path = str(tmp_path / "not-a-recording.plrec")
+    with open(path, "wb") as f:
+        f.write(b"PNG and more bytes")
+
+    with pytest.raises(ValueError, match = "not a plate recording"):
+        Recording.Recording(path)
+    with pytest.raises(ValueError, match = "not a plate recording"):
+        Recording.Recorder(path)
+
+
+def test_replay_reads_the_recorded_crops(tmp_path):
+    path = str(tmp_path / "capture.plrec")
+    list_of_plates = list(SyntheticPlates.generate_plates(3, seed = 1))
+    write_recording(path, "png", [image for plate_number, image in list_of_plates] + [None])
+
+    report = Recording.replay(path, repeat = 2)
+
+    assert report["records"] == 4 and report["crops"] == 3 and not report["truncated"]
+    assert report["p50_ms"] > 0 and report["crops_per_sec"] > 0
+    assert report["readings_digest"] == Recording.replay(path)["readings_digest"]     # the same crops read the same
@@ -0,0 +1,42 @@
+import numpy as np
+
+import pipeline as Pipeline
+import plate_consensus as PlateConsensus
+import tracker as Tracker
+
+
+def crop(seed):
+    return np.random.RandomState(seed).randint(0, 256, (40, 80), dtype = np.uint8)
+
+
+def test_dropped_ocr_job_releases_its_track():
+    tracker = Tracker.PlateTracker(PlateConsensus.PlateConsensus)
+    crop_queue = Pipeline.StageQueue("crops", 1, Pipeline.DROP_OLDEST,
+                                     on_drop = lambda item: tracker.ocr_finished(item[0]))
+
+    first, second = tracker.update([(0, 0, 100, 50), (300, 0, 400, 50)], 0)
+    crop_queue.put((first, tracker.offer_crop(first, crop(0), 0, 0.0)))
+    crop_queue.put((second, tracker.offer_crop(second, crop(1), 0, 0.0)))      # evicts the first job
+
+    assert crop_queue.stats()["dropped"] == 1
+    assert not first.ocr_in_flight
+    assert second.ocr_in_flight
+
+    # the released track is read again once it is due
+    job = tracker.offer_crop(first, crop(2), Tracker.MIN_FRAMES_BETWEEN_OCR, 1.0)
+    assert job is not None and job[1] == 1.0
+
+
+def test_released_track_expires():
+    tracker = Tracker.PlateTracker(PlateConsensus.PlateConsensus)
+    crop_queue = Pipeline.StageQueue("crops", 1, Pipeline.DROP_OLDEST,
+                                     on_drop = lambda item: tracker.ocr_finished(item[0]))
+
+    track, = tracker.update([(0, 0, 100, 50)], 0)
+    crop_queue.put((track, tracker.offer_crop(track, crop(0), 0)))
+    crop_queue.put((track, None))
+
+    for frame_index in range(1, Tracker.MAX_MISSED_FRAMES + 2):
+        tracker.update([], frame_index)
+
+    assert tracker.active_tracks() == []
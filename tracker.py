@@ -0,0 +1,182 @@
+import threading
+import numpy as np
+import cv2
+
+# define constant
+MIN_IOU = 0.3                       # boxes overlapping a track this much continue it
+MAX_CENTER_DISTANCE = 0.5           # or whose centers are this close, as a fraction of the track box diagonal
+MAX_MISSED_FRAMES = 10              # frames a track survives without a matching box
+
+MIN_FRAMES_BETWEEN_OCR = 5          # frames between two OCR attempts of one track
+MAX_OCR_ATTEMPTS = 15               # give up on a track that has not converged after this many reads
+
+
+class Track:
+
+    def __init__(self, track_id, box, frame_index):
+        self.id = track_id
+        self.box = box
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.missed = 0
+
+        self.best_crop = None               # sharpest crop since the last OCR attempt
+        self.best_score = -1.0
+        self.best_crop_time = None          # when the frame of the best crop was decoded
+        self.ocr_in_flight = False
+        self.last_ocr_frame = None
+        self.ocr_attempts = 0
+
+        self.voter = None
+        self.converged = False
+        self.plate_number = None
+    # end constructor
+
+# end class
+
+
+def box_from_result(result):
+    return (result['topleft']['x'], result['topleft']['y'], result['bottomright']['x'], result['bottomright']['y'])
+
+
+def iou(first_box, second_box):
+    x1 = max(first_box[0], second_box[0])
+    y1 = max(first_box[1], second_box[1])
+    x2 = min(first_box[2], second_box[2])
+    y2 = min(first_box[3], second_box[3])
+
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = ((first_box[2] - first_box[0]) * (first_box[3] - first_box[1])
+             + (second_box[2] - second_box[0]) * (second_box[3] - second_box[1]) - intersection)
+
+    return intersection / float(union) if union > 0 else 0.0
+# end function
+
+
+def center_distance(first_box, second_box):
+    # distance between the box centers relative to the diagonal of the first box
+    dx = (first_box[0] + first_box[2] - second_box[0] - second_box[2]) / 2.0
+    dy = (first_box[1] + first_box[3] - second_box[1] - second_box[3]) / 2.0
+    diagonal = np.hypot(first_box[2] - first_box[0], first_box[3] - first_box[1])
+
+    return np.hypot(dx, dy) / diagonal if diagonal > 0 else float("inf")
+# end function
+
+
+def crop_sharpness(crop):
+    # variance of the laplacian, higher for sharper crops
+    img_grayscale = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return cv2.Laplacian(img_grayscale, cv2.CV_64F).var()
+
+
+class PlateTracker:
+    '''
+        links detector boxes across frames by IoU, falling back to center
+        distance, so every plate gets a track id. each track keeps its
+        sharpest crop and hands out at most one OCR job at a time until its
+        reading converges
+    '''
+
+    def __init__(self, voter_factory):
+        self.voter_factory = voter_factory
+        self.tracks = []
+        self.next_id = 1
+        self.lock = threading.Lock()
+    # end constructor
+
+    def update(self, list_of_boxes, frame_index):
+        # match this frame's boxes to tracks and return the track of every box
+        with self.lock:
+            list_of_pairs = []
+            for t, track in enumerate(self.tracks):
+                for b, box in enumerate(list_of_boxes):
+                    overlap = iou(track.box, box)
+                    if overlap >= MIN_IOU:
+                        list_of_pairs.append((1.0 + overlap, t, b))
+                    else:
+                        distance = center_distance(track.box, box)
+                        if distance <= MAX_CENTER_DISTANCE:
+                            list_of_pairs.append((1.0 - distance, t, b))
+
+            # greedy matching, best pairs first
+            list_of_pairs.sort(reverse = True)
+            box_tracks = [None] * len(list_of_boxes)
+            matched_tracks = set()
+
+            for score, t, b in list_of_pairs:
+                if t in matched_tracks or box_tracks[b] is not None:
+                    continue
+                matched_tracks.add(t)
+                box_tracks[b] = self.tracks[t]
+
+            for b, box in enumerate(list_of_boxes):
+                track = box_tracks[b]
+                if track is None:
+                    track = Track(self.next_id, box, frame_index)
+                    track.voter = self.voter_factory()
+                    self.next_id += 1
+                    self.tracks.append(track)
+                    box_tracks[b] = track
+
+                track.box = box
+                track.last_frame = frame_index
+                track.missed = 0
+
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks and track.last_frame != frame_index:
+                    track.missed += 1
+
+            self.tracks = [track for track in self.tracks
+                           if track.missed <= MAX_MISSED_FRAMES or track.ocr_in_flight]
+
+            return box_tracks
+    # end function
+
+    def offer_crop(self, track, crop, frame_index, timestamp = None):
+        '''
+            keep the crop if it is the sharpest since the track's last OCR
+            attempt, and return it with the time its frame was decoded as an
+            OCR job if the track is due one
+        '''
+        if track.converged or track.ocr_attempts >= MAX_OCR_ATTEMPTS:
+            return None
+
+        score = crop_sharpness(crop)
+
+        with self.lock:
+            if score > track.best_score:
+                track.best_crop = crop
+                track.best_score = score
+                track.best_crop_time = timestamp
+
+            if track.ocr_in_flight:
+                return None
+            if track.last_ocr_frame is not None and frame_index - track.last_ocr_frame < MIN_FRAMES_BETWEEN_OCR:
+                return None
+
+            job = (track.best_crop, track.best_crop_time)
+            track.best_crop = None
+            track.best_score = -1.0
+            track.ocr_in_flight = True
+            track.last_ocr_frame = frame_index
+            track.ocr_attempts += 1
+
+            return job
+    # end function
+
+    def ocr_finished(self, track):
+        with self.lock:
+            track.ocr_in_flight = False
+
+    def converge(self, track, plate_number):
+        with self.lock:
+            track.converged = True
+            track.plate_number = plate_number
+            track.best_crop = None
+    # end function
+
+    def active_tracks(self):
+        with self.lock:
+            return list(self.tracks)
+
+# end class